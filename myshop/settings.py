@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 
 
@@ -19,6 +20,9 @@ import dj_database_url
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# manage.py test
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -80,14 +84,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise с поддержкой async: под ASGI не переводит цепочку middleware в поток
+    'products.middleware.AsyncWhiteNoiseMiddleware',
+    'products.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'myshop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для products.metrics
+        'BACKEND': 'products.metrics.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -119,6 +126,32 @@ DATABASES = {
     }
 }
 
+# Покрывающие индексы (Index.include) есть только в PostgreSQL; на SQLite при
+# разработке индекс просто создается без include, предупреждение не нужно
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+
+# Общий кэш: версии каталога и корзины (products.cache) и отметки фоновых задач должны
+# быть видны всем процессам, поэтому бэкенд задается окружением, как и база:
+# CACHE_BACKEND — класс (по умолчанию Redis; Memcached —
+# django.core.cache.backends.memcached.PyMemcacheCache, таблица в базе —
+# django.core.cache.backends.db.DatabaseCache после manage.py createcachetable),
+# CACHE_LOCATION — адрес сервера или имя таблицы. Кэш в памяти процесса — только в тестах
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'myshop',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+            'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'myshop'),
+        }
+    }
 
 
 # Internationalization
@@ -154,6 +187,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 CART_SESSION_ID = 'cart'
+CART_SUMMARY_SESSION_ID = 'cart_summary'
+# Хранилище корзины: 'products.cart.SessionCart' или 'products.cart.DatabaseCart'
+CART_BACKEND = 'products.cart.DatabaseCart'
+
+# Превышение бюджета SQL-запросов представления (products.settings.QUERY_BUDGETS):
+# True — ошибка запроса (все тесты, CI), False — предупреждение в лог products.metrics
+QUERY_BUDGET_STRICT = TESTING or os.getenv('QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
 
 DECIMAL_SEPARATOR = '.'
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Регистрирует сигналы: поисковый индекс, кэш каталога, копии изображений
+        from . import cache, images, search  # noqa: F401
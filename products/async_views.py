@@ -0,0 +1,116 @@
+"""
+Async-варианты представлений чтения каталога. Работают рядом с синхронными
+(те же данные и ключи кэша, маршруты с префиксом async/) и под ASGI не
+занимают поток на время запроса: чтение идет через async ORM
+(aget/afirst/ain_bulk/async for) и TieredCache.aget_or_set.
+
+В Django 4.2 в поток по-прежнему уходят рендеринг шаблона (контекст-процессоры
+читают сессию и корзину), request.user и сам поиск (products.search).
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import render
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import catalog_cache, product_dependencies
+from .facets import apply_filters, category_tree, parse_filters
+from .fastjson import FastJsonResponse
+from .models import Category, Product
+from .pagination import InvalidCursor, KeysetPagination, KeysetPaginator
+from .search import search_products
+from .serializers import CATEGORY_ROW, FEATURED_PRODUCT_ROW, PRODUCT_ROW
+from .settings import FEATURED_PRODUCTS_COUNT
+
+
+def require_GET(view):
+    """require_GET для корутин: декораторы django.views.decorators.http в Django 4.2 только синхронные."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@require_GET
+async def api_categories_list(request):
+    async def load():
+        return CATEGORY_ROW.render([row async for row in CATEGORY_ROW.rows(Category.objects.all())])
+
+    data = await catalog_cache.aget_or_set('api_categories', load, dependencies=('category',))
+    return FastJsonResponse(data)
+
+
+@require_GET
+async def api_featured_products(request):
+    async def load():
+        rows = FEATURED_PRODUCT_ROW.rows(Product.objects.filter(featured=True))[:FEATURED_PRODUCTS_COUNT]
+        return FEATURED_PRODUCT_ROW.render([row async for row in rows])
+
+    data = await catalog_cache.aget_or_set('api_featured_products', load, dependencies=('product',))
+    return FastJsonResponse(data)
+
+
+async def product_detail_view(request, id):
+    async def load():
+        return await Product.objects.select_related('category').filter(id=id).afirst()
+
+    product = await catalog_cache.aget_or_set('product_detail', load, {'id': id},
+                                              dependencies=product_dependencies(id))
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    return await sync_to_async(render)(request, 'products/product_page.html', {'product': product})
+
+
+async def search_view(request):
+    query = request.GET.get('q')
+    product_ids = await sync_to_async(search_products)(query) if query else []
+
+    # Список id уже в памяти, Paginator считает страницы без запросов
+    page_obj = Paginator(product_ids, 12).get_page(request.GET.get('page'))
+    products_by_id = await Product.objects.ain_bulk(page_obj.object_list)
+    products = [products_by_id[pk] for pk in page_obj.object_list if pk in products_by_id]
+    return await sync_to_async(render)(request, 'products/search_results.html', {
+        'products': products,
+        'page_obj': page_obj,
+        'query': query,
+    })
+
+
+@require_GET
+async def product_list_api(request):
+    """
+    GET api/products/ без DRF: те же фильтры, курсор и формат ответа
+    {"next", "previous", "results"}. Как и синхронная версия, только для
+    вошедших пользователей (сессия).
+    """
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+
+    filters = parse_filters(request.GET, category_param='category_id')
+    # Дерево категорий читается синхронным кэшем — только если фильтр по категории задан
+    tree = await sync_to_async(category_tree)() if filters['category'] else None
+    products = PRODUCT_ROW.rows(apply_filters(Product.objects.all(), filters, tree))
+    pagination = KeysetPagination
+    try:
+        page_size = max(1, min(int(request.GET[pagination.page_size_query_param]), pagination.max_page_size))
+    except (KeyError, ValueError):
+        page_size = pagination.page_size
+    try:
+        page = await KeysetPaginator(products, page_size).aget_page(request.GET.get(pagination.cursor_query_param))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=404)
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(request.build_absolute_uri(), pagination.cursor_query_param, cursor)
+
+    return FastJsonResponse({
+        'next': link(page.next_cursor),
+        'previous': link(page.previous_cursor),
+        'results': PRODUCT_ROW.render(page, request),
+    })
@@ -0,0 +1,400 @@
+"""
+Воспроизводимый нагрузочный прогон горячих путей магазина (manage.py bench_shop).
+
+generate_data() создает детерминированный набор данных (одинаковый при том же
+seed и масштабе), сценарии ходят по страницам через django.test.Client, а
+run_benchmark() собирает для каждого сценария пропускную способность,
+перцентили задержки и число SQL-запросов. Результат — JSON, который можно
+сравнить с прогоном на другом коммите (compare_results).
+"""
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from rest_framework.renderers import JSONRenderer
+
+from . import fastjson
+from .metrics import percentiles
+from .models import CartItem, Category, Order, OrderItem, Product, Profile
+from .serializers import PRODUCT_ROW, ProductSerializer
+from .sorting import PRODUCT_SORTS
+
+# Объем данных при --scale 1; остальные масштабы — кратные
+BASE_SCALE = {
+    'root_categories': 5,
+    'child_categories': 3,  # на каждую корневую
+    'products': 1000,
+    'users': 50,
+    'orders': 200,
+    'cart_items': 3,  # на пользователя
+    'images': 5,
+}
+ADJECTIVES = ('red', 'small', 'classic', 'wireless', 'organic', 'steel', 'vintage', 'smart')
+NOUNS = ('lamp', 'phone', 'chair', 'kettle', 'watch', 'jacket', 'speaker', 'backpack')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class BenchData:
+    def __init__(self):
+        self.category_ids = []
+        self.product_ids = []
+        self.in_stock_ids = []
+        self.users = []
+        self.carts = {}  # user id -> id товаров в корзине
+        self.image_names = []
+
+    def cleanup(self):
+        """Файлы изображений живут вне транзакции — удаляются отдельно."""
+        for name in self.image_names:
+            default_storage.delete(name)
+
+    def delete(self):
+        """Удаляет закоммиченные данные прогона (корзины, заказы и профили — каскадом)."""
+        User.objects.filter(pk__in=[user.pk for user in self.users]).delete()
+        Product.objects.filter(pk__in=self.product_ids).delete()
+        Category.objects.filter(pk__in=self.category_ids).delete()
+        self.cleanup()
+
+
+def _image(rng):
+    output = BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new('RGB', (800, 600), color).save(output, 'JPEG', quality=80)
+    return ContentFile(output.getvalue())
+
+
+def generate_data(scale=1, seed=0, images=True):
+    """
+    Категории (корневые и дочерние), товары (часть с изображениями),
+    пользователи с корзинами и история заказов. Все значения берутся из
+    random.Random(seed), поэтому повторный прогон получает те же данные.
+    """
+    rng = random.Random(seed)
+    size = {key: value * scale for key, value in BASE_SCALE.items()}
+    data = BenchData()
+
+    roots = Category.objects.bulk_create([
+        Category(name=f'Bench category {i}', description='benchmark', popularity=rng.randrange(100))
+        for i in range(size['root_categories'])
+    ])
+    children = Category.objects.bulk_create([
+        Category(name=f'Bench category {i}.{j}', description='benchmark', parent=root,
+                 popularity=rng.randrange(100))
+        for i, root in enumerate(roots) for j in range(BASE_SCALE['child_categories'])
+    ])
+    categories = roots + children
+    data.category_ids = [category.pk for category in categories]
+
+    if images:
+        data.image_names = [default_storage.save(f'product_images/bench-{i}.jpg', _image(rng))
+                            for i in range(BASE_SCALE['images'])]
+
+    now = timezone.now()
+    products = Product.objects.bulk_create([
+        Product(
+            sku=f'BENCH-{i}',
+            name=f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}',
+            description=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for benchmarks',
+            price=Decimal(rng.randrange(100, 20000)) / 100,
+            # Каждый десятый — без остатка; остатков хватает на все оформления заказа
+            stock=0 if rng.random() < 0.1 else rng.randrange(1000, 5000),
+            featured=rng.random() < 0.05,
+            category=rng.choice(categories),
+            image=rng.choice(data.image_names) if data.image_names and rng.random() < 0.5 else '',
+            created_at=now - timedelta(minutes=rng.randrange(100000)),
+        )
+        for i in range(size['products'])
+    ], batch_size=1000)
+    data.product_ids = [product.pk for product in products]
+    data.in_stock_ids = [product.pk for product in products if product.stock]
+    prices = {product.pk: product.price for product in products}
+
+    data.users = User.objects.bulk_create([
+        User(username=f'bench-user-{i}', password=make_password(None)) for i in range(size['users'])
+    ])
+    # bulk_create не отправляет post_save, который создает профиль
+    Profile.objects.bulk_create([Profile(user=user) for user in data.users])
+    cart_items = []
+    for user in data.users:
+        data.carts[user.pk] = rng.sample(data.in_stock_ids, BASE_SCALE['cart_items'])
+        cart_items += [CartItem(user=user, product_id=product_id, quantity=rng.randint(1, 3))
+                       for product_id in data.carts[user.pk]]
+    CartItem.objects.bulk_create(cart_items)
+
+    orders = Order.objects.bulk_create([
+        Order(user=rng.choice(data.users), total_price=Decimal('0'),
+              created_at=now - timedelta(days=rng.randrange(365)))
+        for _ in range(size['orders'])
+    ])
+    order_items = []
+    for order in orders:
+        for product_id in rng.sample(data.product_ids, rng.randint(1, 3)):
+            order_items.append(OrderItem(order=order, product_id=product_id, quantity=1, price=prices[product_id]))
+    OrderItem.objects.bulk_create(order_items)
+    return data
+
+
+class Runner:
+    """Клиент сценария: каждый запрос замеряется (время и число SQL-запросов)."""
+
+    def __init__(self):
+        self.client = Client()
+        self.samples = []
+
+    def request(self, method, url, data=None, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(url, data, **extra)
+            seconds = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise BenchmarkError(f"{method.upper()} {url}: HTTP {response.status_code}")
+        self.samples.append((seconds, len(queries)))
+        return response
+
+    def get(self, url, data=None):
+        return self.request('get', url, data)
+
+    def post_json(self, url, data):
+        return self.request('post', url, data, content_type='application/json')
+
+
+def browse(runner, rng, data):
+    runner.get(reverse('home'))
+    runner.get(reverse('products_list'), {'sort': rng.choice(list(PRODUCT_SORTS))})
+    runner.get(reverse('products_list'), {'category': rng.choice(data.category_ids), 'in_stock': '1'})
+    runner.get(reverse('category_detail_view', args=[rng.choice(data.category_ids)]))
+    runner.get(reverse('product_detail_view', args=[rng.choice(data.product_ids)]))
+
+
+def search(runner, rng, data):
+    runner.get(reverse('search'), {'q': rng.choice(NOUNS)})
+    runner.get(reverse('products_list'), {'search': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'})
+
+
+def add_to_cart(runner, rng, data):
+    runner.post_json(reverse('add_to_cart', args=[rng.choice(data.in_stock_ids)]), {'quantity': 1})
+    runner.get(reverse('cart_view'))
+
+
+def update_cart(runner, rng, data):
+    product_id = rng.choice(data.carts[runner.user.pk])
+    runner.post_json(reverse('update_cart', args=[product_id]), {'quantity': rng.randint(1, 5)})
+
+
+def quick_order(runner, rng, data):
+    # Быстрый заказ: десятки позиций одним пакетным запросом
+    operations = [{'op': 'add', 'product_id': product_id, 'quantity': rng.randint(1, 3)}
+                  for product_id in rng.sample(data.in_stock_ids, 50)]
+    runner.post_json(reverse('cart_batch'), {'operations': operations})
+
+
+def checkout(runner, rng, data):
+    # Предыдущее оформление могло очистить корзину
+    runner.post_json(reverse('add_to_cart', args=[rng.choice(data.in_stock_ids)]), {'quantity': 1})
+    runner.get(reverse('cart_view'))
+    response = runner.request('post', reverse('checkout'))
+    if response.status_code != 302:
+        raise BenchmarkError("Checkout did not place an order")
+
+
+SCENARIOS = {
+    'browse': browse,
+    'search': search,
+    'add_to_cart': add_to_cart,
+    'update_cart': update_cart,
+    'quick_order': quick_order,
+    'checkout': checkout,
+}
+
+
+def run_scenario(name, data, iterations, seed=0):
+    """
+    iterations прогонов сценария, каждый от имени следующего пользователя.
+    Пропускная способность — запросов в секунду для одного клиента
+    (по суммарному времени запросов, без входа пользователя).
+    """
+    rng = random.Random(f'{seed}:{name}')
+    runner = Runner()
+    for i in range(iterations):
+        runner.user = data.users[i % len(data.users)]
+        runner.client.force_login(runner.user)
+        SCENARIOS[name](runner, rng, data)
+
+    seconds = sum(sample[0] for sample in runner.samples)
+    queries = [sample[1] for sample in runner.samples]
+    return {
+        'iterations': iterations,
+        'requests': len(runner.samples),
+        'seconds': round(seconds, 4),
+        'throughput_rps': round(len(runner.samples) / seconds, 1) if seconds else None,
+        'latency_ms': percentiles([sample[0] * 1000 for sample in runner.samples], ranks=(50, 95, 99)),
+        'queries': {'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                    'max': max(queries, default=None)},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(data, scenarios=tuple(SCENARIOS), iterations=50, seed=0, scale=1):
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'scale': scale,
+        'seed': seed,
+        'scenarios': {name: run_scenario(name, data, iterations, seed) for name in scenarios},
+    }
+
+
+def compare_results(baseline, current):
+    """Строки «сценарий: метрика было -> стало (изменение %)» для общих сценариев."""
+    lines = []
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        for label, old, new in (
+            ('p50 ms', before['latency_ms']['p50'], result['latency_ms']['p50']),
+            ('p95 ms', before['latency_ms']['p95'], result['latency_ms']['p95']),
+            ('rps', before['throughput_rps'], result['throughput_rps']),
+            ('queries', before['queries']['mean'], result['queries']['mean']),
+        ):
+            change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+            lines.append(f"{name}: {label} {old} -> {new} ({change})")
+    return lines
+
+
+def serializer_benchmark(queryset, repeat=5):
+    """
+    Микробенчмарк ответа списка товаров: ProductSerializer + JSONRenderer
+    против скомпилированной схемы PRODUCT_ROW + dumps() на одном queryset.
+    Время — лучшее из repeat прогонов, включая запрос к базе; identical —
+    совпадают ли ответы после разбора JSON.
+    """
+    request = RequestFactory().get('/api/products/')
+    rows = queryset.count()
+
+    def drf():
+        products = ProductSerializer.setup_eager_loading(queryset.all())
+        return JSONRenderer().render(ProductSerializer(products, many=True, context={'request': request}).data)
+
+    def fast():
+        return fastjson.dumps(PRODUCT_ROW.render(PRODUCT_ROW.rows(queryset.all()), request))
+
+    result = {
+        'rows': rows,
+        'repeat': repeat,
+        'encoder': 'orjson' if fastjson.orjson is not None else 'json',
+    }
+    outputs = {}
+    for name, render in (('drf', drf), ('fast', fast)):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = render()
+            timings.append(time.perf_counter() - start)
+        result[name] = {
+            'seconds': round(min(timings), 4),
+            'rows_per_second': round(rows / min(timings)),
+            'bytes': len(outputs[name]),
+        }
+    result['speedup'] = round(result['drf']['seconds'] / result['fast']['seconds'], 2)
+    result['identical'] = json.loads(outputs['drf']) == json.loads(outputs['fast'])
+    return result
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _http_load(host, port, path, requests, concurrency, headers):
+    request = (f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+               + ''.join(f'{name}: {value}\r\n' for name, value in headers.items()) + '\r\n').encode()
+    remaining = [requests]
+    latencies, errors = [], []
+
+    async def worker():
+        reader = writer = None
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await _read_response(reader)
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                errors.append(repr(e))
+                writer = None
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(f'HTTP {status}')
+            if not keep_alive:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+def http_load(host, port, path, requests=500, concurrency=10, headers=None):
+    """
+    Нагрузка на живой HTTP-сервер: concurrency соединений keep-alive отправляют
+    вместе requests GET-запросов. Возвращает пропускную способность, перцентили
+    задержки и число ошибок (сетевых и ответов не 200).
+    """
+    seconds, latencies, errors = asyncio.run(_http_load(host, port, path, requests, concurrency, headers or {}))
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': round(seconds, 4),
+        'throughput_rps': round(len(latencies) / seconds, 1) if seconds else None,
+        'latency_ms': percentiles([latency * 1000 for latency in latencies], ranks=(50, 95, 99)),
+        'errors': len(errors),
+    }
@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .settings import CATALOG_CACHE_ALIAS, CATALOG_CACHE_LOCAL_SIZE, CATALOG_CACHE_TIMEOUT
+
+_MISSING = object()
+BULK_INVALIDATION_THRESHOLD = 500
+
+
+class LocalLRU:
+    """Небольшой потокобезопасный LRU-кэш в памяти процесса с TTL."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """
+    Двухуровневый кэш для данных каталога: LRU процесса перед общим
+    Django-кэшем (settings.CACHES).
+
+    Каждое значение зависит от набора пространств имен ('product',
+    'category', 'product:42', ...). Номер версии каждого пространства
+    хранится в общем кэше и входит в ключ, поэтому инвалидация — это
+    увеличение версии: старые ключи просто перестают читаться, в том числе
+    из локальных LRU других процессов. Версии читаются одним get_many.
+    """
+    prefix = 'catalog'
+
+    def __init__(self, alias=CATALOG_CACHE_ALIAS, local_size=CATALOG_CACHE_LOCAL_SIZE,
+                 timeout=CATALOG_CACHE_TIMEOUT):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = LocalLRU(local_size)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _version_key(self, namespace):
+        return f'{self.prefix}:version:{namespace}'
+
+    def versions(self, namespaces):
+        keys = {self._version_key(namespace): namespace for namespace in namespaces}
+        found = self.shared.get_many(keys)
+        versions = {}
+        for key, namespace in keys.items():
+            version = found.get(key)
+            if version is None:
+                # Версия по времени, чтобы после вытеснения ключа версии не прочитать старые данные
+                version = int(time.time() * 1000)
+                if not self.shared.add(key, version, timeout=None):
+                    version = self.shared.get(key, version)
+            versions[namespace] = version
+        return versions
+
+    async def aversions(self, namespaces):
+        keys = {self._version_key(namespace): namespace for namespace in namespaces}
+        found = await self.shared.aget_many(keys)
+        versions = {}
+        for key, namespace in keys.items():
+            version = found.get(key)
+            if version is None:
+                version = int(time.time() * 1000)
+                if not await self.shared.aadd(key, version, timeout=None):
+                    version = await self.shared.aget(key, version)
+            versions[namespace] = version
+        return versions
+
+    def _key(self, name, params, dependencies, versions):
+        params_hash = hashlib.md5(repr(sorted(params.items())).encode()).hexdigest()
+        version_part = '.'.join(f'{versions[namespace]}' for namespace in dependencies)
+        return f'{self.prefix}:{name}:{params_hash}:{version_part}'
+
+    def make_key(self, name, params, dependencies):
+        return self._key(name, params, dependencies, self.versions(dependencies))
+
+    def get_or_set(self, name, compute, params=None, dependencies=()):
+        key = self.make_key(name, params or {}, dependencies)
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.shared.set(key, value, self.timeout)
+        self.local.set(key, value, self.timeout)
+        return value
+
+    async def aget_or_set(self, name, acompute, params=None, dependencies=()):
+        """get_or_set для async-представлений: acompute — корутинная функция, ключи те же."""
+        params = params or {}
+        key = self._key(name, params, dependencies, await self.aversions(dependencies))
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+        value = await self.shared.aget(key, _MISSING)
+        if value is _MISSING:
+            value = await acompute()
+            await self.shared.aset(key, value, self.timeout)
+        self.local.set(key, value, self.timeout)
+        return value
+
+    def bump(self, *namespaces):
+        for namespace in namespaces:
+            key = self._version_key(namespace)
+            try:
+                self.shared.incr(key)
+            except ValueError:
+                self.shared.set(key, int(time.time() * 1000), timeout=None)
+
+    def clear_local(self):
+        self.local.clear()
+
+
+catalog_cache = TieredCache()
+
+
+def invalidate(*namespaces):
+    """Увеличивает версии после коммита, чтобы кэш не заполнился незакоммиченными данными."""
+    transaction.on_commit(lambda: catalog_cache.bump(*namespaces))
+
+
+def invalidate_products(product_ids):
+    """
+    Инвалидация для массовых операций. Для больших наборов вместо версии
+    каждого товара увеличивается общая версия 'product:bulk', от которой
+    зависят страницы отдельных товаров.
+    """
+    product_ids = list(product_ids)
+    if len(product_ids) > BULK_INVALIDATION_THRESHOLD:
+        invalidate('product', 'product:bulk')
+    else:
+        invalidate('product', *(f'product:{pk}' for pk in product_ids))
+
+
+def product_dependencies(product_id):
+    return (f'product:{product_id}', 'product:bulk', 'category')
+
+
+@receiver(post_save, sender='products.Product')
+@receiver(post_delete, sender='products.Product')
+def invalidate_product(sender, instance, **kwargs):
+    invalidate('product', f'product:{instance.pk}')
+
+
+@receiver(post_save, sender='products.Category')
+@receiver(post_delete, sender='products.Category')
+def invalidate_category(sender, instance, **kwargs):
+    invalidate('category', f'category:{instance.pk}')
+
+
+@receiver(post_save, sender='products.Order')
+@receiver(post_delete, sender='products.Order')
+def invalidate_order_summary(sender, instance, **kwargs):
+    # Сводка заказов пользователя (products.orders)
+    invalidate(f'orders:{instance.user_id}')
+
+
+def cart_namespace(user_id=None, cart_key=None):
+    """Версия корзины в базе (products.cart.DatabaseCart): пользователя или анонимного ключа."""
+    return f'cart:user:{user_id}' if user_id is not None else f'cart:key:{cart_key}'
+
+
+@receiver(post_save, sender='products.CartItem')
+@receiver(post_delete, sender='products.CartItem')
+def invalidate_cart(sender, instance, **kwargs):
+    invalidate(cart_namespace(instance.user_id, instance.cart_key))
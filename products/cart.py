@@ -1,40 +1,303 @@
+import uuid
+from decimal import Decimal
+
 from django.conf import settings
-from .models import Product
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .cache import cart_namespace, catalog_cache, invalidate
+from .checkout import calculate_totals
+from .models import CartItem, Product
+from .settings import CART_BATCH_MAX_OPERATIONS
+
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+
+def get_cart_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', 'products.cart.SessionCart'))
+
+
+def money(value):
+    # Цены в SessionCart хранятся float (сессия сериализуется в JSON)
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+class CartOperationError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors  # [{'index': номер операции или None, 'error': текст}]
+        super().__init__('; '.join(error['error'] for error in errors))
+
+
+def validate_operations(data):
+    """
+    Проверяет пакет операций {"operations": [{"op": "add"|"set"|"remove",
+    "product_id": ..., "quantity": ...}, ...]} целиком, до каких-либо
+    изменений. Все товары читаются одним запросом (id__in). Возвращает
+    список (op, product_id, quantity) и товары по id; при любой ошибке —
+    CartOperationError со списком ошибок по номерам операций.
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError([{'index': None, 'error': 'operations must be a non-empty list'}])
+    if len(operations) > CART_BATCH_MAX_OPERATIONS:
+        raise CartOperationError([{'index': None, 'error': f'At most {CART_BATCH_MAX_OPERATIONS} operations'}])
+
+    errors, parsed = [], []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in CART_OPERATIONS:
+            errors.append({'index': index, 'error': f"op must be one of {', '.join(CART_OPERATIONS)}"})
+            continue
+        try:
+            product_id = int(operation.get('product_id'))
+            quantity = int(operation.get('quantity', 1)) if operation['op'] != 'remove' else 0
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'product_id and quantity must be integers'})
+            continue
+        if operation['op'] != 'remove' and quantity < 1:
+            errors.append({'index': index, 'error': 'Quantity must be at least 1'})
+            continue
+        parsed.append((index, operation['op'], product_id, quantity))
+
+    products = Product.objects.in_bulk({product_id for _, _, product_id, _ in parsed})
+    errors += [{'index': index, 'error': 'Product not found'}
+               for index, _, product_id, _ in parsed if product_id not in products]
+    if errors:
+        raise CartOperationError(sorted(errors, key=lambda error: error['index']))
+    return [(op, product_id, quantity) for _, op, product_id, quantity in parsed], products
+
+
+def resolve_operations(quantities, operations):
+    """Итоговое количество каждого затронутого товара (0 — убрать) после операций по порядку."""
+    quantities = dict(quantities)
+    for op, product_id, quantity in operations:
+        if op == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        else:
+            quantities[product_id] = quantity
+    return quantities
+
+
+class CartSummary:
+    """
+    Итоги корзины: число единиц товара, сумма без налога и версия, которая
+    растет при каждом изменении. Налог и итог считаются из subtotal.
+    """
+
+    def __init__(self, count=0, subtotal=Decimal('0'), version=0, product_ids=()):
+        self.count = count
+        self.subtotal = subtotal
+        self.version = version
+        # Товары, по которым посчитаны итоги; в сессии они видны по ключам версий
+        self.product_ids = product_ids
+
+    @property
+    def tax(self):
+        return calculate_totals(self.subtotal)[1]
+
+    @property
+    def total(self):
+        return calculate_totals(self.subtotal)[2]
+
+    def apply(self, quantity, price):
+        """Учитывает изменение количества товара по цене price (quantity < 0 — убрали)."""
+        self.count += quantity
+        self.subtotal += Decimal(str(price)) * quantity
+
+    def to_session(self, owner=None, versions=None):
+        return {'count': self.count, 'subtotal': str(self.subtotal), 'version': self.version, 'owner': owner,
+                'versions': versions}
+
+    @classmethod
+    def from_session(cls, data):
+        return cls(data['count'], Decimal(data['subtotal']), data['version'])
+
+    def as_json(self):
+        # Суммы — Decimal: в JSON (products.fastjson) они выводятся строками
+        return {
+            'cart_count': self.count,
+            'subtotal': money(self.subtotal),
+            'tax': money(self.tax),
+            'total': money(self.total),
+            'version': self.version,
+        }
+
 
 class Cart:
+    """
+    Корзина текущего запроса. Cart(request) возвращает экземпляр хранилища,
+    указанного в settings.CART_BACKEND (SessionCart или DatabaseCart), поэтому
+    представления не зависят от того, где лежит корзина.
+
+    Итоги (CartSummary) лежат в сессии рядом с корзиной и обновляются при
+    изменениях, поэтому summary(), len() и get_total_price() ничего не
+    пересчитывают и не ходят в базу. Если данные корзины живут не в сессии
+    (DatabaseCart), итоги помечаются версиями этих данных
+    (_summary_versions, {пространство имен кэша: версия}) и пересчитываются,
+    когда версии меняются.
+    """
+
+    def __new__(cls, request):
+        if cls is Cart:
+            cls = get_cart_backend()
+        return super().__new__(cls)
+
+    @classmethod
+    def merge_on_login(cls, request, user):
+        """Вызывается после входа пользователя; по умолчанию ничего не делает."""
+
+    def _summary_owner(self):
+        """Чья корзина посчитана в сохраненных итогах; при смене владельца итоги пересчитываются."""
+        return None
+
+    def _summary_versions(self, product_ids=(), known=None):
+        """
+        Версии данных, по которым посчитаны итоги с товарами product_ids;
+        уже прочитанные версии known дополняются. None — итоги меняет только
+        сама корзина.
+        """
+        return None
+
+    def _summary_is_current(self, versions):
+        if not versions:
+            return versions == self._summary_versions()
+        return catalog_cache.versions(list(versions)) == versions
+
+    def _compute_summary(self):
+        raise NotImplementedError
+
+    def summary(self):
+        data = self.session.get(settings.CART_SUMMARY_SESSION_ID)
+        if (data is not None and data.get('owner') == self._summary_owner()
+                and self._summary_is_current(data.get('versions'))):
+            return CartSummary.from_session(data)
+        # Версии читаются до пересчета: изменение во время пересчета даст еще один пересчет, а не старые итоги.
+        # Версии товаров, которых не было в прежних итогах, дочитываются после.
+        versions = self._summary_versions(self._stored_products(data))
+        summary = self._compute_summary()
+        versions = self._summary_versions(summary.product_ids, versions)
+        if data is not None:
+            summary.version = data['version'] + 1
+        if summary.count or data is not None or versions is not None:
+            # Пустые итоги без прежних не сохраняем, чтобы не создавать сессию каждому посетителю.
+            # Версии есть только у корзины с владельцем, а у него сессия уже есть: без сохранения
+            # пустая корзина пересчитывалась бы при каждом обращении
+            self._save_summary(summary, versions)
+        return summary
+
+    @staticmethod
+    def _stored_products(data):
+        versions = (data or {}).get('versions') or {}
+        return [int(namespace[8:]) for namespace in versions
+                if namespace.startswith('product:') and namespace[8:].isdigit()]
+
+    def _save_summary(self, summary, versions=None):
+        self.session[settings.CART_SUMMARY_SESSION_ID] = summary.to_session(self._summary_owner(), versions)
+        self.session.modified = True
+
+    def summary_for(self, rows):
+        """
+        Итоги, сверенные с уже прочитанными позициями (list(cart)): страница
+        корзины и JSON-ответы показывают суммы тех же строк и цен, что и
+        позиции, даже если сохраненные итоги еще не догнали изменения.
+        """
+        summary = self.summary()
+        count = sum(row['quantity'] for row in rows)
+        subtotal = sum((Decimal(str(row['price'])) * row['quantity'] for row in rows), Decimal('0'))
+        if count != summary.count or money(subtotal) != money(summary.subtotal):
+            summary = CartSummary(count, subtotal, summary.version + 1)
+            self._save_summary(summary, self._summary_versions(row['product']['id'] for row in rows))
+        return summary
+
+    def apply(self, operations, products):
+        """Применяет проверенный validate_operations() пакет целиком."""
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Позиции и итоги корзины для JSON-ответов эндпоинтов корзины."""
+        rows = list(self)
+        items = [{
+            'id': item['product']['id'],
+            'name': item['product']['name'],
+            'price': money(item['price']),
+            'quantity': item['quantity'],
+            'total_price': money(item['total_price']),
+            'image_url': item['product'].get('image', ''),
+        } for item in rows]
+        return {'cart_items': items, **self.summary_for(rows).as_json()}
+
+    def invalidate_summary(self):
+        """Сбрасывает итоги, если корзину изменили в обход Cart (например, оформили заказ)."""
+        data = self.session.get(settings.CART_SUMMARY_SESSION_ID)
+        if data is not None:
+            data['owner'] = '<stale>'
+            self.session.modified = True
+
+    def __len__(self):
+        return self.summary().count
+
+    def get_total_price(self):
+        return float(self.summary().subtotal)
+
+
+class SessionCart(Cart):
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        # Пустая корзина не записывается в сессию, пока в нее ничего не добавили
+        self.cart = self.session.get(settings.CART_SESSION_ID) or {}
 
     def add(self, product, quantity=1, update_quantity=False):
         product_id = str(product.id)
+        summary = self.summary()
         if product_id not in self.cart:
             self.cart[product_id] = {'quantity': 0, 'price': float(product.price)}
-        if update_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
-        self.save()
+        item = self.cart[product_id]
+        new_quantity = quantity if update_quantity else item['quantity'] + quantity
+        summary.apply(new_quantity - item['quantity'], item['price'])
+        item['quantity'] = new_quantity
+        self.save(summary)
+
+    def apply(self, operations, products):
+        summary = self.summary()
+        current = {int(product_id): item['quantity'] for product_id, item in self.cart.items()}
+        for product_id, quantity in resolve_operations(current, operations).items():
+            item = self.cart.get(str(product_id))
+            if item is None and quantity:
+                item = self.cart[str(product_id)] = {'quantity': 0, 'price': float(products[product_id].price)}
+            if item is None:
+                continue
+            summary.apply(quantity - item['quantity'], item['price'])
+            if quantity:
+                item['quantity'] = quantity
+            else:
+                del self.cart[str(product_id)]
+        self.save(summary)
 
-    def save(self):
+    def save(self, summary=None):
+        self.session[settings.CART_SESSION_ID] = self.cart
+        if summary is not None:
+            summary.version += 1
+            self._save_summary(summary)
         self.session.modified = True
 
     def remove(self, product):
         product_id = str(product.id)
         if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+            summary = self.summary()
+            item = self.cart.pop(product_id)
+            summary.apply(-item['quantity'], item['price'])
+            self.save(summary)
 
     def update(self, product_id, quantity):
         product_id = str(product_id)
+        summary = None
         if product_id in self.cart:
-            self.cart[product_id]['quantity'] = quantity
-            price = float(self.cart[product_id]['price'])
-            self.cart[product_id]['total_price'] = price * quantity
-        self.save()
+            summary = self.summary()
+            item = self.cart[product_id]
+            summary.apply(quantity - item['quantity'], item['price'])
+            item['quantity'] = quantity
+            item['total_price'] = float(item['price']) * quantity
+        self.save(summary)
 
     def __iter__(self):
         product_ids = self.cart.keys()
@@ -51,12 +314,198 @@ class Cart:
             item['total_price'] = float(item['price']) * item['quantity']
             yield item
 
-    def __len__(self):
-        return sum(item['quantity'] for item in self.cart.values())
+    def _compute_summary(self):
+        summary = CartSummary()
+        for item in self.cart.values():
+            summary.apply(item['quantity'], item['price'])
+        return summary
 
-    def get_total_price(self):
-        return sum(float(item['price']) * item['quantity'] for item in self.cart.values())
+    def clear(self):
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.session.pop(settings.CART_SUMMARY_SESSION_ID, None)
+        self.cart = {}
+        self.session.modified = True
+
+
+class DatabaseCart(Cart):
+    """
+    Корзина в таблице CartItem: одна строка на товар. Каждое изменение —
+    это UPDATE/INSERT одной строки, а не перезапись всей сессии.
+
+    Корзина пользователя привязана к user, анонимная — к случайному ключу
+    cart_key, который хранится в сессии (ключ сессии меняется при входе,
+    а данные сессии сохраняются). При входе анонимная корзина сливается
+    с корзиной пользователя.
+
+    Итоги после изменения пересчитываются одним запросом, а не сдвигаются
+    на разницу: в базе корзину могут менять параллельные запросы, а цена
+    берется текущая, из Product. Сохраненные в сессии итоги привязаны к
+    версиям пространств имен кэша 'cart:<владелец>' (любая запись CartItem,
+    в том числе из другой сессии того же пользователя) и 'product:<id>' с
+    'product:bulk' для товаров в корзине (смена цены), поэтому устаревают
+    вместе с данными, но не из-за изменений других товаров.
+    """
+    session_key = 'cart_key'
+
+    def __init__(self, request):
+        self.session = request.session
+        user = getattr(request, 'user', None)
+        self.user = user if user is not None and user.is_authenticated else None
+
+    def _owner(self, create=False):
+        if self.user is not None:
+            return {'user': self.user}
+        cart_key = self.session.get(self.session_key)
+        if cart_key is None and create:
+            cart_key = self.session[self.session_key] = uuid.uuid4().hex
+        return {'cart_key': cart_key} if cart_key else None
+
+    def _items(self):
+        owner = self._owner()
+        if owner is None:
+            return CartItem.objects.none()
+        return CartItem.objects.filter(**owner)
+
+    def add(self, product, quantity=1, update_quantity=False):
+        owner = self._owner(create=True)
+        new_quantity = quantity if update_quantity else F('quantity') + quantity
+        with transaction.atomic():
+            updated = CartItem.objects.filter(product=product, **owner).update(quantity=new_quantity)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.create(product=product, quantity=quantity, **owner)
+                except IntegrityError:
+                    # Параллельный запрос успел вставить строку — обновляем ее
+                    CartItem.objects.filter(product=product, **owner).update(quantity=new_quantity)
+        self.save()
+
+    def save(self, summary=None):
+        # Массовые записи (update, bulk_*) не шлют сигналов CartItem — версия корзины увеличивается здесь
+        self._invalidate()
+        previous = self.session.get(settings.CART_SUMMARY_SESSION_ID)
+        versions = self._summary_versions(self._stored_products(previous))
+        summary = summary or self._compute_summary()
+        versions = self._summary_versions(summary.product_ids, versions)
+        summary.version = previous['version'] + 1 if previous else 1
+        self._save_summary(summary, versions)
+
+    def _invalidate(self):
+        namespace = self._cart_namespace()
+        if namespace is not None:
+            invalidate(namespace)
+
+    def remove(self, product):
+        self._items().filter(product=product).delete()
+        self.save()
+
+    def apply(self, operations, products):
+        owner = self._owner(create=True)
+        with transaction.atomic():
+            existing = {
+                item.product_id: item
+                for item in CartItem.objects.select_for_update().filter(product_id__in=products, **owner)
+            }
+            current = {product_id: item.quantity for product_id, item in existing.items()}
+            created, changed, removed = [], [], []
+            for product_id, quantity in resolve_operations(current, operations).items():
+                item = existing.get(product_id)
+                if item is None:
+                    if quantity:
+                        created.append(CartItem(product_id=product_id, quantity=quantity, **owner))
+                elif not quantity:
+                    removed.append(item.id)
+                elif item.quantity != quantity:
+                    item.quantity = quantity
+                    changed.append(item)
+            # Не больше трех запросов на запись, сколько бы операций ни было в пакете
+            if created:
+                CartItem.objects.bulk_create(created)
+            if changed:
+                CartItem.objects.bulk_update(changed, ['quantity'])
+            if removed:
+                CartItem.objects.filter(id__in=removed).delete()
+        self.save()
+
+    def update(self, product_id, quantity):
+        self._items().filter(product_id=product_id).update(quantity=quantity)
+        self.save()
+
+    def __iter__(self):
+        for item in self._items().select_related('product').order_by('added_at', 'id'):
+            product = item.product
+            price = float(product.price)
+            yield {
+                'quantity': item.quantity,
+                'price': price,
+                'product': {
+                    'id': product.id,
+                    'name': product.name,
+                    'price': price,
+                    'image': product.image_url if product.image else '',
+                },
+                'total_price': price * item.quantity,
+            }
+
+    def _summary_owner(self):
+        if self.user is not None:
+            return f'user:{self.user.pk}'
+        cart_key = self.session.get(self.session_key)
+        return f'key:{cart_key}' if cart_key else None
+
+    def _cart_namespace(self):
+        if self.user is not None:
+            return cart_namespace(user_id=self.user.pk)
+        cart_key = self.session.get(self.session_key)
+        return cart_namespace(cart_key=cart_key) if cart_key else None
+
+    def _summary_versions(self, product_ids=(), known=None):
+        namespace = self._cart_namespace()
+        if namespace is None:
+            return None
+        versions = dict(known or {})
+        # Версии товаров (их сбрасывают сохранение и ProductQuerySet.update), а не общая 'product'
+        missing = [ns for ns in (namespace, 'product:bulk', *(f'product:{pk}' for pk in product_ids))
+                   if ns not in versions]
+        if missing:
+            versions.update(catalog_cache.versions(missing))
+        return versions
+
+    def _compute_summary(self):
+        if self._owner() is None:
+            return CartSummary()
+        summary = CartSummary()
+        rows = list(self._items().values_list('product_id', 'quantity', 'product__price'))
+        for _, quantity, price in rows:
+            summary.apply(quantity, price)
+        summary.product_ids = [product_id for product_id, _, _ in rows]
+        return summary
 
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
\ No newline at end of file
+        self._items().delete()
+        self.save(CartSummary())
+
+    @classmethod
+    def merge_on_login(cls, request, user):
+        cart_key = request.session.pop(cls.session_key, None)
+        if not cart_key:
+            return
+        with transaction.atomic():
+            anonymous = list(CartItem.objects.filter(cart_key=cart_key))
+            if not anonymous:
+                return
+            existing = {
+                item.product_id: item
+                for item in CartItem.objects.select_for_update().filter(
+                    user=user, product_id__in=[item.product_id for item in anonymous])
+            }
+            merged = []
+            for item in anonymous:
+                if item.product_id in existing:
+                    existing[item.product_id].quantity += item.quantity
+                    merged.append(item.id)
+            CartItem.objects.bulk_update(existing.values(), ['quantity'])
+            CartItem.objects.filter(id__in=merged).delete()
+            # Остальные строки просто переходят к пользователю одним UPDATE
+            CartItem.objects.filter(cart_key=cart_key).update(user=user, cart_key=None)
+            invalidate(cart_namespace(user_id=user.pk))
@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from .models import CartItem, Order, OrderItem, Product
+from .settings import TAX_RATE
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, product, requested):
+        self.product = product
+        self.requested = requested
+        super().__init__(f"Not enough stock for {product.name}: requested {requested}, available {product.stock}")
+
+
+def calculate_totals(subtotal):
+    tax = (subtotal * TAX_RATE).quantize(Decimal('0.01'))
+    return subtotal, tax, subtotal + tax
+
+
+def place_order(user):
+    """
+    Оформляет заказ из корзины пользователя (CartItem) за постоянное число
+    запросов, независимо от количества строк:
+
+    1. читает корзину;
+    2. блокирует нужные товары одним SELECT ... FOR UPDATE (в порядке id,
+       чтобы параллельные покупатели не попадали в deadlock);
+    3. списывает остатки одним UPDATE с условием stock >= quantity;
+    4. создает Order и все OrderItem через bulk_create;
+    5. очищает корзину.
+
+    При нехватке товара транзакция откатывается и ничего не списывается.
+    """
+    with transaction.atomic():
+        quantities = {}
+        for product_id, quantity in CartItem.objects.filter(user=user).values_list('product_id', 'quantity'):
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if not quantities:
+            raise EmptyCart("Cart is empty")
+
+        products = list(Product.objects.select_for_update().filter(id__in=quantities).order_by('id'))
+        for product in products:
+            if product.stock < quantities[product.id]:
+                raise InsufficientStock(product, quantities[product.id])
+
+        in_stock = Q()
+        for product in products:
+            in_stock |= Q(id=product.id, stock__gte=quantities[product.id])
+        updated = Product.objects.filter(in_stock).update(
+            stock=Case(*[When(id=product.id, then=F('stock') - quantities[product.id]) for product in products]),
+            updated_at=timezone.now(),
+        )
+        if updated != len(products):
+            # Сюда можно попасть только если строки не были заблокированы (например, SQLite)
+            raise CheckoutError("Stock changed during checkout, please try again")
+
+        subtotal = sum((product.price * quantities[product.id] for product in products), Decimal('0'))
+        subtotal, tax, total = calculate_totals(subtotal)
+        order = Order.objects.create(user=user, total_price=total)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantities[product.id], price=product.price)
+            for product in products
+        ])
+        CartItem.objects.filter(user=user).delete()
+    return order
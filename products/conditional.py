@@ -0,0 +1,138 @@
+"""
+Условные запросы (ETag/Last-Modified) для каталога и API.
+
+Валидаторы строятся из updated_at: у одного товара — по его строке (и
+строке категории), у списка — агрегатом Max(updated_at) + Count одним
+запросом. Они кэшируются в catalog_cache с теми же зависимостями, что и
+данные страниц, поэтому с теплым кэшем не стоят ни одного запроса. Если
+клиент прислал совпадающие If-None-Match/If-Modified-Since, представление
+не вызывается: 304 без выборки данных и сериализации.
+
+HTML-страницы зависят еще и от посетителя (имя в шапке, счетчик корзины),
+поэтому в их ETag входят id пользователя и итоги корзины из сессии.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import catalog_cache, product_dependencies
+from .cart import Cart
+from .facets import apply_filters, parse_filters
+from .models import Category, Product
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def aggregate_validators(queryset, *parts):
+    """ETag и Last-Modified списка: Max(updated_at) и число строк одним запросом."""
+    totals = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return make_etag(*parts, totals['count'], totals['last_modified']), totals['last_modified']
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def viewer_parts(request):
+    summary = Cart(request).summary()
+    return request.user.pk, summary.count, summary.version
+
+
+def conditional(validators):
+    """
+    Декоратор представления. validators(request, *args, **kwargs) возвращает
+    (etag, last_modified) или None, если объекта нет (тогда отвечает само
+    представление, обычно 404). Как django.views.decorators.http.condition,
+    но оба валидатора считаются одним вызовом; If-Match и
+    If-Unmodified-Since проверяются и для изменяющих запросов (412).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag, last_modified = validators(request, *args, **kwargs) or (None, None)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+                if timestamp and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(timestamp)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def product_validators(request, id):
+    def load():
+        row = Product.objects.filter(id=id).order_by().values_list('updated_at', 'category__updated_at').first()
+        if row is None:
+            return None
+        return make_etag('product', id, *row), latest(*row)
+
+    return catalog_cache.get_or_set('product_validators', load, {'id': id},
+                                    dependencies=product_dependencies(id))
+
+
+def cached_product(id):
+    """Товар с категорией для страницы товара, из catalog_cache (None, если его нет)."""
+    return catalog_cache.get_or_set(
+        'product_detail',
+        lambda: Product.objects.select_related('category').filter(id=id).first(),
+        {'id': id},
+        dependencies=product_dependencies(id),
+    )
+
+
+def product_page_validators(request, id):
+    # Страница все равно читает товар целиком: валидаторы берутся из той же записи кэша, без отдельного запроса
+    product = cached_product(id)
+    if product is None:
+        return None
+    row = (product.updated_at, product.category.updated_at if product.category else None)
+    return make_etag('product', id, *row, *viewer_parts(request)), latest(*row)
+
+
+def category_page_validators(request, category_id):
+    """
+    Страница категории: все категории (крошки и подкатегории) и товары
+    поддерева — его путь берется подзапросом, без отдельного чтения категории.
+    """
+    def load():
+        categories_etag, categories_modified = aggregate_validators(Category.objects.all())
+        path = Category.objects.filter(id=category_id).values('path')
+        products_etag, products_modified = aggregate_validators(
+            Product.objects.filter(category__path__startswith=Subquery(path)))
+        return (make_etag('category', category_id, categories_etag, products_etag),
+                latest(categories_modified, products_modified))
+
+    etag, last_modified = catalog_cache.get_or_set('category_validators', load, {'id': category_id},
+                                                   dependencies=('category', 'product'))
+    return make_etag(etag, *viewer_parts(request)), last_modified
+
+
+def category_list_validators(request):
+    return catalog_cache.get_or_set('category_list_validators',
+                                    lambda: aggregate_validators(Category.objects.all(), 'categories'),
+                                    dependencies=('category',))
+
+
+def product_list_validators(request):
+    """api/products/: агрегат по отфильтрованному списку; страница и хост — из полного URL."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    filters = parse_filters(request.GET, category_param='category_id')
+    etag, last_modified = catalog_cache.get_or_set(
+        'product_list_validators',
+        lambda: aggregate_validators(apply_filters(Product.objects.all(), filters)),
+        filters,
+        dependencies=('product', 'category'),
+    )
+    return make_etag(etag, request.build_absolute_uri()), last_modified
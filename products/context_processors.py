@@ -1,4 +1,6 @@
+from .cart import Cart
+
+
 def cart(request):
-    cart = request.session.get('cart', {})
-    cart_count = sum(item['quantity'] for item in cart.values())
-    return {'cart_count': cart_count}
\ No newline at end of file
+    # Итоги хранятся в сессии рядом с корзиной — ни пересчета, ни запросов к базе
+    return {'cart_count': Cart(request).summary().count}
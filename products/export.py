@@ -0,0 +1,66 @@
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import Product
+from .settings import EXPORT_CHUNK_SIZE
+
+EXPORT_FIELDS = ('id', 'sku', 'name', 'description', 'price', 'stock', 'featured', 'category_id',
+                 'created_at', 'updated_at')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def export_rows(updated_since=None, chunk_size=EXPORT_CHUNK_SIZE, build_url=None):
+    """
+    Строки каталога для выгрузки: словари из values() вместо экземпляров
+    модели и .iterator(chunk_size), поэтому в памяти одновременно не больше
+    одной пачки (на PostgreSQL — серверный курсор). Порядок — по id, а при
+    updated_since — по (updated_at, id), чтобы фильтр и сортировку обслуживал
+    один индекс product_updated_at_idx.
+    """
+    products = Product.objects.order_by('id')
+    if updated_since is not None:
+        products = products.filter(updated_at__gte=updated_since).order_by('updated_at', 'id')
+    rows = products.values(*EXPORT_FIELDS, 'image', category_name=F('category__name'))
+    for row in rows.iterator(chunk_size=chunk_size):
+        image = row.pop('image')
+        url = default_storage.url(image) if image else ''
+        row['image_url'] = build_url(url) if url and build_url else url
+        yield row
+
+
+def _batches(rows, encode, batch_size):
+    # Отдаем пачками: один yield на строку слишком дорог для WSGI-сервера
+    batch = []
+    for row in rows:
+        batch.append(encode(row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_ndjson(rows, batch_size=EXPORT_CHUNK_SIZE):
+    encode = DjangoJSONEncoder(ensure_ascii=False).encode
+    for batch in _batches(rows, encode, batch_size):
+        yield '\n'.join(batch) + '\n'
+
+
+def stream_json_array(rows, batch_size=EXPORT_CHUNK_SIZE):
+    encode = DjangoJSONEncoder(ensure_ascii=False).encode
+    separator = '['
+    for batch in _batches(rows, encode, batch_size):
+        yield separator + ',\n'.join(batch)
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
+
+
+STREAMS = {
+    'ndjson': stream_ndjson,
+    'json': stream_json_array,
+}
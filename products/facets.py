@@ -0,0 +1,147 @@
+from django.db.models import Count, Q, Value
+
+from .cache import catalog_cache
+from .models import Category, Product
+from .settings import PRICE_BUCKETS
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def category_tree():
+    """
+    Дерево категорий по Category.parent: {id: {'name', 'parent', 'children'}}.
+    Строится одним запросом и кэшируется до изменения категорий.
+    """
+    def load():
+        tree = {pk: {'name': name, 'parent': parent_id, 'children': []}
+                for pk, name, parent_id in Category.objects.values_list('id', 'name', 'parent_id')}
+        for pk, node in tree.items():
+            if node['parent'] in tree:
+                tree[node['parent']]['children'].append(pk)
+        return tree
+
+    return catalog_cache.get_or_set('category_tree', load, dependencies=('category',))
+
+
+def category_subtree(category_id, tree=None):
+    """id категории и всех ее потомков."""
+    tree = category_tree() if tree is None else tree
+    ids, stack = set(), [category_id]
+    while stack:
+        pk = stack.pop()
+        if pk in tree and pk not in ids:
+            ids.add(pk)
+            stack.extend(tree[pk]['children'])
+    return ids
+
+
+def parse_filters(params, category_param='category'):
+    """Выбранные значения фасетов из GET-параметров; некорректные значения игнорируются."""
+    category = params.get(category_param) or ''
+    price = params.get('price')
+    return {
+        'category': int(category) if category.isdigit() else None,
+        'price': price if price in {key for key, _, _, _ in PRICE_BUCKETS} else None,
+        'in_stock': (params.get('in_stock') or '').lower() in TRUE_VALUES,
+        'featured': (params.get('featured') or '').lower() in TRUE_VALUES,
+    }
+
+
+def price_q(bucket):
+    for key, _, low, high in PRICE_BUCKETS:
+        if key == bucket:
+            q = Q()
+            if low is not None:
+                q &= Q(price__gte=low)
+            if high is not None:
+                q &= Q(price__lt=high)
+            return q
+    return Q()
+
+
+def filters_q(filters, exclude=None, tree=None):
+    """Условие для выбранных фасетов; exclude — фасет, который не применяется (для его же счетчиков)."""
+    q = Q()
+    if filters['category'] and exclude != 'category':
+        q &= Q(category_id__in=category_subtree(filters['category'], tree))
+    if filters['price'] and exclude != 'price':
+        q &= price_q(filters['price'])
+    if filters['in_stock'] and exclude != 'in_stock':
+        q &= Q(stock__gt=0)
+    if filters['featured'] and exclude != 'featured':
+        q &= Q(featured=True)
+    return q
+
+
+def _count(q):
+    return Count(Value(1), filter=q or None)
+
+
+def apply_filters(queryset, filters, tree=None):
+    return queryset.filter(filters_q(filters, tree=tree))
+
+
+def facet_counts(queryset, filters):
+    """
+    Счетчики для каждого значения каждого фасета одним агрегатным запросом
+    (COUNT(1) FILTER (WHERE ...) на значение). Счетчик значения учитывает все
+    остальные выбранные фасеты, но не свой собственный — так пользователь
+    видит, сколько товаров получит, переключив значение.
+
+    queryset — товары до фасетных фильтров (например, после поиска).
+    Для категорий показываются дочерние категории выбранной (или корневые).
+    """
+    tree = category_tree()
+    selected = filters['category'] if filters['category'] in tree else None
+    if selected is None:
+        child_ids = [pk for pk, node in tree.items() if node['parent'] not in tree]
+    else:
+        child_ids = list(tree[selected]['children'])
+    child_ids.sort(key=lambda pk: tree[pk]['name'])
+
+    # Псевдонимы не должны совпадать с полями модели (featured), иначе ORM примет их за агрегаты в FILTER
+    aggregates = {}
+    for index, (key, _, _, _) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = _count(filters_q(filters, 'price', tree) & price_q(key))
+    aggregates['in_stock_count'] = _count(filters_q(filters, 'in_stock', tree) & Q(stock__gt=0))
+    aggregates['featured_count'] = _count(filters_q(filters, 'featured', tree) & Q(featured=True))
+    # Фильтр категории снимается: поддерево дочерней категории и так лежит внутри выбранной
+    category_filter = filters_q(filters, 'category', tree)
+    for pk in child_ids:
+        aggregates[f'category_{pk}'] = _count(category_filter & Q(category_id__in=category_subtree(pk, tree)))
+    aggregates['total_count'] = _count(filters_q(filters, tree=tree))
+
+    if selected is not None:
+        # Все счетчики лежат внутри выбранного поддерева — оно же условие WHERE по индексу
+        queryset = queryset.filter(category_id__in=category_subtree(selected, tree))
+    counts = queryset.order_by().aggregate(**aggregates)
+    return {
+        'total': counts['total_count'],
+        'price': [
+            {'value': key, 'label': label, 'count': counts[f'price_{index}'], 'selected': filters['price'] == key}
+            for index, (key, label, _, _) in enumerate(PRICE_BUCKETS)
+        ],
+        'in_stock': {'count': counts['in_stock_count'], 'selected': filters['in_stock']},
+        'featured': {'count': counts['featured_count'], 'selected': filters['featured']},
+        'category': [
+            {'value': pk, 'label': tree[pk]['name'], 'count': counts[f'category_{pk}']}
+            for pk in child_ids
+        ],
+        'selected_category': (
+            {'value': selected, 'label': tree[selected]['name'], 'parent': tree[selected]['parent']}
+            if selected else None
+        ),
+    }
+
+
+def catalog_facets(filters, search_query=None):
+    """Счетчики фасетов каталога (с учетом поиска), кэшируются до изменения товаров или категорий."""
+    def load():
+        products = Product.objects.all()
+        if search_query:
+            # То же условие, что у списка каталога (product_list_view): счетчики сходятся со списком
+            products = products.filter(name__icontains=search_query)
+        return facet_counts(products, filters)
+
+    return catalog_cache.get_or_set('product_facets', load, {**filters, 'search': search_query},
+                                    dependencies=('product', 'category'))
@@ -0,0 +1,157 @@
+"""
+Быстрый путь JSON для горячих эндпоинтов.
+
+Вместо сериализатора DRF (объект модели на строку, поля-классы,
+SerializerMethodField, to_representation) схема эндпоинта один раз
+компилируется в функцию «кортеж values_list() -> dict» — обычный
+словарь-литерал с обращениями row[i], без циклов по полям во время
+ответа. Кодирование — orjson, если он установлен, иначе json.
+
+Decimal везде выводится одинаково — строкой без потери точности, как
+DecimalField в DRF по умолчанию ("2.50").
+"""
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def decimal_value(value):
+    return str(value)
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return decimal_value(obj)
+    return DjangoJSONEncoder().default(obj)
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, obj):
+        return _default(obj)
+
+
+def dumps(data):
+    """JSON в байтах (UTF-8, без пробелов) с единой политикой для Decimal."""
+    if orjson is not None:
+        # Даты — через default, в формате DjangoJSONEncoder, как и без orjson
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, cls=_Encoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse, кодирующий через dumps()."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer DRF, кодирующий через dumps(); параметр indent из Accept не поддерживается."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class Field:
+    """
+    Поле схемы: ключ в JSON, колонка values_list() и вид значения:
+
+    - 'value' — как есть;
+    - 'decimal' — строкой (decimal_value), None остается None;
+    - 'file' — URL файла из хранилища (абсолютный, если есть request) или None;
+    - 'file_or_blank' — то же, но '' вместо None.
+    """
+    templates = {
+        'value': '{v}',
+        'decimal': '(None if {v} is None else decimal_value({v}))',
+        'file': '(absolute(url({v})) if {v} else None)',
+        'file_or_blank': '(absolute(url({v})) if {v} else "")',
+    }
+
+    def __init__(self, key, source, kind='value'):
+        if kind not in self.templates:
+            raise ValueError(f"Unknown field kind: {kind}")
+        self.key = key
+        self.source = source
+        self.kind = kind
+
+
+class Nested:
+    """Вложенный объект из колонок той же строки; None, если null_if-колонка пуста (LEFT JOIN)."""
+
+    def __init__(self, key, fields, null_if=None):
+        self.key = key
+        self.fields = fields
+        self.null_if = null_if
+
+
+class RowSchema:
+    """
+    Схема ответа эндпоинта, скомпилированная в функцию строки.
+
+        schema = RowSchema('featured', [Field('id', 'id'), Field('price', 'price', 'decimal')])
+        rows = schema.rows(Product.objects.filter(featured=True))   # values_list
+        data = schema.render(rows, request)                         # список dict
+    """
+
+    def __init__(self, name, fields, storage=None):
+        self.name = name
+        self.fields = fields
+        self.storage = storage
+        self.columns = []
+        self._positions = {}
+        self._collect(fields)
+        self.source = self._generate()
+        namespace = {'decimal_value': decimal_value}
+        exec(compile(self.source, f'<RowSchema {name}>', 'exec'), namespace)
+        self._compiled = namespace['to_dict']
+
+    def _collect(self, fields):
+        for field in fields:
+            if isinstance(field, Nested):
+                self._collect(field.fields)
+                if field.null_if:
+                    self._column(field.null_if)
+            else:
+                self._column(field.source)
+
+    def _column(self, source):
+        if source not in self._positions:
+            self._positions[source] = len(self.columns)
+            self.columns.append(source)
+        return f'row[{self._positions[source]}]'
+
+    def _dict_literal(self, fields):
+        items = []
+        for field in fields:
+            if isinstance(field, Nested):
+                value = self._dict_literal(field.fields)
+                if field.null_if:
+                    value = f'({value} if {self._column(field.null_if)} is not None else None)'
+            else:
+                value = Field.templates[field.kind].format(v=self._column(field.source))
+            items.append(f'{field.key!r}: {value}')
+        return '{' + ', '.join(items) + '}'
+
+    def _generate(self):
+        return f'def to_dict(row, url, absolute):\n    return {self._dict_literal(self.fields)}\n'
+
+    def rows(self, queryset):
+        return queryset.values_list(*self.columns)
+
+    def render(self, rows, request=None):
+        to_dict = self._compiled
+        url = self.storage.url if self.storage is not None else None
+        absolute = request.build_absolute_uri if request is not None else str
+        return [to_dict(row, url, absolute) for row in rows]
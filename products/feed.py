@@ -0,0 +1,70 @@
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Category, Product
+from .settings import HOME_CATEGORIES_COUNT, HOME_FEED_SECTIONS
+
+# Колонки, которые нужны карточке товара на главной
+CARD_FIELDS = ('id', 'name', 'description', 'price', 'image', 'category_id')
+
+
+def featured_section(config):
+    products = Product.objects.filter(featured=True).only(*CARD_FIELDS).order_by('-created_at', '-id')
+    return [{'title': config['title'], 'products': list(products[:config['limit']])}]
+
+
+def newest_section(config):
+    products = Product.objects.only(*CARD_FIELDS).order_by('-created_at', '-id')
+    return [{'title': config['title'], 'products': list(products[:config['limit']])}]
+
+
+def category_top_section(config):
+    """
+    Топ-N товаров для первых категорий (по Category.Meta.ordering) одним
+    запросом: ROW_NUMBER() OVER (PARTITION BY category) и фильтр по номеру.
+    """
+    categories = list(Category.objects.only('id', 'name')[:config['categories']])
+    if not categories:
+        return []
+    ranked = (
+        Product.objects.filter(category__in=categories)
+        .only(*CARD_FIELDS)
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=F('category_id'),
+            order_by=[F(name[1:]).desc() if name.startswith('-') else F(name).asc()
+                      for name in config.get('order_by', ('-featured', '-created_at', '-id'))],
+        ))
+        .filter(position__lte=config['limit'])
+        .order_by('category_id', 'position')
+    )
+    by_category = {}
+    for product in ranked:
+        by_category.setdefault(product.category_id, []).append(product)
+    return [
+        {'title': config['title'].format(category=category.name), 'category': category,
+         'products': by_category[category.id]}
+        for category in categories if category.id in by_category
+    ]
+
+
+SECTION_BUILDERS = {
+    'featured': featured_section,
+    'newest': newest_section,
+    'category_top': category_top_section,
+}
+
+
+def build_home_feed(sections=None):
+    """
+    Собирает главную страницу из секций settings.HOME_FEED_SECTIONS. Каждая
+    секция — один запрос с LIMIT, поэтому стоимость не зависит от размера
+    каталога. Результат — обычные списки, пригодные для кэширования целиком.
+    """
+    feed = {
+        'categories': list(Category.objects.only('id', 'name', 'image')[:HOME_CATEGORIES_COUNT]),
+        'sections': [],
+    }
+    for config in sections or HOME_FEED_SECTIONS:
+        feed['sections'].extend(SECTION_BUILDERS[config['type']](config))
+    return feed
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+from io import BytesIO
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from .jobs import enqueue
+from .settings import (CATALOG_CACHE_ALIAS, IMAGE_RENDITION_FORMATS, IMAGE_RENDITION_QUALITY, IMAGE_RENDITION_RECHECK,
+                       IMAGE_RENDITION_WIDTHS, JOB_STALE_AFTER)
+
+logger = logging.getLogger(__name__)
+
+# Формат Pillow и MIME-тип для каждого расширения
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+
+def available_formats():
+    Image.init()
+    return [ext for ext in IMAGE_RENDITION_FORMATS if FORMATS[ext][0] in Image.SAVE]
+
+
+def rendition_name(name, digest, width, ext):
+    """product_images/banana.jpg -> product_images/banana.3fa1b2c4d5e6.400w.webp"""
+    stem = os.path.splitext(name)[0]
+    return f"{stem}.{digest}.{width}w.{ext}"
+
+
+def _encode(image, ext):
+    pil_format = FORMATS[ext][0]
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, format=pil_format, quality=IMAGE_RENDITION_QUALITY)
+    return output.getvalue()
+
+
+def manifest_name(name):
+    """product_images/banana.jpg -> product_images/banana.renditions.json"""
+    return f"{os.path.splitext(name)[0]}.renditions.json"
+
+
+def generate_renditions(name, storage=default_storage):
+    """
+    Создает уменьшенные копии изображения во всех форматах и ширинах из
+    настроек и записывает рядом с оригиналом манифест
+    {ext: [[width, имя копии], ...]}. Возвращает манифест.
+
+    Имена содержат хэш содержимого оригинала, поэтому уже созданные копии
+    не пересоздаются, а после замены файла старые URL не отдаются из кэша CDN.
+    """
+    with storage.open(name, 'rb') as original:
+        data = original.read()
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    image.load()
+
+    widths = sorted({min(width, image.width) for width in IMAGE_RENDITION_WIDTHS})
+    manifest = {}
+    for ext in available_formats():
+        variants = []
+        for width in widths:
+            target = rendition_name(name, digest, width, ext)
+            if not storage.exists(target):
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                storage.save(target, ContentFile(_encode(resized, ext)))
+            variants.append([width, target])
+        manifest[ext] = variants
+
+    # Манифест перезаписывается на месте: save() при занятом имени выбрал бы другое
+    storage.delete(manifest_name(name))
+    storage.save(manifest_name(name), ContentFile(json.dumps(manifest).encode()))
+    return manifest
+
+
+def read_manifest(name, storage=default_storage):
+    """Манифест из хранилища или None, если копии еще не созданы."""
+    try:
+        with storage.open(manifest_name(name), 'rb') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _manifest_key(name):
+    return f'renditions:{name}'
+
+
+def _with_urls(manifest, storage):
+    return {ext: [(width, storage.url(target)) for width, target in variants]
+            for ext, variants in manifest.items()}
+
+
+def get_renditions(image, generate=True):
+    """
+    Манифест копий {ext: [(width, url), ...]} для ImageFieldFile.
+
+    Источник — файл манифеста в хранилище, который пишет воркер; кэш лишь
+    запоминает прочитанное, так что веб-процессы видят копии, даже если кэш у
+    каждого свой. Отсутствие манифеста запоминается на IMAGE_RENDITION_RECHECK
+    секунд. При отсутствии копии создаются сразу (generate=True) — так делает
+    фоновая задача, а шаблоны вызывают с generate=False. Если файла нет или он
+    не читается, возвращает None — шаблон покажет оригинал.
+    """
+    if not image:
+        return None
+    cache = caches[CATALOG_CACHE_ALIAS]
+    key = _manifest_key(image.name)
+    manifest = cache.get(key)
+    if manifest is None or (not manifest and generate):
+        manifest = read_manifest(image.name, image.storage)
+        if manifest is None and generate:
+            try:
+                manifest = generate_renditions(image.name, image.storage)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cannot create renditions for {image.name}: {e}")
+                return None
+        # Пустой словарь — «манифеста нет», чтобы не ходить в хранилище на каждый показ
+        cache.set(key, manifest or {}, None if manifest else IMAGE_RENDITION_RECHECK)
+    return _with_urls(manifest, image.storage) if manifest else None
+
+
+def build_renditions(image):
+    """Принудительно (пере)создает копии, например после загрузки нового файла."""
+    if not image:
+        return None
+    caches[CATALOG_CACHE_ALIAS].delete(_manifest_key(image.name))
+    image.storage.delete(manifest_name(image.name))
+    return get_renditions(image)
+
+
+def schedule_renditions(image):
+    """
+    Ставит создание копий в очередь фоновых задач, если манифеста еще нет.
+    Отметка в кэше не дает поставить одну и ту же задачу на каждое сохранение
+    объекта, пока воркер ее не выполнил.
+    """
+    if not image or not image.instance.pk:
+        return None
+    if get_renditions(image, generate=False) is not None:
+        return None
+    cache = caches[CATALOG_CACHE_ALIAS]
+    if not cache.add(f'renditions:queued:{image.name}', True, JOB_STALE_AFTER):
+        return None
+    from .tasks import process_image_renditions
+    return enqueue(process_image_renditions, model=image.instance._meta.label_lower,
+                   pk=image.instance.pk, field=image.field.name)
+
+
+@receiver(post_save, sender='products.Product')
+@receiver(post_save, sender='products.Category')
+def create_renditions_on_upload(sender, instance, raw=False, **kwargs):
+    # Для уже обработанного файла это одно чтение из кэша или манифеста в хранилище
+    if not raw and instance.image:
+        schedule_renditions(instance.image)
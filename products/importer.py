@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import invalidate
+from .models import Category, Product
+from .serializers import ProductImportSerializer
+from .settings import IMPORT_BATCH_SIZE
+
+EXTENSIONS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+# Поля существующего товара, которые перезаписываются, если они есть во входных данных
+UPDATABLE_FIELDS = ('name', 'description', 'price', 'stock', 'featured', 'category')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ImportFormatError(f"Cannot detect format of {filename}, expected one of: csv, json, ndjson")
+    return EXTENSIONS[extension]
+
+
+def read_rows(stream, fmt):
+    """
+    Словари из текстового потока. CSV и NDJSON читаются построчно, поэтому
+    файл любого размера не загружается в память; JSON-массив читается целиком.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            # Пустая ячейка — значения нет, поле не перезаписывается
+            yield {key: value for key, value in row.items() if key and value not in ('', None)}
+    elif fmt == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ImportFormatError(f"Line {number}: invalid JSON: {e}")
+    elif fmt == 'json':
+        try:
+            data = json.load(stream)
+        except ValueError as e:
+            raise ImportFormatError(f"Invalid JSON: {e}")
+        if not isinstance(data, list):
+            raise ImportFormatError("JSON input must be an array of objects")
+        yield from data
+    else:
+        raise ImportFormatError(f"Unknown format: {fmt}")
+
+
+class ImportReport:
+    max_errors = 100
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []  # первые max_errors ошибок: (номер строки, ошибки полей)
+        # Ошибка чтения файла (формат, кодировка): (номер строки, сообщение); строки до нее уже записаны
+        self.aborted = None
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((row_number, errors))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'error_count': self.error_count,
+            'errors': [{'row': row, 'errors': errors} for row, errors in self.errors],
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'aborted': {'row': self.aborted[0], 'error': self.aborted[1]} if self.aborted else None,
+        }
+
+
+class CategoryMap:
+    """Категории по имени: загружаются одним запросом, недостающие создаются пачкой."""
+
+    def __init__(self, create=False):
+        self.create = create
+        # При одинаковых именах побеждает категория с меньшим id
+        self.ids = dict(Category.objects.order_by('-id').values_list('name', 'id'))
+
+    def add_missing(self, names):
+        missing = sorted(set(names) - set(self.ids))
+        if not missing or not self.create:
+            return
+        created = Category.objects.bulk_create([Category(name=name, description='') for name in missing])
+        if any(category.pk is None for category in created):
+            created = Category.objects.filter(name__in=missing)
+        self.ids.update((category.name, category.pk) for category in created)
+        invalidate('category')
+
+
+def import_products(rows, batch_size=IMPORT_BATCH_SIZE, create_categories=False, on_batch=None):
+    """
+    Массовый импорт: строки проверяются пачками по batch_size и записываются
+    INSERT ... ON CONFLICT (sku) DO UPDATE — по одному на каждый набор
+    переданных полей в пачке (обычно один). Каждая пачка — своя транзакция;
+    строки с ошибками пропускаются и попадают в отчет.
+
+    Файл читается потоково, поэтому ошибка формата или кодировки может
+    встретиться после уже записанных пачек: строки до нее записываются,
+    импорт останавливается, а место и текст ошибки попадают в report.aborted.
+    """
+    report = ImportReport()
+    categories = CategoryMap(create=create_categories)
+    validator = ProductImportSerializer()
+    rows = iter(rows)
+    while not report.aborted:
+        batch = []
+        try:
+            batch.extend(islice(rows, batch_size))
+        except (ImportFormatError, UnicodeDecodeError) as e:
+            report.aborted = (report.rows + len(batch) + 1, str(e))
+        if not batch:
+            break
+        valid = []
+        for row in batch:
+            report.rows += 1
+            try:
+                valid.append((report.rows, validator.run_validation(row)))
+            except ValidationError as e:
+                report.add_error(report.rows, e.detail)
+
+        with transaction.atomic():
+            categories.add_missing(data['category'] for _, data in valid if data.get('category'))
+            products = {}
+            for number, data in valid:
+                category_name = data.get('category')
+                if category_name and category_name not in categories.ids:
+                    report.add_error(number, {'category': [f'Unknown category "{category_name}"']})
+                    continue
+                # Повтор sku в одной пачке: побеждает последняя строка
+                products[data['sku']] = (data.keys(), Product(
+                    sku=data['sku'],
+                    name=data['name'],
+                    description=data.get('description', ''),
+                    price=data['price'],
+                    stock=data.get('stock', 0),
+                    featured=data.get('featured', False),
+                    category_id=categories.ids.get(category_name),
+                ))
+            # Отдельный upsert на каждый набор переданных полей: значения по умолчанию
+            # строки без колонки не должны перезаписать поле существующего товара
+            groups = {}
+            for provided, product in products.values():
+                update_fields = tuple(field for field in UPDATABLE_FIELDS if field in provided)
+                groups.setdefault(update_fields, []).append(product)
+            for update_fields, group in groups.items():
+                Product.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=[*update_fields, 'updated_at'],
+                )
+            report.imported += len(products)
+
+        report.seconds = time.perf_counter() - report.started
+        if on_batch:
+            on_batch(report)
+    report.seconds = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,113 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+from .settings import JOB_MAX_ATTEMPTS, JOB_STALE_AFTER
+
+logger = logging.getLogger(__name__)
+
+
+def task(func):
+    """Помечает функцию как фоновую задачу: только такие функции можно поставить в очередь."""
+    func.is_job_task = True
+    return func
+
+
+def task_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, user=None, **kwargs):
+    """
+    Ставит задачу в очередь (строка в таблице Job) и сразу возвращает Job.
+    Аргументы должны сериализоваться в JSON. Внутри транзакции воркер
+    увидит задачу только после коммита.
+    """
+    if not getattr(func, 'is_job_task', False):
+        raise ValueError(f"{task_name(func)} is not a job task")
+    return Job.objects.create(task=task_name(func), kwargs=kwargs, user=user)
+
+
+def _stale():
+    return Q(status=Job.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=JOB_STALE_AFTER))
+
+
+def _available():
+    # Зависшая задача с исчерпанными попытками не забирается: она могла сама уронить воркер
+    return Q(status=Job.PENDING) | (_stale() & Q(attempts__lt=JOB_MAX_ATTEMPTS))
+
+
+def fail_exhausted_jobs():
+    """Помечает failed зависшие задачи, у которых не осталось попыток. Возвращает их число."""
+    return Job.objects.filter(_stale(), attempts__gte=JOB_MAX_ATTEMPTS).update(
+        status=Job.FAILED, error='Worker stopped responding while running the job',
+        finished_at=timezone.now())
+
+
+def claim_jobs(limit):
+    """
+    Забирает до limit задач: ожидающие и зависшие (воркер упал посреди
+    выполнения), пока у них остаются попытки; зависшие без попыток
+    помечаются failed. Каждая строка переводится в running условным UPDATE, поэтому
+    параллельные воркеры не получат одну задачу дважды — и без
+    SELECT ... FOR UPDATE SKIP LOCKED, которого нет в SQLite.
+    """
+    fail_exhausted_jobs()
+    available = _available()
+    candidates = Job.objects.filter(available).order_by('id').values_list('id', flat=True)[:limit]
+    claimed = []
+    for job_id in list(candidates):
+        if Job.objects.filter(available, id=job_id).update(
+                status=Job.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1):
+            claimed.append(job_id)
+    return claimed
+
+
+def run_job(job_id):
+    """
+    Выполняет забранную задачу и записывает результат. При ошибке задача
+    возвращается в очередь, пока не исчерпано JOB_MAX_ATTEMPTS попыток.
+    Возвращает итоговый статус.
+    """
+    job = Job.objects.get(id=job_id)
+    try:
+        func = import_string(job.task)
+        if not getattr(func, 'is_job_task', False):
+            raise ValueError(f"{job.task} is not a job task")
+        result = func(**job.kwargs)
+    except Exception:
+        logger.exception(f"Job {job.id} ({job.task}) failed, attempt {job.attempts}")
+        status = Job.PENDING if job.attempts < JOB_MAX_ATTEMPTS else Job.FAILED
+        Job.objects.filter(id=job.id).update(
+            status=status, error=traceback.format_exc(),
+            finished_at=timezone.now() if status == Job.FAILED else None)
+        return status
+    Job.objects.filter(id=job.id).update(status=Job.DONE, result=result, error='', finished_at=timezone.now())
+    return Job.DONE
+
+
+def run_pending(batch_size=10):
+    """Выполняет задачи в текущем процессе, пока очередь не опустеет. Возвращает число запусков."""
+    count = 0
+    while True:
+        job_ids = claim_jobs(batch_size)
+        if not job_ids:
+            return count
+        for job_id in job_ids:
+            run_job(job_id)
+        count += len(job_ids)
+
+
+def job_status(job):
+    """Данные для опроса статуса клиентом; трассировка ошибки наружу не отдается."""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'result': job.result,
+        'finished_at': job.finished_at,
+    }
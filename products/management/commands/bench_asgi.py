@@ -0,0 +1,134 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from products.benchmark import generate_data, git_commit, http_load
+from products.models import Product
+
+# Пары (синхронный, async) маршрутов; {product} — id товара для карточки
+ENDPOINTS = {
+    'featured': ('api_featured_products', 'api_featured_products_async', ''),
+    'categories': ('api_categories_list', 'api_categories_list_async', ''),
+    'product_detail': ('product_detail_view', 'product_detail_view_async', ''),
+    'search': ('search', 'search_async', '?q=lamp'),
+    'product_list_api': ('product_list_api', 'product_list_api_async', ''),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность под конкурентными соединениями: "
+        "gunicorn (WSGI, потоки) с синхронными представлениями и uvicorn (ASGI) "
+        "с синхронными и async-вариантами. Серверы запускаются подпроцессами с "
+        "теми же настройками и базой, поэтому данные (--generate) коммитятся и "
+        "удаляются после прогона."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,10,50', help="Уровни числа соединений через запятую")
+        parser.add_argument('--requests', type=int, default=500, help="Запросов на точку и уровень")
+        parser.add_argument('--threads', type=int, default=8, help="Потоков воркера gunicorn")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+        parser.add_argument('--generate', action='store_true', help="Создать тестовые данные на время прогона")
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--output', help="Файл для JSON с результатами")
+
+    def handle(self, *args, **options):
+        endpoints = [name for name in options['endpoints'].split(',') if name]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        levels = [int(level) for level in options['concurrency'].split(',') if level]
+
+        data = generate_data(options['scale'], images=False) if options['generate'] else None
+        session = None
+        try:
+            product = Product.objects.order_by('pk').first()
+            if product is None:
+                raise CommandError("No products to request, use --generate")
+            session = self.login(data)
+            headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session}'}
+            servers = {
+                'wsgi': ([sys.executable, '-m', 'gunicorn', 'myshop.wsgi:application', '--workers', '1',
+                          '--threads', str(options['threads']), '--bind', f"127.0.0.1:{options['port']}",
+                          '--log-level', 'warning'], (0,)),
+                'asgi': ([sys.executable, '-m', 'uvicorn', 'myshop.asgi:application', '--workers', '1',
+                          '--host', '127.0.0.1', '--port', str(options['port']), '--log-level', 'warning'], (0, 1)),
+            }
+            results = []
+            for server, (command, variants) in servers.items():
+                with self.serve(command, options['port']):
+                    for name in endpoints:
+                        for variant in variants:
+                            url_name = ENDPOINTS[name][variant]
+                            args = (product.pk,) if name == 'product_detail' else ()
+                            path = reverse(url_name, args=args) + ENDPOINTS[name][2]
+                            # Прогрев: кэш каталога и подключение к базе
+                            http_load('127.0.0.1', options['port'], path, requests=10, concurrency=1, headers=headers)
+                            for level in levels:
+                                result = http_load('127.0.0.1', options['port'], path, options['requests'],
+                                                   level, headers)
+                                result.update(server=server, endpoint=name,
+                                              view='async' if variant else 'sync')
+                                results.append(result)
+                                self.report(result)
+        finally:
+            if session is not None:
+                SessionStore(session_key=session).delete()
+            if data is not None:
+                data.delete()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'commit': git_commit(), 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}"))
+
+    def login(self, data):
+        user = data.users[0] if data else User.objects.filter(is_active=True).order_by('pk').first()
+        if user is None:
+            raise CommandError("No users to log in, use --generate")
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    @contextmanager
+    def serve(self, command, port):
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=dict(
+            os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE))
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        raise CommandError(f"Server did not start: {' '.join(command)}")
+                    time.sleep(0.2)
+            yield process
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def report(self, result):
+        latency = result['latency_ms']
+        self.stdout.write(f"{result['server']:>5} {result['endpoint']:>17} {result['view']:>6} "
+                          f"c={result['concurrency']:<4} {result['throughput_rps']:>8} rps "
+                          f"p50 {latency['p50']:>8} p95 {latency['p95']:>8} p99 {latency['p99']:>8} ms "
+                          f"errors {result['errors']}")
+
@@ -0,0 +1,75 @@
+import time
+from decimal import Decimal
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from products.cart import DatabaseCart, SessionCart
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет задержку операций корзины (add/update/remove/len/total) "
+        "для SessionCart и DatabaseCart по мере роста корзины. Данные "
+        "создаются во временной транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,500')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with transaction.atomic():
+            products = Product.objects.bulk_create([
+                Product(name=f"Bench cart product {i}", description="benchmark", price=Decimal('9.99'), stock=100)
+                for i in range(max(sizes) + 1)
+            ])
+            user = User.objects.create_user('bench-cart-user')
+            self.stdout.write(f"{'backend':>12} {'lines':>6} {'add ms':>8} {'update ms':>10} "
+                              f"{'re-add ms':>10} {'len ms':>8} {'total ms':>9}")
+            for backend in (SessionCart, DatabaseCart):
+                for size in sizes:
+                    self.run(backend, user, products, size, options['repeat'])
+            transaction.set_rollback(True)
+
+    def make_request(self, user):
+        request = RequestFactory().post('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.user = user
+        return request
+
+    def timed(self, request, func, repeat):
+        # Сессия сохраняется после каждой операции, как это делает SessionMiddleware
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+            if request.session.modified:
+                request.session.save()
+                request.session.modified = False
+        return (time.perf_counter() - start) / repeat * 1000
+
+    def run(self, backend, user, products, size, repeat):
+        request = self.make_request(user if backend is DatabaseCart else AnonymousUser())
+        cart = backend(request)
+        cart.clear()
+        for product in products[:size]:
+            cart.add(product)
+        request.session.save()
+
+        extra = products[size]
+        results = [
+            self.timed(request, lambda: cart.add(extra), repeat),
+            self.timed(request, lambda: cart.update(extra.id, 3), repeat),
+            self.timed(request, lambda: (cart.remove(extra), cart.add(extra)), repeat),
+            self.timed(request, lambda: len(cart), repeat),
+            self.timed(request, cart.get_total_price, repeat),
+        ]
+        cart.clear()
+        self.stdout.write(f"{backend.__name__:>12} {size:>6} " + " ".join(
+            f"{value:>{width}.3f}" for value, width in zip(results, (8, 10, 10, 8, 9))))
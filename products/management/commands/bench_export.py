@@ -0,0 +1,82 @@
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from products.export import export_rows, stream_json_array, stream_ndjson
+from products.models import Category, Product
+from products.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет пиковую память и скорость потоковой выгрузки каталога "
+        "(products.export). Данные создаются во временной транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--serializer-rows', type=int, default=0,
+                            help="Для сравнения: сериализовать столько строк целиком через "
+                                 "ProductSerializer(many=True), как делал api/products/")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['rows'])
+            self.stdout.write(f"{'mode':>12} {'rows':>9} {'seconds':>8} {'rows/s':>9} {'MB out':>8} {'peak MB':>8}")
+            for name, stream in (('ndjson', stream_ndjson), ('json', stream_json_array)):
+                self.measure(name, stream)
+            if options['serializer_rows']:
+                self.measure_serializer(options['serializer_rows'])
+            transaction.set_rollback(True)
+
+    def seed(self, rows, batch_size=10000):
+        categories = [Category.objects.create(name=f'Bench category {i}', description='benchmark')
+                      for i in range(10)]
+        for start in range(0, rows, batch_size):
+            Product.objects.bulk_create([
+                Product(name=f'Bench product {i}', description='benchmark ' * 10, price=Decimal('5.00'),
+                        stock=i % 50, category=categories[i % len(categories)])
+                for i in range(start, min(start + batch_size, rows))
+            ])
+
+    def report(self, name, rows, seconds, size, peak):
+        self.stdout.write(f"{name:>12} {rows:>9} {seconds:>8.2f} {rows / seconds:>9.0f} "
+                          f"{size / 2 ** 20:>8.1f} {peak / 2 ** 20:>8.1f}")
+
+    def measure(self, name, stream):
+        # Первый проход — скорость, второй — пиковая память (tracemalloc сильно замедляет код)
+        counted = {'rows': 0}
+
+        def rows():
+            for row in export_rows():
+                counted['rows'] += 1
+                yield row
+
+        start = time.perf_counter()
+        size = sum(len(chunk.encode()) for chunk in stream(rows()))
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        for chunk in stream(export_rows()):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.report(name, counted['rows'], seconds, size, peak)
+
+    def measure_serializer(self, rows):
+        request = RequestFactory().get('/api/products/')
+        products = ProductSerializer.setup_eager_loading(Product.objects.order_by('id'))[:rows]
+        start = time.perf_counter()
+        data = ProductSerializer(products, many=True, context={'request': request}).data
+        seconds = time.perf_counter() - start
+        del data
+
+        tracemalloc.start()
+        data = ProductSerializer(products.all(), many=True, context={'request': request}).data
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.report('serializer', len(data), seconds, 0, peak)
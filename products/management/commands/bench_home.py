@@ -0,0 +1,60 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from products.cache import catalog_cache
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет время рендера главной страницы (без кэша и с кэшем) по мере "
+        "роста каталога. Данные создаются во временной транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000,50000')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        client = Client()
+        with transaction.atomic():
+            categories = [Category.objects.create(name=f'Bench category {i}', description='benchmark')
+                          for i in range(10)]
+            self.stdout.write(f"{'products':>9} {'cold ms':>9} {'warm ms':>9} {'queries':>8} {'KB':>7}")
+            created = 0
+            for size in sizes:
+                Product.objects.bulk_create([
+                    Product(name=f'Bench product {i}', description='benchmark ' * 10, price=Decimal('5.00'),
+                            featured=i % 20 == 0, category=categories[i % len(categories)])
+                    for i in range(created, size)
+                ], batch_size=5000)
+                created = size
+                cold, queries, size_kb = self.measure(client, options['repeat'], clear=True)
+                warm, _, _ = self.measure(client, options['repeat'], clear=False)
+                self.stdout.write(f"{size:>9} {cold:>9.2f} {warm:>9.2f} {queries:>8} {size_kb:>7.1f}")
+            transaction.set_rollback(True)
+        self.clear()
+
+    def clear(self):
+        caches[catalog_cache.alias].clear()
+        catalog_cache.clear_local()
+
+    def measure(self, client, repeat, clear):
+        best, queries, size_kb = float('inf'), 0, 0
+        for _ in range(repeat):
+            if clear:
+                self.clear()
+            reset_queries()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.get('/')
+                best = min(best, time.perf_counter() - start)
+            queries, size_kb = len(ctx), len(response.content) / 1024
+        return best * 1000, queries, size_kb
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.benchmark import BASE_SCALE, generate_data, serializer_benchmark
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк JSON списка товаров: ProductSerializer (DRF) против "
+        "скомпилированной схемы products.fastjson. Данные создаются во "
+        "временной транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Число товаров в ответе")
+        parser.add_argument('--repeat', type=int, default=5, help="Прогонов каждого варианта (берется лучший)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Файл для JSON с результатами")
+
+    def handle(self, *args, **options):
+        scale = max(1, -(-options['rows'] // BASE_SCALE['products']))
+        with transaction.atomic():
+            data = generate_data(scale, options['seed'], images=False)
+            products = Product.objects.filter(pk__in=data.product_ids[:options['rows']])
+            result = serializer_benchmark(products, options['repeat'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{result['rows']} rows, encoder {result['encoder']}")
+        for name in ('drf', 'fast'):
+            self.stdout.write(f"{name:>5}: {result[name]['seconds'] * 1000:>9.1f} ms "
+                              f"{result[name]['rows_per_second']:>9} rows/s {result[name]['bytes']:>10} bytes")
+        self.stdout.write(f"speedup x{result['speedup']}, identical output: {result['identical']}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}"))
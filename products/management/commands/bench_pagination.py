@@ -0,0 +1,72 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, reset_queries, transaction
+
+from products.models import Product
+from products.pagination import KeysetPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает Paginator (COUNT + OFFSET) и KeysetPaginator на первой, "
+        "средней и последней странице. Данные создаются во временной "
+        "транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--per-page', type=int, default=9)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['products'])
+            self.run(options['per_page'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        self.stdout.write(f"Seeding {count} products...")
+        batch = [
+            Product(
+                name=f"Bench product {i:08d}",
+                description="benchmark",
+                price=Decimal(i % 1000) + Decimal('0.99'),
+                stock=i % 50,
+            )
+            for i in range(count)
+        ]
+        Product.objects.bulk_create(batch, batch_size=5000)
+
+    def timed(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            reset_queries()
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    def run(self, per_page, repeat):
+        queryset = Product.objects.all()
+        total = queryset.count()
+        num_pages = max(1, -(-total // per_page))
+        ordered = queryset.order_by(*Product._meta.ordering, 'id')
+        keyset = KeysetPaginator(queryset, per_page, ordering=list(Product._meta.ordering) + ['id'])
+
+        self.stdout.write(f"{'page':>10} {'Paginator ms':>14} {'Keyset ms':>12}")
+        for number in (1, num_pages // 2 or 1, num_pages):
+            # Курсор, указывающий на последнюю строку предыдущей страницы,
+            # как если бы клиент дошел до нее по ссылкам "next".
+            cursor = None
+            if number > 1:
+                anchor = ordered[(number - 1) * per_page - 1]
+                cursor = keyset.encode_cursor(anchor, 'n')
+
+            offset_ms = self.timed(lambda: list(Paginator(ordered, per_page).page(number)), repeat)
+            keyset_ms = self.timed(lambda: list(keyset.get_page(cursor)), repeat)
+            self.stdout.write(f"{number:>10} {offset_ms:>14.2f} {keyset_ms:>12.2f}")
+
+        self.stdout.write(f"Database: {connection.vendor}, rows: {total}, per page: {per_page}")
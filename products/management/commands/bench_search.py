@@ -0,0 +1,85 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from products.models import Category, Product
+from products.search import InvertedIndexBackend, get_search_backend
+
+WORDS = (
+    "apple banana cherry organic fresh juice green red sweet crunchy tropical dried frozen "
+    "laptop phone charger cable wireless speaker headphones screen battery keyboard mouse "
+    "shirt jacket cotton wool summer winter sport running shoes leather classic vintage"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает задержку поиска: старый icontains по трем полям с .distinct() "
+        "и текущий бэкенд products.search. Данные создаются во временной "
+        "транзакции и откатываются. Пример: --sizes 10000,100000,1000000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--queries', default='banana,wireless speaker,leather shoes,zzz')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        queries = options['queries'].split(',')
+        rng = random.Random(42)
+        with transaction.atomic():
+            categories = [Category.objects.create(name=name.title(), description='benchmark')
+                          for name in ('fruit', 'electronics', 'clothing')]
+            backend = get_search_backend()
+            self.stdout.write(f"Search backend: {type(backend).__name__}")
+            created = 0
+            for size in sizes:
+                self.seed(rng, categories, created, size)
+                created = size
+                if isinstance(backend, InvertedIndexBackend):
+                    backend.reset()
+                    start = time.perf_counter()
+                    backend.search(WORDS[0])
+                    self.stdout.write(f"{size:>9} rows: in-memory index built in "
+                                      f"{(time.perf_counter() - start) * 1000:.0f} ms")
+                for query in queries:
+                    old_ms = self.timed(lambda: self.icontains(query), options['repeat'])
+                    new_ms = self.timed(lambda: backend.search(query), options['repeat'])
+                    self.stdout.write(f"{size:>9} rows  {query!r:<20} icontains {old_ms:>9.2f} ms"
+                                      f"   backend {new_ms:>9.2f} ms")
+            transaction.set_rollback(True)
+        if isinstance(backend, InvertedIndexBackend):
+            backend.reset()
+
+    def seed(self, rng, categories, start, stop):
+        for offset in range(start, stop, 10000):
+            Product.objects.bulk_create([
+                Product(
+                    name=" ".join(rng.sample(WORDS, 3)),
+                    description=" ".join(rng.choices(WORDS, k=20)),
+                    price=Decimal('1.00'),
+                    category=categories[i % len(categories)],
+                )
+                for i in range(offset, min(offset + 10000, stop))
+            ])
+
+    def icontains(self, query):
+        # Так искал search_view до перехода на products.search (первая страница + COUNT)
+        products = Product.objects.filter(
+            Q(name__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query)
+        ).distinct()
+        products.count()
+        list(products[:12])
+
+    def timed(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
@@ -0,0 +1,71 @@
+import json
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from products.benchmark import SCENARIOS, BenchmarkError, compare_results, generate_data, run_benchmark
+from products.cache import catalog_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет сценарии browse/search/add_to_cart/update_cart/quick_order/checkout на "
+        "детерминированных данных и сохраняет пропускную способность, перцентили "
+        "задержки и число запросов в JSON. Данные создаются во временной "
+        "транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1, help="Множитель объема данных (1 = 1000 товаров)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50, help="Прогонов каждого сценария")
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--output', help="Файл для JSON с результатами")
+        parser.add_argument('--compare', help="JSON предыдущего прогона для сравнения")
+        parser.add_argument('--no-images', action='store_true', help="Не создавать файлы изображений")
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        self.clear_cache()
+        data = None
+        try:
+            with transaction.atomic():
+                data = generate_data(options['scale'], options['seed'], images=not options['no_images'])
+                results = run_benchmark(data, scenarios, options['iterations'], options['seed'], options['scale'])
+                transaction.set_rollback(True)
+        except BenchmarkError as e:
+            raise CommandError(e)
+        finally:
+            if data is not None:
+                data.cleanup()
+            # В кэше остались страницы с откаченными данными
+            self.clear_cache()
+
+        self.stdout.write(f"{'scenario':>12} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'queries':>8}")
+        for name, result in results['scenarios'].items():
+            latency = result['latency_ms']
+            self.stdout.write(f"{name:>12} {result['requests']:>9} {result['throughput_rps']:>8} "
+                              f"{latency['p50']:>8} {latency['p95']:>8} {latency['p99']:>8} "
+                              f"{result['queries']['mean']:>8}")
+        if baseline:
+            self.stdout.write(f"Compared with {baseline.get('commit') or options['compare']}:")
+            for line in compare_results(baseline, results):
+                self.stdout.write(f"  {line}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}"))
+
+    def clear_cache(self):
+        caches[catalog_cache.alias].clear()
+        catalog_cache.clear_local()
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import EXTENSIONS, ImportFormatError, detect_format, import_products, read_rows
+from products.settings import IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует или обновляет товары по sku из CSV/JSON/NDJSON файла. "
+        "CSV и NDJSON читаются потоково, запись идет пачками через upsert."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=sorted(set(EXTENSIONS.values())),
+                            help="Формат файла, по умолчанию — по расширению")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--create-categories', action='store_true',
+                            help="Создавать категории, которых еще нет")
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['type'] or detect_format(options['path'])
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = import_products(read_rows(stream, fmt), batch_size=options['batch_size'],
+                                         create_categories=options['create_categories'],
+                                         on_batch=self.progress if options['verbosity'] > 1 else None)
+        except (ImportFormatError, OSError, UnicodeDecodeError) as e:
+            raise CommandError(e)
+
+        for row, errors in report.errors:
+            self.stderr.write(f"Row {row}: {errors}")
+        summary = (f"Imported {report.imported} of {report.rows} rows in {report.seconds:.2f}s "
+                   f"({report.rows_per_second:.0f} rows/s), {report.error_count} errors")
+        if report.aborted:
+            row, error = report.aborted
+            raise CommandError(f"Row {row}: {error}. {summary} before the error")
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def progress(self, report):
+        self.stdout.write(f"{report.rows} rows, {report.rows_per_second:.0f} rows/s")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Category
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает Category.product_count по фактическому количеству товаров."
+
+    def add_arguments(self, parser):
+        parser.add_argument('category_ids', nargs='*', type=int,
+                            help="ID категорий для проверки (по умолчанию все)")
+
+    def handle(self, *args, **options):
+        category_ids = options['category_ids'] or None
+        with transaction.atomic():
+            fixed = Category.refresh_product_counts(category_ids)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled product counts: {fixed} categories fixed"))
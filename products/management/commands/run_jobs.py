@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from products.jobs import claim_jobs, run_job
+from products.settings import JOB_POLL_INTERVAL
+from products.worker import execute, init_process
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из очереди products.Job в пуле процессов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Размер пула процессов; 0 — выполнять задачи в текущем процессе")
+        parser.add_argument('--once', action='store_true',
+                            help="Завершиться, когда очередь опустеет")
+        parser.add_argument('--poll-interval', type=float, default=JOB_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        if options['processes'] > 0:
+            self.run_pool(options['processes'], options['once'], options['poll_interval'])
+        else:
+            self.run_inline(options['once'], options['poll_interval'])
+
+    def report(self, job_id, status):
+        self.stdout.write(f"Job {job_id}: {status}")
+
+    def run_inline(self, once, poll_interval):
+        while True:
+            job_ids = claim_jobs(1)
+            if not job_ids:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            self.report(job_ids[0], run_job(job_ids[0]))
+
+    def run_pool(self, processes, once, poll_interval):
+        # Забираем не больше задач, чем пул успеет начать, плюс небольшой запас
+        capacity = processes * 2
+        running = set()
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_process) as pool:
+            while True:
+                if len(running) < capacity:
+                    for job_id in claim_jobs(capacity - len(running)):
+                        running.add(pool.submit(execute, job_id))
+                if not running:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.report(*future.result())
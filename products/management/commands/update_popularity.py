@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.popularity import reset_popularity, update_popularity
+
+
+class Command(BaseCommand):
+    help = ("Обновляет популярность товаров и категорий: затухание и заказы после "
+            "последнего запуска (запускать по расписанию).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Обнулить счета и пересчитать по всем заказам")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_popularity()
+        stats = update_popularity()
+        self.stdout.write(self.style.SUCCESS(
+            f"Popularity updated: {stats['order_items']} order items, {stats['products']} products, "
+            f"{stats['categories']} categories; last order item {stats['last_order_item_id']}"))
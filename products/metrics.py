@@ -0,0 +1,219 @@
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from .settings import METRICS_SAMPLE_SIZE, QUERY_BUDGETS
+
+logger = logging.getLogger(__name__)
+
+# Замеры текущего запроса; ContextVar, а не threading.local — работает и в async
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.total_seconds = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - start
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join([
+            f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_seconds * 1000:.1f}',
+            f'total;dur={self.total_seconds * 1000:.1f}',
+        ])
+
+
+class TimedTemplate:
+    """Обертка шаблона бэкенда: время render() идет в замеры текущего запроса."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.template_seconds += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates, замеряющий рендеринг шаблонов. Включенные через
+    {% include %} и {% extends %} шаблоны рендерятся внутри корневого, поэтому
+    время считается один раз.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class MetricsStore:
+    """
+    Последние METRICS_SAMPLE_SIZE запросов каждого представления в памяти
+    процесса; при нескольких воркерах у каждого своя статистика.
+    """
+
+    def __init__(self, size=METRICS_SAMPLE_SIZE):
+        self.size = size
+        self._samples = defaultdict(lambda: deque(maxlen=self.size))
+        self._lock = threading.Lock()
+
+    def add(self, view_name, metrics):
+        with self._lock:
+            self._samples[view_name].append(
+                (metrics.total_seconds, metrics.queries, metrics.sql_seconds, metrics.template_seconds))
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        with self._lock:
+            samples = {view_name: list(values) for view_name, values in self._samples.items()}
+        return {
+            view_name: {
+                'requests': len(values),
+                'total_ms': percentiles([value[0] * 1000 for value in values]),
+                'queries': percentiles([value[1] for value in values]),
+                'sql_ms': percentiles([value[2] * 1000 for value in values]),
+                'template_ms': percentiles([value[3] * 1000 for value in values]),
+                'query_budget': QUERY_BUDGETS.get(view_name),
+            }
+            for view_name, values in sorted(samples.items())
+        }
+
+
+def percentiles(values, ranks=(50, 90, 99)):
+    """Перцентили (по умолчанию p50/p90/p99) и максимум методом ближайшего ранга."""
+    values = sorted(values)
+    result = {}
+    for rank in ranks:
+        result[f'p{rank}'] = round(values[max(0, math.ceil(len(values) * rank / 100) - 1)], 2) if values else None
+    result['max'] = round(values[-1], 2) if values else None
+    return result
+
+
+store = MetricsStore()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+def check_query_budget(name, queries):
+    budget = QUERY_BUDGETS.get(name)
+    if budget is None or queries <= budget:
+        return
+    message = f"{name}: {queries} queries, budget is {budget}"
+    # QUERY_BUDGET_STRICT (тесты, CI) — ошибка запроса, иначе предупреждение в лог
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class RequestMetricsMiddleware:
+    """
+    Для каждого запроса: число и время SQL-запросов, время рендеринга
+    шаблонов и общее время. Результат — заголовок Server-Timing, JSON-строка
+    в логе products.metrics, статистика по имени URL (api/metrics/) и
+    проверка бюджета запросов из QUERY_BUDGETS для GET/HEAD-запросов.
+
+    Запросы, выполненные при отдаче потокового ответа, уже после выхода из
+    представления, не учитываются.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def instrument(stack, metrics):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics.record_query))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                self.instrument(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        stack = ExitStack()
+        try:
+            # Подключения к базе привязаны к потоку, в котором async ORM выполняет
+            # запросы (sync_to_async, thread_sensitive) — обертка ставится там же
+            await sync_to_async(self.instrument)(stack, metrics)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        metrics.finish()
+        name = view_name(request)
+        store.add(name, metrics)
+        response['Server-Timing'] = metrics.server_timing()
+        logger.info(json.dumps({
+            'view': name,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_seconds * 1000, 2),
+            'template_ms': round(metrics.template_seconds * 1000, 2),
+            'total_ms': round(metrics.total_seconds * 1000, 2),
+        }))
+        if request.method in ('GET', 'HEAD'):
+            check_query_budget(name, metrics.queries)
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0012_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='cart_key',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'product'), name='unique_user_cart_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('cart_key__isnull', False)), fields=('cart_key', 'product'), name='unique_anonymous_cart_product'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 11:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_product_counts(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    counts = (
+        apps.get_model('products', 'Product').objects.filter(category__isnull=False)
+        .order_by().values('category').annotate(count=Count('pk')).values_list('category', 'count')
+    )
+    for category_id, count in counts:
+        Category.objects.filter(pk=category_id).update(product_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_cartitem_anonymous_cart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_product_counts, migrations.RunPython.noop),
+    ]
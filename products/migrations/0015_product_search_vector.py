@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+SEARCH_VECTOR_SQL = """
+ALTER TABLE products_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+) STORED;
+CREATE INDEX products_product_search_vector_gin ON products_product USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP INDEX IF EXISTS products_product_search_vector_gin;
+ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    # Колонка нужна только PostgresSearchBackend; на SQLite поиск идет по индексу в памяти
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_category_product_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
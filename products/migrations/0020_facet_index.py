@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_catalog_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'stock', 'featured'], name='product_facets_idx'),
+        ),
+    ]
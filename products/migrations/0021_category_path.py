@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def path_of(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (path_of(parent_id) if parent_id else '') + f'{pk}/'
+        return paths[pk]
+
+    for pk in parents:
+        Category.objects.filter(pk=pk).update(path=path_of(pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_facet_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
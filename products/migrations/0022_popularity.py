@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_item_id', models.PositiveBigIntegerField(default=0)),
+                ('decayed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-popularity', '-featured', '-created_at', '-id'], name='product_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-popularity', '-featured', '-created_at', '-id'], name='product_cat_popularity_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_popularity'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_facets_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'stock', 'featured', 'name'], name='product_facets_idx'),
+        ),
+    ]
@@ -1,32 +1,241 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Length, Substr
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.contrib.auth.signals import user_logged_in
+
+from .cache import BULK_INVALIDATION_THRESHOLD, invalidate, invalidate_products
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
+
+
 
+class CategoryQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        # bulk_create не вызывает save() — пути проставляются отдельно
+        Category.rebuild_paths()
+        return objs
 
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='children', blank=True, null=True)
-    popularity = models.IntegerField(default=0)
+    # Materialized path: id предков и самой категории через '/', например '1/5/12/'.
+    # Поддерево — один запрос path LIKE '1/5/%' по индексу, предки — id из самой строки.
+    path = models.CharField(max_length=255, default='', editable=False, db_index=True)
+    # Затухающая популярность по заказам товаров категории — пересчитывает products.popularity
+    popularity = models.FloatField(default=0)
+    # Денормализованный счетчик товаров, поддерживается сигналами и ProductQuerySet
+    product_count = models.PositiveIntegerField(default=0, editable=False)
     image = models.ImageField(upload_to='category_images/', blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
     class Meta:
         verbose_name_plural = 'categories'
         ordering = ['-popularity', 'name']
+        indexes = [
+            # Сортировка по умолчанию: списки категорий и первые N на главной
+            models.Index(fields=['-popularity', 'name'], name='category_ordering_idx'),
+        ]
 
     def get_absolute_url(self):
         from django.urls import reverse
         return reverse('category_detail_view', args=[str(self.id)])
 
+    def clean(self):
+        if self.parent_id and self.path and self._parent_path().startswith(self.path):
+            raise ValidationError({'parent': "A category cannot be moved into its own subtree."})
+
+    def _parent_path(self):
+        if not self.parent_id:
+            return ''
+        return Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        parent_path = self._parent_path()
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError("A category cannot be moved into its own subtree")
+        if self.pk is not None:
+            self.path = f'{parent_path}{self.pk}/'
+            if kwargs.get('update_fields') is not None and self.path != old_path:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'path'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.pk is not None and not self.path:
+                # Новая строка: id известен только после INSERT
+                self.path = f'{parent_path}{self.pk}/'
+                Category.objects.filter(pk=self.pk).update(path=self.path)
+            if old_path and self.path != old_path:
+                # Перенос: один UPDATE меняет префикс у всего поддерева
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)))
+
+    @property
+    def depth(self):
+        return self.path.count('/') - 1
+
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.split('/')[:-2]]
+
+    def get_ancestors(self):
+        """Предки от корня к родителю — один запрос по id из path."""
+        return Category.objects.filter(pk__in=self.ancestor_ids()).order_by(Length('path'))
+
+    def get_descendants(self, include_self=False):
+        categories = Category.objects.filter(path__startswith=self.path)
+        return categories if include_self else categories.exclude(pk=self.pk)
+
+    @classmethod
+    def rebuild_paths(cls):
+        """
+        Пересчитывает path всех категорий по parent — после bulk_create,
+        update(parent=...) или для починки. Возвращает число исправленных строк.
+        """
+        rows = {pk: (parent_id, path) for pk, parent_id, path in cls.objects.values_list('id', 'parent_id', 'path')}
+        paths = {}
+        for pk in rows:
+            chain = []
+            while pk is not None and pk not in paths:
+                chain.append(pk)
+                pk = rows[pk][0]
+                if len(chain) > len(rows):
+                    raise ValueError("Category parents form a cycle")
+            prefix = paths.get(pk, '')
+            for node in reversed(chain):
+                prefix = paths[node] = f'{prefix}{node}/'
+        stale = [cls(pk=pk, path=path) for pk, path in paths.items() if rows[pk][1] != path]
+        if stale:
+            cls.objects.bulk_update(stale, ['path'], batch_size=500)
+            invalidate('category')
+        return len(stale)
+
+    @classmethod
+    def adjust_product_counts(cls, deltas):
+        """Применяет {category_id: +/-n} атомарными UPDATE ... SET product_count = product_count + n."""
+        for category_id, delta in deltas.items():
+            if category_id is not None and delta:
+                cls.objects.filter(pk=category_id).update(
+                    product_count=F('product_count') + delta, updated_at=timezone.now())
+
+    @classmethod
+    def refresh_product_counts(cls, category_ids=None):
+        """
+        Пересчитывает счетчики одним UPDATE с подзапросом. Возвращает число
+        категорий, у которых счетчик расходился с реальным количеством товаров.
+        """
+        actual = Coalesce(Subquery(
+            Product.objects.filter(category=OuterRef('pk')).order_by()
+            .values('category').annotate(count=Count('pk')).values('count')[:1]
+        ), Value(0))
+        categories = cls.objects.all() if category_ids is None else cls.objects.filter(pk__in=category_ids)
+        stale = categories.annotate(actual=actual).exclude(product_count=F('actual'))
+        return cls.objects.filter(pk__in=stale.values('pk')).update(
+            product_count=actual, updated_at=timezone.now())
+
+# Поля товара в поисковом индексе (products.search)
+SEARCH_FIELDS = {'name', 'description', 'category', 'category_id'}
+
+
+def _reindex_search(product_ids):
+    # products.search импортирует модели, поэтому импорт внутри функции
+    from .search import reindex_products
+    reindex_products(product_ids)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Массовые операции обходят сигналы save/delete, поэтому счетчики
+    Category.product_count и версии кэша каталога для них поддерживаются
+    здесь, в той же транзакции.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            if kwargs.get('update_conflicts'):
+                affected = self._upsert_categories(objs, kwargs.get('unique_fields') or ())
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get('update_conflicts'):
+                # При upsert pk обновленных строк неизвестны, а часть строк могла
+                # уже существовать — сбрасываем весь кэш товаров и пересчитываем категории
+                invalidate('product', 'product:bulk')
+                Category.refresh_product_counts(affected)
+                _reindex_search(self._upserted_pks(objs, kwargs.get('unique_fields') or ()))
+            else:
+                invalidate_products(obj.pk for obj in objs if obj.pk)
+                Category.adjust_product_counts(Counter(obj.category_id for obj in objs))
+                _reindex_search([obj.pk for obj in objs if obj.pk])
+        return objs
+
+    def _upserted_pks(self, objs, unique_fields):
+        # Ленивый queryset: поисковый бэкенд читает его, только если ему нужны id
+        if len(unique_fields) != 1:
+            return [obj.pk for obj in objs if obj.pk]
+        field = unique_fields[0]
+        return self.filter(**{f'{field}__in': [getattr(obj, field) for obj in objs]}).values_list('pk', flat=True)
+
+    def _upsert_categories(self, objs, unique_fields):
+        # Категории, которые изменятся при upsert: новые и те, откуда товары уйдут
+        if len(unique_fields) != 1:
+            return None
+        field = unique_fields[0]
+        existing = (self.filter(**{f'{field}__in': [getattr(obj, field) for obj in objs]})
+                    .exclude(category__isnull=True).order_by().values_list('category_id', flat=True).distinct())
+        return {obj.category_id for obj in objs if obj.category_id} | set(existing)
+
+    def in_category(self, category):
+        """Товары категории и всех ее потомков: один запрос по префиксу Category.path."""
+        return self.filter(category__path__startswith=category.path)
+
+    def update(self, **kwargs):
+        # update() не отправляет сигналы — сбрасываем кэш каталога явно
+        invalidate_products(self.order_by().values_list('pk', flat=True)[:BULK_INVALIDATION_THRESHOLD + 1])
+        # Поисковый индекс — только если меняются проиндексированные поля; pk читаются до UPDATE,
+        # потому что после него фильтр queryset может уже не совпасть
+        reindexed = list(self.order_by().values_list('pk', flat=True)) if SEARCH_FIELDS & kwargs.keys() else None
+        if 'category' not in kwargs and 'category_id' not in kwargs:
+            rows = super().update(**kwargs)
+        else:
+            rows = self._update_category(reindexed, **kwargs)
+        if reindexed:
+            _reindex_search(reindexed)
+        return rows
+
+    def _update_category(self, pks, **kwargs):
+        with transaction.atomic(using=self.db):
+            affected = set(self.exclude(category__isnull=True).order_by()
+                           .values_list('category_id', flat=True).distinct())
+            new_category = kwargs.get('category', kwargs.get('category_id'))
+            if hasattr(new_category, 'resolve_expression'):
+                # Выражение (Case из bulk_update): новые категории известны только после UPDATE
+                rows = super().update(**kwargs)
+                affected.update(Product.objects.filter(pk__in=pks).exclude(category__isnull=True).order_by()
+                                .values_list('category_id', flat=True).distinct())
+            else:
+                rows = super().update(**kwargs)
+                if isinstance(new_category, Category):
+                    new_category = new_category.pk
+                if new_category is not None:
+                    affected.add(new_category)
+            Category.refresh_product_counts(affected)
+        return rows
+
 class Product(models.Model):
+    # Артикул поставщика — ключ для массового импорта (products.importer)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -34,23 +243,67 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     featured = models.BooleanField(default=False)
+    # Затухающая популярность по заказам (products.popularity); updated_at при пересчете не меняется
+    popularity = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - ${self.price:.2f}"
 
+    def save(self, *args, **kwargs):
+        # Счетчик категории обновляется в сигналах — в одной транзакции с самой записью
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     class Meta:
         ordering = ['name', '-stock', '-price']
+        # Индексы повторяют реальные запросы (проверяются EXPLAIN в QueryPlanTests);
+        # id в конце — tie-breaker курсорной пагинации (products.pagination)
+        indexes = [
+            # Каталог и api/products/: сортировка по умолчанию
+            models.Index(fields=['name', '-stock', '-price', 'id'], name='product_ordering_idx'),
+            # Каталог с фильтром по категории, страница категории
+            models.Index(fields=['category', 'name', '-stock', '-price', 'id'], name='product_cat_ordering_idx'),
+            # Сортировки каталога из products.sorting — без фильтра и внутри категории
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+            models.Index(fields=['-created_at', '-id'], name='product_newest_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_newest_idx'),
+            # Рекомендуемые (featured=True) по дате на главной
+            models.Index(fields=['-featured', '-created_at', '-id'], name='product_popular_idx'),
+            # Топ категории на главной (ROW_NUMBER по category)
+            models.Index(fields=['category', '-featured', '-created_at', '-id'], name='product_cat_rank_idx'),
+            # «popularity» и api/products/popular/; внутри категории
+            models.Index(fields=['-popularity', '-featured', '-created_at', '-id'], name='product_popularity_idx'),
+            models.Index(fields=['category', '-popularity', '-featured', '-created_at', '-id'],
+                         name='product_cat_popularity_idx'),
+            # api/products/featured/: рекомендуемые — малая доля каталога, поэтому частичный индекс
+            models.Index(fields=['name', '-stock', '-price'], condition=models.Q(featured=True),
+                         name='product_featured_order_idx'),
+            # Счетчики фасетов (products.facets): агрегат читает узкий индекс, а не строки таблицы;
+            # name в конце — для поиска по названию (?search=) без чтения строк
+            models.Index(fields=['category', 'price', 'stock', 'featured', 'name'], name='product_facets_idx'),
+            # Выгрузка с ?updated_since= (фильтр и сортировка)
+            models.Index(fields=['updated_at', 'id'], name='product_updated_at_idx'),
+        ]
 
     def is_in_stock(self):
         return self.stock > 0
 
     def decrease_stock(self, quantity):
-        if quantity > self.stock:
+        # Условный UPDATE вместо read-modify-write: параллельные покупки не уводят остаток в минус
+        updated = Product.objects.filter(pk=self.pk, stock__gte=quantity).update(
+            stock=models.F('stock') - quantity, updated_at=timezone.now())
+        if not updated:
             raise ValueError("Not enough stock")
-        self.stock -= quantity
-        self.save(update_fields=['stock', 'updated_at'])
+        self.refresh_from_db(fields=['stock', 'updated_at'])
 
     def get_absolute_url(self):
         from django.urls import reverse
@@ -61,11 +314,21 @@ class Product(models.Model):
         return self.image.url if self.image else ''
 
 class CartItem(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Ключ анонимной корзины (хранится в сессии), см. products.cart.DatabaseCart
+    cart_key = models.CharField(max_length=32, null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], condition=models.Q(user__isnull=False),
+                                    name='unique_user_cart_product'),
+            models.UniqueConstraint(fields=['cart_key', 'product'], condition=models.Q(cart_key__isnull=False),
+                                    name='unique_anonymous_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} of {self.product.name}"
 
@@ -78,6 +341,14 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     # Добавьте другие поля, такие как адрес доставки, статус заказа и т.д.
 
+    class Meta:
+        indexes = [
+            # История заказов пользователя, новые сверху. include — покрывающий индекс
+            # PostgreSQL: список читается только из индекса (в SQLite создается без include)
+            models.Index(fields=['user', '-created_at'], include=['id', 'total_price'],
+                         name='order_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -97,6 +368,55 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+class Job(models.Model):
+    """
+    Фоновая задача для products.jobs. Таблица служит очередью: воркер
+    (manage.py run_jobs) забирает строки в статусе pending условным UPDATE.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Владелец задачи — только он может смотреть ее статус
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='products_job_status_id_idx')]
+
+    def __str__(self):
+        return f"Job {self.id} {self.task} ({self.status})"
+
+
+class PopularityState(models.Model):
+    """
+    Состояние пересчета популярности (products.popularity), одна строка:
+    id последней учтенной позиции заказа (high-water mark) и момент, к
+    которому затухание уже применено.
+    """
+    last_order_item_id = models.PositiveBigIntegerField(default=0)
+    decayed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Popularity up to order item {self.last_order_item_id}"
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -105,3 +425,36 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+def _saves_category(update_fields):
+    # save(update_fields=...) принимает и имя поля, и attname
+    return update_fields is None or 'category' in update_fields or 'category_id' in update_fields
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_category_id = None
+    if raw or instance._state.adding or not _saves_category(update_fields):
+        return
+    instance._previous_category_id = (
+        Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+    )
+
+@receiver(post_save, sender=Product)
+def update_category_count_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        Category.adjust_product_counts({instance.category_id: 1})
+    elif instance._previous_category_id != instance.category_id and _saves_category(update_fields):
+        Category.adjust_product_counts(Counter({instance._previous_category_id: -1, instance.category_id: 1}))
+
+@receiver(post_delete, sender=Product)
+def update_category_count_on_delete(sender, instance, **kwargs):
+    Category.adjust_product_counts({instance.category_id: -1})
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is None:
+        return
+    from .cart import get_cart_backend
+    get_cart_backend().merge_on_login(request, user)
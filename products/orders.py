@@ -0,0 +1,65 @@
+"""
+История заказов пользователя: страницы по курсору и сводка для профиля.
+
+Страница — KeysetPaginator по (-created_at, -id) с LIMIT, позиции и их
+товары подгружаются одним prefetch-запросом на страницу, поэтому цена
+страницы не зависит от числа заказов покупателя.
+
+Сводка (число заказов, сумма за все время, последний заказ) — один агрегат
+по индексу order_user_created_idx. Она кэшируется в catalog_cache по
+пользователю (пространство имен 'orders:<id>'), а сигналы Order
+(products.cache) сбрасывают ее после коммита, так что агрегат по всем
+заказам считается один раз после каждого нового заказа, а не на каждый
+показ профиля; у покупателя, чьи заказы умещаются на первую страницу, и этого
+запроса нет.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Max, Prefetch, Sum
+
+from .cache import catalog_cache
+from .models import Order, OrderItem
+from .pagination import InvalidCursor, KeysetPaginator
+from .settings import ORDER_HISTORY_PAGE_SIZE
+
+ORDER_ORDERING = ('-created_at', '-id')
+
+
+def order_summary(user, page=None):
+    """
+    {'count', 'total_spent', 'last_order_id', 'last_order_at'} одним запросом,
+    из кэша. Если уже прочитанная первая страница page (order_page) содержит
+    все заказы пользователя, сводка считается по ней без запроса.
+    """
+    if page is not None and not page.has_next() and not page.has_previous():
+        orders = list(page)
+        return {
+            'count': len(orders),
+            'total_spent': sum((order.total_price for order in orders), Decimal('0.00')),
+            'last_order_id': max((order.id for order in orders), default=None),
+            'last_order_at': max((order.created_at for order in orders), default=None),
+        }
+
+    def load():
+        summary = Order.objects.filter(user=user).order_by().aggregate(
+            count=Count('id'), total_spent=Sum('total_price'),
+            last_order_id=Max('id'), last_order_at=Max('created_at'))
+        summary['total_spent'] = summary['total_spent'] or Decimal('0.00')
+        return summary
+
+    return catalog_cache.get_or_set('order_summary', load, {'user': user.pk},
+                                    dependencies=(f'orders:{user.pk}',))
+
+
+def user_orders(user):
+    items = OrderItem.objects.select_related('product').order_by('id')
+    return Order.objects.filter(user=user).prefetch_related(Prefetch('items', queryset=items))
+
+
+def order_page(user, cursor=None, per_page=ORDER_HISTORY_PAGE_SIZE):
+    """Страница заказов, новые сверху; неверный курсор дает первую страницу."""
+    paginator = KeysetPaginator(user_orders(user), per_page, ordering=ORDER_ORDERING)
+    try:
+        return paginator.get_page(cursor)
+    except InvalidCursor:
+        return paginator.get_page()
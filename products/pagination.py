@@ -0,0 +1,217 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.query import ValuesListIterable
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """
+    Одна страница keyset-пагинации. Повторяет ту часть API
+    django.core.paginator.Page, которую используют шаблоны.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def __getstate__(self):
+        # Страница кэшируется (products.cache) без paginator: иначе pickle вычислит его queryset
+        return {**self.__dict__, 'paginator': None}
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу сортировки вместо OFFSET/COUNT(*).
+
+    Каждая страница — это один запрос ``WHERE (ключ) > (последний ключ)
+    ORDER BY ключ LIMIT per_page + 1``, поэтому страница N стоит столько же,
+    сколько страница 1. Поля сортировки должны быть NOT NULL; первичный ключ
+    добавляется в конец, чтобы порядок был строгим.
+    """
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.model = object_list.model
+        if ordering is None:
+            ordering = object_list.query.order_by or self.model._meta.ordering
+        ordering = list(ordering)
+        if not any(name.lstrip('-') in ('pk', self.model._meta.pk.name) for name in ordering):
+            ordering.append(self.model._meta.pk.name)
+        self.ordering = ordering
+        self._keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self._positions = None
+        if object_list._iterable_class is ValuesListIterable:
+            # Строки — кортежи values_list(): поля ключа добавляются в конец, если их нет
+            fields = list(object_list._fields)
+            fields += [name for name, _ in self._keys if name not in fields]
+            self.object_list = object_list.values_list(*fields)
+            self._positions = {name: index for index, name in enumerate(fields)}
+
+    def _field(self, name):
+        if name == 'pk':
+            return self.model._meta.pk
+        return self.model._meta.get_field(name)
+
+    def _key_values(self, obj):
+        if self._positions is not None:
+            return [obj[self._positions[name]] for name, _ in self._keys]
+        return [getattr(obj, name) for name, _ in self._keys]
+
+    def encode_cursor(self, obj, direction):
+        # DjangoJSONEncoder обрезает время до миллисекунд — тогда строки из той же
+        # миллисекунды, что и граница страницы, пропускались бы
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in self._key_values(obj)]
+        payload = json.dumps({'d': direction, 'k': values},
+                             cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, values = payload['d'], payload['k']
+            if direction not in ('n', 'p') or len(values) != len(self._keys):
+                raise ValueError(cursor)
+            values = [self._field(name).to_python(value)
+                      for (name, _), value in zip(self._keys, values)]
+        except Exception as e:
+            raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+        return direction, values
+
+    def _keyset_filter(self, values, forward):
+        # (a, b, c) > (x, y, z)  ==>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        # Для полей с обратной сортировкой сравнение меняется на противоположное.
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._keys, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def _page_query(self, cursor):
+        # Запрос страницы (с одной лишней строкой) и направление курсора
+        queryset = self.object_list
+        if not cursor:
+            return queryset.order_by(*self.ordering)[:self.per_page + 1], None
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'n':
+            queryset = queryset.filter(self._keyset_filter(values, forward=True)).order_by(*self.ordering)
+        else:
+            queryset = queryset.filter(self._keyset_filter(values, forward=False)).order_by(*self._reversed_ordering())
+        return queryset[:self.per_page + 1], direction
+
+    def get_page(self, cursor=None):
+        queryset, direction = self._page_query(cursor)
+        return self._make_page(list(queryset), direction)
+
+    async def aget_page(self, cursor=None):
+        queryset, direction = self._page_query(cursor)
+        return self._make_page([obj async for obj in queryset], direction)
+
+    def _make_page(self, rows, direction):
+        if direction == 'p':
+            has_next, has_previous = True, len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+        else:
+            has_next, has_previous = len(rows) > self.per_page, direction == 'n'
+            rows = rows[:self.per_page]
+
+        next_cursor = self.encode_cursor(rows[-1], 'n') if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], 'p') if rows and has_previous else None
+        return KeysetPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF-обертка над KeysetPaginator. Ответ: {"next", "previous", "results"}.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(request), ordering=self.ordering)
+        try:
+            self.page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,119 @@
+"""
+Популярность товаров и категорий по заказам.
+
+Счет — сумма количеств в позициях заказов, каждая с весом
+0.5 ** (возраст / POPULARITY_HALF_LIFE): при периоде полураспада в неделю
+заказ месячной давности весит примерно 1/16 сегодняшнего. Счет категории —
+сумма по ее товарам (без подкатегорий).
+
+Пересчет инкрементальный (manage.py update_popularity по расписанию или
+задача products.tasks.refresh_popularity):
+
+- затухание: накопленные счета умножаются на общий множитель за время с
+  прошлого запуска — UPDATE по ненулевым строкам, без чтения;
+- новые позиции заказов читаются после high-water mark
+  (PopularityState.last_order_item_id) по возрастанию id, и их вес
+  добавляется UPDATE ... CASE пачками по POPULARITY_BATCH_SIZE строк.
+
+Позиции заказов моложе POPULARITY_COMMIT_LAG секунд откладываются до
+следующего запуска: id выдается до коммита, и заказ из еще открытой
+транзакции с меньшим id иначе оказался бы ниже отметки и не был бы учтен.
+
+Списки «популярное» (api/products/popular/, api/categories/popular/,
+сортировка каталога 'popularity', Category.Meta.ordering) читают готовые
+поля popularity — без агрегатов по заказам во время запроса.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.lookups import LessThan
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import Category, OrderItem, PopularityState, Product
+from .settings import (POPULARITY_BATCH_SIZE, POPULARITY_COMMIT_LAG, POPULARITY_HALF_LIFE,
+                       POPULARITY_MIN_SCORE)
+
+
+def decay_factor(seconds):
+    return 0.5 ** (max(seconds, 0) / POPULARITY_HALF_LIFE)
+
+
+def _decay(model, factor, **fields):
+    # Остатки давних заказов ниже порога обнуляются и больше не затрагиваются затуханием
+    score = F('popularity') * factor
+    decayed = Case(When(LessThan(score, POPULARITY_MIN_SCORE), then=Value(0.0)),
+                   default=score, output_field=FloatField())
+    return model.objects.filter(popularity__gt=0).update(popularity=decayed, **fields)
+
+
+def _add_scores(model, scores, **fields):
+    items = sorted(scores.items())
+    for start in range(0, len(items), POPULARITY_BATCH_SIZE):
+        batch = items[start:start + POPULARITY_BATCH_SIZE]
+        increment = Case(*(When(pk=pk, then=Value(score)) for pk, score in batch),
+                         default=Value(0.0), output_field=FloatField())
+        model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            popularity=F('popularity') + increment, **fields)
+
+
+def collect_scores(after_id, now):
+    """
+    Вес новых позиций заказов (id > after_id) по товарам и категориям.
+    Возвращает (счета товаров, счета категорий, последний учтенный id, число позиций).
+    """
+    horizon = now - timedelta(seconds=POPULARITY_COMMIT_LAG)
+    products, categories = defaultdict(float), defaultdict(float)
+    last_id, count = after_id, 0
+    items = (OrderItem.objects.filter(id__gt=after_id).order_by('id')
+             .values_list('id', 'product_id', 'product__category_id', 'quantity', 'order__created_at'))
+    for item_id, product_id, category_id, quantity, created_at in items.iterator(chunk_size=POPULARITY_BATCH_SIZE):
+        if created_at > horizon:
+            # Отметка не должна перепрыгнуть заказы, которые могут быть еще не закоммичены
+            break
+        weight = quantity * decay_factor((now - created_at).total_seconds())
+        products[product_id] += weight
+        if category_id is not None:
+            categories[category_id] += weight
+        last_id, count = item_id, count + 1
+    return products, categories, last_id, count
+
+
+def update_popularity(now=None):
+    """
+    Применяет затухание с прошлого запуска и добавляет новые заказы.
+    Параллельные запуски сериализуются блокировкой строки состояния.
+    Возвращает статистику для лога или результата задачи.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        state, _ = PopularityState.objects.select_for_update().get_or_create(pk=1)
+        decayed = {'products': 0, 'categories': 0}
+        if state.decayed_at is not None and now > state.decayed_at:
+            factor = decay_factor((now - state.decayed_at).total_seconds())
+            decayed = {'products': _decay(Product, factor), 'categories': _decay(Category, factor, updated_at=now)}
+
+        products, categories, last_id, count = collect_scores(state.last_order_item_id, now)
+        _add_scores(Product, products)
+        # updated_at категорий меняется вместе с порядком — от него зависят ETag списков (products.conditional)
+        _add_scores(Category, categories, updated_at=now)
+
+        state.last_order_item_id = last_id
+        state.decayed_at = now
+        state.save()
+        # Кэш товаров сбрасывает ProductQuerySet.update(), категорий — только явно
+        if decayed['categories'] or categories:
+            invalidate('category')
+    return {'order_items': count, 'products': len(products), 'categories': len(categories),
+            'decayed': decayed, 'last_order_item_id': last_id}
+
+
+def reset_popularity():
+    """Обнуляет счета и отметку: следующий update_popularity() пересчитает все заказы."""
+    with transaction.atomic():
+        Product.objects.exclude(popularity=0).update(popularity=0)
+        Category.objects.exclude(popularity=0).update(popularity=0, updated_at=timezone.now())
+        PopularityState.objects.update_or_create(pk=1, defaults={'last_order_item_id': 0, 'decayed_at': None})
+        invalidate('category')
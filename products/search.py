@@ -0,0 +1,246 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Category, Product
+from .settings import SEARCH_MAX_RESULTS
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class SearchBackend:
+    """
+    Интерфейс поиска товаров. search() возвращает id товаров, отсортированные
+    по релевантности; index()/remove() вызываются после сохранения и удаления
+    товара, reindex() — после массовых операций без сигналов (bulk_create,
+    upsert импорта, QuerySet.update); все — после коммита транзакции.
+    """
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        raise NotImplementedError
+
+    def index(self, product):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+    def reindex_category(self, category):
+        pass
+
+    def reindex(self, product_ids):
+        pass
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Полнотекстовый поиск PostgreSQL: хранимая генерируемая колонка
+    products_product.search_vector (name с весом A, description с весом B)
+    с GIN-индексом, ранжирование через ts_rank. Колонку создает миграция
+    0015, поэтому отдельная индексация при сохранении не нужна.
+    """
+    config = 'english'
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        # Импорт внутри метода: модуль требует psycopg и не нужен на SQLite
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
+        from django.db.models import F, Q
+        from django.db.models.expressions import RawSQL
+
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        vector = RawSQL(f'{Product._meta.db_table}.search_vector', (), output_field=SearchVectorField())
+        matching_categories = Category.objects.annotate(
+            search=SearchVector('name', config=self.config)
+        ).filter(search=search_query).values('pk')
+        return list(
+            Product.objects.annotate(search=vector)
+            .filter(Q(search=search_query) | Q(category__in=matching_categories))
+            .annotate(rank=SearchRank(F('search'), search_query))
+            .order_by('-rank', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+
+
+class InvertedIndexBackend(SearchBackend):
+    """
+    Инвертированный индекс в памяти процесса для SQLite и разработки.
+
+    Строится лениво при первом запросе, дальше обновляется сигналами.
+    Ранжирование — TF-IDF с весами полей (name > category > description).
+    Все слова запроса должны встретиться; последнее слово ищется и как префикс.
+    Индекс свой у каждого процесса, поэтому для продакшена нужен PostgreSQL.
+    """
+    field_weights = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+    max_prefix_expansions = 50
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._postings = defaultdict(dict)  # token -> {product_id: weight}
+            self._documents = {}                # product_id -> set(tokens)
+            self._vocabulary = []               # отсортированные токены для поиска по префиксу
+            self._built = False
+
+    def _document_weights(self, name, description, category_name):
+        weights = defaultdict(float)
+        for field, text in (('name', name), ('description', description), ('category', category_name)):
+            for token in tokenize(text):
+                weights[token] += self.field_weights[field]
+        return weights
+
+    def _add(self, product_id, name, description, category_name):
+        self._discard(product_id)
+        weights = self._document_weights(name, description, category_name)
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if not postings:
+                bisect.insort(self._vocabulary, token)
+            postings[product_id] = weight
+        self._documents[product_id] = set(weights)
+
+    def _discard(self, product_id):
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            rows = Product.objects.order_by().values_list('id', 'name', 'description', 'category__name')
+            for row in rows.iterator(chunk_size=2000):
+                self._add(*row)
+            self._built = True
+
+    def _expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        tokens = []
+        for token in self._vocabulary[start:start + self.max_prefix_expansions]:
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._ensure_built()
+        with self._lock:
+            total = max(len(self._documents), 1)
+            scores = None
+            for position, term in enumerate(terms):
+                term_scores = defaultdict(float)
+                for token in self._expand(term, prefix=position == len(terms) - 1):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total / len(postings))
+                    for product_id, weight in postings.items():
+                        term_scores[product_id] += weight * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pid: score + term_scores[pid] for pid, score in scores.items() if pid in term_scores}
+                if not scores:
+                    return []
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked]
+
+    def index(self, product):
+        if not self._built:
+            return
+        category_name = product.category.name if product.category_id else ''
+        with self._lock:
+            self._add(product.id, product.name, product.description, category_name)
+
+    def remove(self, product_id):
+        if not self._built:
+            return
+        with self._lock:
+            self._discard(product_id)
+
+    def reindex_category(self, category):
+        if not self._built:
+            return
+        rows = category.products.order_by().values_list('id', 'name', 'description')
+        with self._lock:
+            for product_id, name, description in rows.iterator(chunk_size=2000):
+                self._add(product_id, name, description, category.name)
+
+    def reindex(self, product_ids):
+        if not self._built:
+            return
+        # product_ids может быть ленивым queryset: читается, только если индекс уже построен
+        product_ids = list(product_ids)
+        rows = (Product.objects.filter(pk__in=product_ids).order_by()
+                .values_list('id', 'name', 'description', 'category__name'))
+        with self._lock:
+            for product_id in product_ids:
+                self._discard(product_id)
+            for row in rows.iterator(chunk_size=2000):
+                self._add(*row)
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Бэкенд из settings.SEARCH_BACKEND, по умолчанию — по типу базы данных."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path is None:
+            backend_class = PostgresSearchBackend if connection.vendor == 'postgresql' else InvertedIndexBackend
+        else:
+            backend_class = import_string(path)
+        _backend = backend_class()
+    return _backend
+
+
+def search_products(query, limit=SEARCH_MAX_RESULTS):
+    return get_search_backend().search(query, limit=limit)
+
+
+def reindex_products(product_ids):
+    """Переиндексация после массовой операции, обошедшей сигналы (products.models.ProductQuerySet)."""
+    transaction.on_commit(lambda: get_search_backend().reindex(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: get_search_backend().index(instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove(product_id))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        transaction.on_commit(lambda: get_search_backend().reindex_category(instance))
@@ -1,24 +1,60 @@
+from decimal import Decimal
+
 from rest_framework import serializers
+from .fastjson import Field, Nested, RowSchema
 from .models import Product, Category
 import logging
 
 logger = logging.getLogger(__name__)
 
-class CategorySerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    """
+    Сериализатор сам объявляет, какие связи и колонки ему нужны:
+
+        class Meta:
+            select_related = ['category']
+            prefetch_related = []
+            only = ['id', 'name', 'category__id', 'category__name']
+
+    setup_eager_loading(queryset) применяет эти объявления, поэтому список
+    из N объектов сериализуется за фиксированное число запросов, а не N + 1.
+    """
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        meta = getattr(cls, 'Meta', None)
+        select_related = getattr(meta, 'select_related', None)
+        prefetch_related = getattr(meta, 'prefetch_related', None)
+        only = getattr(meta, 'only', None)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if only:
+            queryset = queryset.only(*only)
+        return queryset
+
+class CategorySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     product_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'product_count', 'image']
+        only = ['id', 'name', 'description', 'product_count', 'image']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     category_id = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), source='category')
     category_name = serializers.CharField(source='category.name', read_only=True)
     image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'category_id', 'category_name', 'image', 'featured', 'image_url']
+        fields = ['id', 'sku', 'name', 'description', 'price', 'category_id', 'category_name', 'image', 'featured',
+                  'image_url']
+        select_related = ['category']
+        # stock нужен курсору пагинации (сортировка name, -stock, -price, id)
+        only = ['id', 'sku', 'name', 'description', 'price', 'stock', 'image', 'featured',
+                'category__id', 'category__name']
 
     def create(self, validated_data):
         logger.info(f"Creating product with data: {validated_data}")
@@ -36,4 +72,53 @@ class ProductSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if obj.image:
             return request.build_absolute_uri(obj.image.url)
-        return ''
\ No newline at end of file
+        return ''
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    Строка массового импорта (products.importer). Только проверка полей,
+    без запросов к базе: категория передается по имени и ищется по общей
+    для всей пачки карте, уникальность sku обеспечивает upsert.
+    """
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    stock = serializers.IntegerField(required=False, min_value=0)
+    featured = serializers.BooleanField(required=False)
+    category = serializers.CharField(required=False, allow_blank=True, max_length=255)
+
+
+# Быстрый путь (products.fastjson): те же ответы, что у ProductSerializer и
+# ручных словарей в представлениях, но из кортежей values_list()
+PRODUCT_ROW = RowSchema('product', [
+    Field('id', 'id'),
+    Field('sku', 'sku'),
+    Field('name', 'name'),
+    Field('description', 'description'),
+    Field('price', 'price', 'decimal'),
+    Field('category_id', 'category_id'),
+    Field('category_name', 'category__name'),
+    Field('image', 'image', 'file'),
+    Field('featured', 'featured'),
+    Field('image_url', 'image', 'file_or_blank'),
+    Nested('category', [Field('id', 'category_id'), Field('name', 'category__name')], null_if='category_id'),
+], storage=Product._meta.get_field('image').storage)
+
+FEATURED_PRODUCT_ROW = RowSchema('featured_product', [
+    Field('id', 'id'),
+    Field('name', 'name'),
+    Field('description', 'description'),
+    Field('price', 'price', 'decimal'),
+    Field('image', 'image', 'file'),
+], storage=Product._meta.get_field('image').storage)
+
+CATEGORY_ROW = RowSchema('category', [Field('id', 'id'), Field('name', 'name')])
+
+# Популярное (products.popularity): те же поля плюс готовый счет
+POPULAR_PRODUCT_ROW = RowSchema('popular_product', [
+    *FEATURED_PRODUCT_ROW.fields,
+    Field('popularity', 'popularity'),
+], storage=Product._meta.get_field('image').storage)
+
+POPULAR_CATEGORY_ROW = RowSchema('popular_category', [*CATEGORY_ROW.fields, Field('popularity', 'popularity')])
@@ -1,2 +1,90 @@
+from decimal import Decimal
+
 FEATURED_PRODUCTS_COUNT = 6
-POPULAR_CATEGORIES_COUNT = 5
\ No newline at end of file
+POPULAR_CATEGORIES_COUNT = 5
+POPULAR_PRODUCTS_COUNT = 8
+TAX_RATE = Decimal('0.10')
+SEARCH_MAX_RESULTS = 1000
+# Пакетный эндпоинт корзины (cart/batch/): операций в одном запросе
+CART_BATCH_MAX_OPERATIONS = 100
+
+# История заказов (products.orders): заказов на странице истории и в профиле
+ORDER_HISTORY_PAGE_SIZE = 20
+PROFILE_RECENT_ORDERS = 5
+
+# Кэш каталога (products.cache): алиас из settings.CACHES, TTL в секундах, размер LRU процесса
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+CATALOG_CACHE_LOCAL_SIZE = 1024
+
+# Главная страница (products.feed): секции строятся по порядку, каждая — один запрос с LIMIT
+HOME_CATEGORIES_COUNT = 6
+HOME_FEED_SECTIONS = [
+    {'type': 'featured', 'title': 'Featured Products', 'limit': 8},
+    {'type': 'newest', 'title': 'New Arrivals', 'limit': 8},
+    {'type': 'category_top', 'title': 'Top in {category}', 'categories': 3, 'limit': 4},
+]
+
+# Копии изображений (products.images): ширины для srcset, форматы по убыванию приоритета,
+# через сколько секунд снова искать в хранилище манифест еще не обработанного изображения
+IMAGE_RENDITION_WIDTHS = (200, 400, 800)
+IMAGE_RENDITION_FORMATS = ('avif', 'webp', 'jpg')
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_RENDITION_RECHECK = 60
+
+# Фоновые задачи (products.jobs): число попыток, через сколько секунд задача
+# в статусе running считается зависшей, пауза воркера при пустой очереди
+JOB_MAX_ATTEMPTS = 3
+JOB_STALE_AFTER = 600
+JOB_POLL_INTERVAL = 1.0
+
+# Популярность (products.popularity): период полураспада веса заказа в секундах, позиций заказов
+# на одно чтение и строк на один UPDATE, сколько секунд ждать коммита свежих заказов
+# и счет, ниже которого популярность обнуляется
+POPULARITY_HALF_LIFE = 7 * 24 * 3600
+POPULARITY_BATCH_SIZE = 1000
+POPULARITY_COMMIT_LAG = 60
+POPULARITY_MIN_SCORE = 0.01
+
+# Потоковая выгрузка каталога (products.export): строк на одно чтение из базы и на один кусок ответа
+EXPORT_CHUNK_SIZE = 2000
+
+# Массовый импорт товаров (products.importer): строк на одну проверку и один upsert
+IMPORT_BATCH_SIZE = 1000
+
+# Фасеты каталога (products.facets): ценовые диапазоны (ключ, подпись, от, до) — нижняя граница включительно
+PRICE_BUCKETS = [
+    ('under-10', 'Under $10', None, Decimal('10')),
+    ('10-50', '$10 - $50', Decimal('10'), Decimal('50')),
+    ('50-100', '$50 - $100', Decimal('50'), Decimal('100')),
+    ('100-plus', '$100 and up', Decimal('100'), None),
+]
+
+# Замеры запросов (products.metrics): сколько последних запросов каждого представления
+# хранить для перцентилей и бюджеты SQL-запросов GET-запроса по имени URL — при превышении
+# предупреждение в лог, а с settings.QUERY_BUDGET_STRICT (тесты) — ошибка. Бюджет — худший
+# случай: холодный кэш каталога и первый показ после изменения корзины (пересчет итогов)
+METRICS_SAMPLE_SIZE = 1000
+QUERY_BUDGETS = {
+    'home': 8,
+    'products_list': 7,
+    'product_detail_view': 4,
+    'category_filter_view': 4,
+    'category_detail_view': 9,
+    'cart_view': 5,
+    'profile': 7,
+    'order_history': 6,
+    'search': 5,
+    'product_list_api': 5,
+    'product_facets_api': 4,
+    'product_detail_api': 5,
+    'api_categories_list': 2,
+    'api_featured_products': 1,
+    'api_popular_products': 1,
+    'api_popular_categories': 1,
+    'product_detail_view_async': 4,
+    'search_async': 5,
+    'product_list_api_async': 4,
+    'api_categories_list_async': 1,
+    'api_featured_products_async': 1,
+}
@@ -0,0 +1,30 @@
+"""
+Допустимые сортировки каталога. Публичный ключ (?sort=) отображается в
+порядок, который обслуживает индекс Product.Meta.indexes — и без фильтра,
+и с фильтром по категории (индекс с category впереди). Последнее поле — id:
+порядок строгий, как нужно курсорной пагинации.
+"""
+
+PRODUCT_SORTS = {
+    'name': {'label': 'Name (A-Z)', 'ordering': ('name', '-stock', '-price', 'id')},
+    # Обратный проход по тем же индексам, что и 'name'
+    '-name': {'label': 'Name (Z-A)', 'ordering': ('-name', 'stock', 'price', '-id')},
+    'price': {'label': 'Price (Low to High)', 'ordering': ('price', 'id')},
+    '-price': {'label': 'Price (High to Low)', 'ordering': ('-price', '-id')},
+    'newest': {'label': 'Newest', 'ordering': ('-created_at', '-id')},
+    # Счет по заказам (products.popularity); при равном счете — рекомендуемые, затем новые
+    'popularity': {'label': 'Popularity', 'ordering': ('-popularity', '-featured', '-created_at', '-id')},
+}
+
+DEFAULT_PRODUCT_SORT = 'name'
+
+
+def resolve_sort(key):
+    """Возвращает (ключ, ordering); неизвестный ключ заменяется сортировкой по умолчанию."""
+    if key not in PRODUCT_SORTS:
+        key = DEFAULT_PRODUCT_SORT
+    return key, PRODUCT_SORTS[key]['ordering']
+
+
+def sort_choices():
+    return [(key, option['label']) for key, option in PRODUCT_SORTS.items()]
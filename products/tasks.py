@@ -0,0 +1,55 @@
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .images import build_renditions
+from .jobs import task
+from .models import Profile
+from .popularity import update_popularity
+
+AVATAR_SIZE = 200
+
+
+@task
+def process_avatar(profile_id, upload_name):
+    """
+    Обрезает загруженный аватар до квадрата, уменьшает до 200x200,
+    сохраняет в JPEG и удаляет временный файл загрузки.
+    """
+    profile = Profile.objects.select_related('user').get(id=profile_id)
+    with default_storage.open(upload_name, 'rb') as upload:
+        image = ImageOps.exif_transpose(Image.open(upload))
+        size = min(image.size)
+        crop = ((image.size[0] - size) // 2,
+                (image.size[1] - size) // 2,
+                (image.size[0] + size) // 2,
+                (image.size[1] + size) // 2)
+        image = image.crop(crop).resize((AVATAR_SIZE, AVATAR_SIZE), Image.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=85)
+
+    profile.avatar.save(f"{profile.user.username}_avatar.jpg", ContentFile(output.getvalue()))
+    default_storage.delete(upload_name)
+    return {'avatar_url': profile.avatar.url}
+
+
+@task
+def process_image_renditions(model, pk, field='image'):
+    """Создает копии изображения (products.images) для объекта model ('products.product')."""
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    image = getattr(instance, field)
+    manifest = build_renditions(image)
+    return {'image': image.name, 'formats': sorted(manifest)} if manifest else None
+
+
+@task
+def refresh_popularity():
+    """Инкрементальный пересчет популярности (products.popularity)."""
+    return update_popularity()
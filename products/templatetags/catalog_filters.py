@@ -0,0 +1,23 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def toggle_query(context, name, value=None):
+    """
+    Строка запроса текущей страницы с другим значением параметра и без курсора:
+
+        {% load catalog_filters %}
+        <a href="?{% toggle_query 'price' bucket.value %}">
+
+    Повторный выбор текущего значения (или value=None) снимает параметр.
+    """
+    params = context['request'].GET.copy()
+    params.pop('cursor', None)
+    value = '' if value is None else str(value)
+    if not value or params.get(name) == value:
+        params.pop(name, None)
+    else:
+        params[name] = value
+    return params.urlencode()
@@ -0,0 +1,37 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from products.images import FORMATS, get_renditions
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(f'{url} {width}w' for width, url in variants)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes='100vw', style=''):
+    """
+    <picture> с AVIF/WebP/JPEG копиями и srcset вместо оригинала:
+
+        {% load product_images %}
+        {% responsive_image product.image alt=product.name css_class="card-img-top" sizes="33vw" %}
+    """
+    manifest = get_renditions(image, generate=False)
+    if not manifest:
+        # Копии создаст воркер (задачу ставит post_save), до тех пор — оригинал
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">',
+                           image.url, alt, css_class, style)
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((FORMATS[ext][1], _srcset(variants), sizes) for ext, variants in manifest.items() if ext != 'jpg'),
+    )
+    fallback = manifest.get('jpg') or next(iter(manifest.values()))
+    width, src = fallback[len(fallback) // 2]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" '
+        'loading="lazy" decoding="async"></picture>',
+        sources, src, _srcset(fallback), sizes, alt, css_class, style,
+    )
@@ -1,3 +1,2054 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .cache import catalog_cache
+from .cart import Cart, DatabaseCart, SessionCart
+from .checkout import EmptyCart, InsufficientStock, place_order
+from .benchmark import BASE_SCALE, SCENARIOS, generate_data, http_load
+from .export import export_rows, stream_json_array
+from .facets import apply_filters, catalog_facets, parse_filters
+from .fastjson import Field, RowSchema, dumps
+from .feed import build_home_feed
+from .images import build_renditions, get_renditions
+from .importer import ImportFormatError, import_products, read_rows
+from .jobs import claim_jobs, enqueue, run_pending, task as jobs_task
+from .metrics import QueryBudgetExceeded, percentiles, store as metrics_store
+from .models import CartItem, Category, Job, Order, OrderItem, PopularityState, Product, Profile
+from .orders import order_page, order_summary
+from .pagination import InvalidCursor, KeysetPaginator
+from .popularity import decay_factor, reset_popularity, update_popularity
+from .search import InvertedIndexBackend
+from .serializers import PRODUCT_ROW, ProductSerializer
+from .sorting import PRODUCT_SORTS
+from .settings import (
+    JOB_MAX_ATTEMPTS, JOB_STALE_AFTER, ORDER_HISTORY_PAGE_SIZE, POPULARITY_HALF_LIFE, PROFILE_RECENT_ORDERS,
+    QUERY_BUDGETS,
+)
+from .views import category_list_api
+
+
+def clear_catalog_cache():
+    caches[catalog_cache.alias].clear()
+    catalog_cache.clear_local()
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Fruit', description='Fresh fruit')
+        # Повторяющиеся имена и остатки проверяют tie-breaker по -stock, -price, id
+        for i in range(25):
+            Product.objects.create(
+                name=f'Product {i % 7}',
+                description='test',
+                price=Decimal(i % 4) + Decimal('0.50'),
+                stock=i % 3,
+                category=cls.category,
+            )
+
+    def setUp(self):
+        clear_catalog_cache()
+
+    def expected(self):
+        return list(Product.objects.order_by('name', '-stock', '-price', 'id').values_list('id', flat=True))
+
+    def test_forward_walk_returns_every_row_once_in_order(self):
+        paginator = KeysetPaginator(Product.objects.all(), 4)
+        page = paginator.get_page()
+        seen = [p.id for p in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(p.id for p in page)
+        self.assertEqual(seen, self.expected())
+
+    def test_backward_walk_mirrors_forward_walk(self):
+        paginator = KeysetPaginator(Product.objects.all(), 4)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual([p.id for p in page], [p.id for p in expected])
+        self.assertFalse(page.has_previous())
+
+    def test_each_page_is_a_single_query(self):
+        paginator = KeysetPaginator(Product.objects.all(), 4)
+        cursor = paginator.get_page().next_cursor
+        with self.assertNumQueries(1):
+            list(paginator.get_page(cursor))
+
+    def test_datetime_keys_keep_microseconds(self):
+        # Время в одной миллисекунде: курсор не должен пропускать соседние строки
+        moment = timezone.now().replace(microsecond=500100)
+        for i, pk in enumerate(self.expected()):
+            Product.objects.filter(pk=pk).update(created_at=moment + timedelta(microseconds=i % 5))
+        paginator = KeysetPaginator(Product.objects.all(), 4, ordering=('-created_at', '-id'))
+        page = paginator.get_page()
+        seen = [p.id for p in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(p.id for p in page)
+        self.assertEqual(seen, list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Product.objects.all(), 4)
+        with self.assertRaises(InvalidCursor):
+            paginator.get_page('not-a-cursor')
+
+    def test_product_list_api_is_paginated(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+        url = reverse('product_list_api')
+        response = self.client.get(url, {'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['previous'])
+
+        response = self.client.get(url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_list_view_uses_cursor(self):
+        response = self.client.get(reverse('products_list'))
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 9)
+        response = self.client.get(reverse('products_list'), {'cursor': page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['page_obj'].has_previous())
+
+
+class EagerLoadingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.categories = [
+            Category.objects.create(name=f'Category {i}', description='test') for i in range(3)
+        ]
+
+    def create_products(self, count):
+        Product.objects.bulk_create([
+            Product(name=f'Item {i}', description='test', price=Decimal('1.00'),
+                    category=self.categories[i % len(self.categories)])
+            for i in range(count)
+        ])
+
+    def count_queries(self, url, params=None):
+        # bulk_create сбрасывает кэш каталога только после коммита, которого в TestCase нет
+        clear_catalog_cache()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_serializer_list_is_one_query(self):
+        self.create_products(30)
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.all())
+        with self.assertNumQueries(1):
+            data = ProductSerializer(queryset, many=True, context={'request': None}).data
+        self.assertEqual(len(data), 30)
+        self.assertEqual(data[0]['category']['name'], data[0]['category_name'])
+
+    def test_product_list_api_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        url = reverse('product_list_api')
+        self.create_products(2)
+        small = self.count_queries(url, {'page_size': 100})
+        self.create_products(60)
+        large = self.count_queries(url, {'page_size': 100})
+        self.assertEqual(small, large)
+
+    def test_category_list_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.create_products(3)
+        html_small = self.count_queries(reverse('category_filter_view'))
+        for i in range(10):
+            Category.objects.create(name=f'Extra {i}', description='test')
+        self.create_products(20)
+        self.assertEqual(html_small, self.count_queries(reverse('category_filter_view')))
+
+
+class DatabaseCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.apple = Product.objects.create(name='Apple', description='test', price=Decimal('2.50'), stock=10)
+        cls.pear = Product.objects.create(name='Pear', description='test', price=Decimal('4.00'), stock=10)
+
+    def make_cart(self, user=None):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = user or AnonymousUser()
+        return DatabaseCart(request), request
+
+    def test_add_is_an_upsert(self):
+        cart, _ = self.make_cart(self.user)
+        cart.add(self.apple, 2)
+        cart.add(self.apple, 3)
+        cart.add(self.pear)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(len(cart), 6)
+        self.assertAlmostEqual(cart.get_total_price(), 16.5)
+
+        cart.add(self.apple, 1, update_quantity=True)
+        cart.update(self.pear.id, 4)
+        self.assertEqual(len(cart), 5)
+        cart.remove(self.apple)
+        self.assertEqual([item['product']['id'] for item in cart], [self.pear.id])
+        cart.clear()
+        self.assertEqual(len(cart), 0)
+
+    def test_cart_factory_uses_configured_backend(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = AnonymousUser()
+        with self.settings(CART_BACKEND='products.cart.SessionCart'):
+            self.assertIsInstance(Cart(request), SessionCart)
+        with self.settings(CART_BACKEND='products.cart.DatabaseCart'):
+            self.assertIsInstance(Cart(request), DatabaseCart)
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        CartItem.objects.create(user=self.user, product=self.apple, quantity=1)
+        with self.settings(CART_BACKEND='products.cart.DatabaseCart'):
+            self.client.post(reverse('add_to_cart', args=[self.apple.id]), '{"quantity": 2}',
+                             content_type='application/json')
+            self.client.post(reverse('add_to_cart', args=[self.pear.id]), '{"quantity": 1}',
+                             content_type='application/json')
+            self.assertEqual(CartItem.objects.filter(user__isnull=True).count(), 2)
+
+            self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret'})
+
+        items = dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(items, {self.apple.id: 3, self.pear.id: 1})
+        self.assertFalse(CartItem.objects.filter(user__isnull=True).exists())
+
+
+class CartSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.apple = Product.objects.create(name='Apple', description='test', price=Decimal('2.50'), stock=10)
+        cls.pear = Product.objects.create(name='Pear', description='test', price=Decimal('4.10'), stock=10)
+
+    def make_request(self, user=None):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        request.user = user or AnonymousUser()
+        return request
+
+    def assert_summary(self, cart, count, subtotal):
+        summary = cart.summary()
+        self.assertEqual((summary.count, summary.subtotal), (count, Decimal(subtotal)))
+        self.assertEqual(summary.tax, (summary.subtotal * Decimal('0.10')).quantize(Decimal('0.01')))
+
+    def test_session_cart_summary_is_incremental(self):
+        cart = SessionCart(self.make_request())
+        self.assert_summary(cart, 0, '0')
+        self.assertNotIn(settings.CART_SUMMARY_SESSION_ID, cart.session)
+
+        cart.add(self.apple, 2)
+        cart.add(self.pear)
+        cart.add(self.apple, 1)
+        self.assert_summary(cart, 4, '11.60')
+        cart.update(self.apple.id, 1)
+        self.assert_summary(cart, 2, '6.60')
+        cart.remove(self.pear)
+        self.assert_summary(cart, 1, '2.50')
+        self.assertEqual(cart.summary().version, 5)
+        # Итоги совпадают с полным пересчетом корзины
+        self.assertEqual(cart._compute_summary().subtotal, cart.summary().subtotal)
+        cart.clear()
+        self.assert_summary(cart, 0, '0')
+
+    def test_database_cart_summary_is_read_without_queries(self):
+        request = self.make_request(self.user)
+        cart = DatabaseCart(request)
+        cart.add(self.apple, 3)
+        cart.add(self.pear, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(DatabaseCart(request)), 4)
+            self.assertAlmostEqual(DatabaseCart(request).get_total_price(), 11.6)
+
+        # Корзину очистили в обход Cart: после сброса итоги пересчитываются один раз
+        place_order(self.user)
+        cart.invalidate_summary()
+        self.assert_summary(cart, 0, '0')
+        with self.assertNumQueries(0):
+            cart.summary()
+
+    def test_summary_is_recomputed_for_new_owner(self):
+        request = self.make_request()
+        cart = DatabaseCart(request)
+        cart.add(self.apple, 2)
+        CartItem.objects.create(user=self.user, product=self.pear, quantity=1)
+        DatabaseCart.merge_on_login(request, self.user)
+        request.user = self.user
+        self.assert_summary(DatabaseCart(request), 3, '9.10')
+
+    def test_cart_endpoints_return_summary(self):
+        with self.settings(CART_BACKEND='products.cart.SessionCart'):
+            response = self.client.post(reverse('add_to_cart', args=[self.apple.id]), '{"quantity": 2}',
+                                        content_type='application/json')
+            self.assertEqual(response.json()['cart_count'], 2)
+            response = self.client.post(reverse('update_cart', args=[self.apple.id]), '{"quantity": 3}',
+                                        content_type='application/json')
+            data = response.json()
+            self.assertEqual((data['cart_count'], data['subtotal'], data['tax'], data['total']),
+                             (3, '7.50', '0.75', '8.25'))
+            self.assertEqual(data['version'], 2)
+            response = self.client.get(reverse('home'))
+            self.assertEqual(response.context['cart_count'], 3)
+
+    def test_database_cart_summary_follows_other_sessions_and_prices(self):
+        desktop, phone = Client(), Client()
+        desktop.force_login(self.user)
+        phone.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            desktop.post(reverse('add_to_cart', args=[self.apple.id]), '{"quantity": 1}',
+                         content_type='application/json')
+        self.assertEqual(desktop.get(reverse('home')).context['cart_count'], 1)
+
+        # Корзину изменили из другой сессии того же пользователя
+        with self.captureOnCommitCallbacks(execute=True):
+            phone.post(reverse('update_cart', args=[self.apple.id]), '{"quantity": 3}',
+                       content_type='application/json')
+        response = desktop.get(reverse('cart_view'))
+        self.assertEqual((response.context['cart_count'], response.context['subtotal']), (3, Decimal('7.50')))
+
+        # Новая цена товара: итоги пересчитываются по ней, как и строки корзины
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.price = Decimal('20.00')
+            self.apple.save()
+        response = desktop.get(reverse('cart_view'))
+        self.assertEqual(response.context['cart_items'][0]['total_price'], 60.0)
+        self.assertEqual((response.context['cart_count'], response.context['subtotal']), (3, Decimal('60.00')))
+
+        # Изменения товаров не из корзины (остатки после чужих заказов и т.п.) итоги не сбрасывают
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.pear.pk).update(stock=F('stock') - 1)
+            self.pear.price = Decimal('1.00')
+            self.pear.save()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(desktop.get(reverse('home')).context['cart_count'], 3)
+        self.assertFalse([q for q in ctx.captured_queries if 'products_cartitem' in q['sql']])
+
+    def test_cart_page_totals_the_rows_it_shows(self):
+        self.client.force_login(self.user)
+        CartItem.objects.create(user=self.user, product=self.apple, quantity=2)
+        self.client.get(reverse('home'))
+        # Цена изменилась в обход сигналов, и версии еще не увеличены (коммита не было)
+        Product.objects.filter(pk=self.apple.pk).update(price=Decimal('5.00'))
+        response = self.client.get(reverse('cart_view'))
+        self.assertEqual(response.context['subtotal'], Decimal('10.00'))
+        response = self.client.post(reverse('update_cart', args=[self.apple.id]), '{"quantity": 2}',
+                                    content_type='application/json')
+        self.assertEqual(response.json()['subtotal'], '10.00')
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'SKU {i}', description='test', price=Decimal('2.00'), stock=10) for i in range(60)
+        ])
+
+    def batch(self, operations):
+        return self.client.post(reverse('cart_batch'), {'operations': operations}, content_type='application/json')
+
+    def add_all(self, products):
+        return self.batch([{'op': 'add', 'product_id': p.id, 'quantity': 2} for p in products])
+
+    def test_operations_are_applied_in_order(self):
+        self.client.force_login(self.user)
+        apple, pear, plum = self.products[:3]
+        CartItem.objects.create(user=self.user, product=plum, quantity=1)
+        response = self.batch([
+            {'op': 'add', 'product_id': apple.id, 'quantity': 2},
+            {'op': 'add', 'product_id': apple.id},
+            {'op': 'set', 'product_id': pear.id, 'quantity': 4},
+            {'op': 'remove', 'product_id': plum.id},
+            {'op': 'add', 'product_id': plum.id, 'quantity': 5},
+            {'op': 'remove', 'product_id': plum.id},
+        ])
+        data = response.json()
+        self.assertEqual(dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+                         {apple.id: 3, pear.id: 4})
+        self.assertEqual((data['cart_count'], data['subtotal']), (7, '14.00'))
+        self.assertEqual({item['id'] for item in data['cart_items']}, {apple.id, pear.id})
+
+    def test_invalid_batch_changes_nothing(self):
+        self.client.force_login(self.user)
+        response = self.batch([
+            {'op': 'add', 'product_id': self.products[0].id},
+            {'op': 'add', 'product_id': 0},
+            {'op': 'set', 'product_id': self.products[1].id, 'quantity': 0},
+            {'op': 'move', 'product_id': self.products[2].id},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2, 3])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.batch([]).status_code, 400)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.add_all(self.products[:5]).status_code, 200)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.add_all(self.products[5:55]).status_code, 200)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 55)
+
+    def test_session_cart(self):
+        with self.settings(CART_BACKEND='products.cart.SessionCart'):
+            self.add_all(self.products[:3])
+            data = self.batch([{'op': 'remove', 'product_id': self.products[0].id},
+                               {'op': 'set', 'product_id': self.products[1].id, 'quantity': 1}]).json()
+        self.assertEqual((data['cart_count'], data['total']), (3, '6.60'))
+        self.assertEqual(len(data['cart_items']), 2)
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+
+    def fill_cart(self, lines, stock=5):
+        products = Product.objects.bulk_create([
+            Product(name=f'SKU {i}', description='test', price=Decimal('3.00'), stock=stock)
+            for i in range(lines)
+        ])
+        CartItem.objects.bulk_create([CartItem(user=self.user, product=p, quantity=2) for p in products])
+        return products
+
+    def test_place_order_decrements_stock_and_clears_cart(self):
+        products = self.fill_cart(3)
+        order = place_order(self.user)
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(order.total_price, Decimal('19.80'))
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assertEqual(order.items.get(product=products[0]).price, Decimal('3.00'))
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(2)
+        with CaptureQueriesContext(connection) as small:
+            place_order(self.user)
+        self.fill_cart(25)
+        with CaptureQueriesContext(connection) as large:
+            place_order(self.user)
+        self.assertEqual(len(small), len(large))
+
+    def test_insufficient_stock_rolls_back(self):
+        products = self.fill_cart(2)
+        Product.objects.filter(id=products[1].id).update(stock=1)
+        with self.assertRaises(InsufficientStock):
+            place_order(self.user)
+        self.assertEqual(Product.objects.get(id=products[0].id).stock, 5)
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.user)
+
+    def test_decrease_stock_is_conditional(self):
+        product = Product.objects.create(name='Pen', description='test', price=Decimal('1.00'), stock=2)
+        product.decrease_stock(2)
+        self.assertEqual(product.stock, 0)
+        with self.assertRaises(ValueError):
+            product.decrease_stock(1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 20
+    stock = 7
+
+    def test_concurrent_buyers_never_oversell(self):
+        product = Product.objects.create(name='Hot SKU', description='test', price=Decimal('10.00'), stock=self.stock)
+        users = [User.objects.create_user(f'buyer{i}') for i in range(self.buyers)]
+        CartItem.objects.bulk_create([CartItem(user=user, product=product, quantity=1) for user in users])
+
+        barrier = threading.Barrier(self.buyers)
+        results = []
+
+        def buy(user):
+            try:
+                barrier.wait()
+                place_order(user)
+                results.append('ok')
+            except InsufficientStock:
+                results.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('ok'), self.stock)
+        self.assertEqual(results.count('sold out'), self.buyers - self.stock)
+        self.assertEqual(Product.objects.get(id=product.id).stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), self.stock)
+
+
+class CategoryProductCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruit = Category.objects.create(name='Fruit', description='test')
+        cls.tools = Category.objects.create(name='Tools', description='test')
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'product_count'))
+
+    def make(self, category, name='Item'):
+        return Product.objects.create(name=name, description='test', price=Decimal('1.00'), category=category)
+
+    def test_create_move_and_delete(self):
+        apple = self.make(self.fruit)
+        self.make(self.fruit)
+        self.assertEqual(self.counts(), {'Fruit': 2, 'Tools': 0})
+
+        apple.category = self.tools
+        apple.save()
+        self.assertEqual(self.counts(), {'Fruit': 1, 'Tools': 1})
+
+        apple.name = 'Renamed'
+        apple.save()
+        apple.delete()
+        self.assertEqual(self.counts(), {'Fruit': 1, 'Tools': 0})
+
+    def test_bulk_paths(self):
+        Product.objects.bulk_create([
+            Product(name=f'Bulk {i}', description='test', price=Decimal('1.00'), category=self.fruit)
+            for i in range(5)
+        ])
+        self.assertEqual(self.counts(), {'Fruit': 5, 'Tools': 0})
+
+        Product.objects.filter(name__in=['Bulk 0', 'Bulk 1']).update(category=self.tools)
+        self.assertEqual(self.counts(), {'Fruit': 3, 'Tools': 2})
+
+        Product.objects.filter(category=self.tools).update(category=None)
+        self.assertEqual(self.counts(), {'Fruit': 3, 'Tools': 0})
+
+        Product.objects.filter(category=self.fruit).delete()
+        self.assertEqual(self.counts(), {'Fruit': 0, 'Tools': 0})
+
+    def test_bulk_update_and_save_by_attname(self):
+        apple, pear = self.make(self.fruit), self.make(self.fruit)
+        apple.category, pear.category = self.tools, None
+        Product.objects.bulk_update([apple, pear], ['category'])
+        self.assertEqual(self.counts(), {'Fruit': 0, 'Tools': 1})
+
+        apple.category_id = self.fruit.id
+        apple.save(update_fields=['category_id'])
+        self.assertEqual(self.counts(), {'Fruit': 1, 'Tools': 0})
+
+    def test_reconcile_command(self):
+        self.make(self.fruit)
+        Category.objects.filter(pk=self.fruit.pk).update(product_count=42)
+        Category.objects.filter(pk=self.tools.pk).update(product_count=3)
+        out = StringIO()
+        call_command('reconcile_category_counts', stdout=out)
+        self.assertIn('2 categories fixed', out.getvalue())
+        self.assertEqual(self.counts(), {'Fruit': 1, 'Tools': 0})
+
+    def test_category_list_api_reads_counter(self):
+        self.make(self.fruit)
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, User.objects.create_user('buyer'))
+        category_list_api(request)  # ETag-валидаторы кэшируются
+        with self.assertNumQueries(2):
+            response = category_list_api(request)
+        self.assertEqual({c['name']: c['product_count'] for c in response.data}, {'Fruit': 1, 'Tools': 0})
+
+
+class InvertedIndexSearchTests(TestCase):
+    def setUp(self):
+        self.backend = InvertedIndexBackend()
+        self.fruit = Category.objects.create(name='Fruit', description='test')
+        self.banana = self.make('Banana', 'Sweet yellow banana', self.fruit)
+        self.bread = self.make('Banana bread', 'Baked with flour', None)
+        self.phone = self.make('Phone', 'Comes with a banana-shaped case', None)
+
+    def make(self, name, description, category):
+        return Product.objects.create(name=name, description=description, price=Decimal('1.00'), category=category)
+
+    def test_ranks_name_matches_above_description_matches(self):
+        self.assertEqual(self.backend.search('banana'), [self.banana.id, self.bread.id, self.phone.id])
+
+    def test_all_terms_must_match_and_last_term_is_a_prefix(self):
+        self.assertEqual(self.backend.search('banana bre'), [self.bread.id])
+        self.assertEqual(self.backend.search('fru'), [self.banana.id])
+        self.assertEqual(self.backend.search('nothing'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.backend.search('banana')  # строит индекс
+        with patch('products.search._backend', self.backend), self.captureOnCommitCallbacks(execute=True):
+            self.phone.name = 'Kiwi phone'
+            self.phone.save()
+            self.bread.delete()
+            self.fruit.name = 'Tropical'
+            self.fruit.save()
+        self.assertEqual(self.backend.search('kiwi'), [self.phone.id])
+        self.assertEqual(self.backend.search('bread'), [])
+        self.assertEqual(self.backend.search('tropical'), [self.banana.id])
+
+    def test_index_follows_bulk_operations(self):
+        self.backend.search('banana')  # строит индекс
+        with patch('products.search._backend', self.backend), self.captureOnCommitCallbacks(execute=True):
+            import_products(read_rows(StringIO('sku,name,price,category\nM-1,Mango,2.00,Fruit\n'), 'csv'))
+        mango = Product.objects.get(sku='M-1')
+        self.assertEqual(self.backend.search('mango'), [mango.id])
+
+        with patch('products.search._backend', self.backend), self.captureOnCommitCallbacks(execute=True):
+            # Повторный импорт обновляет существующий товар (upsert), update() — без сигналов
+            import_products(read_rows(StringIO('sku,name,price\nM-1,Papaya,2.00\n'), 'csv'))
+            Product.objects.filter(pk=self.phone.pk).update(name='Kiwi phone')
+            Product.objects.bulk_create([Product(name='Lime', description='', price=Decimal('1.00'))])
+        self.assertEqual(self.backend.search('mango'), [])
+        self.assertEqual(self.backend.search('papaya'), [mango.id])
+        self.assertEqual(self.backend.search('kiwi'), [self.phone.id])
+        self.assertEqual(self.backend.search('lime'), [Product.objects.get(name='Lime').id])
+
+    def test_search_view(self):
+        with patch('products.search._backend', self.backend):
+            response = self.client.get(reverse('search'), {'q': 'banana'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.id for p in response.context['products']],
+                         [self.banana.id, self.bread.id, self.phone.id])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruit = Category.objects.create(name='Fruit', description='test')
+        cls.apple = Product.objects.create(name='Apple', description='test', price=Decimal('1.00'),
+                                           category=cls.fruit, featured=True)
+        cls.pear = Product.objects.create(name='Pear', description='test', price=Decimal('2.00'),
+                                          category=cls.fruit, featured=True)
+
+    def setUp(self):
+        clear_catalog_cache()
+
+    def test_local_tier_serves_repeated_reads(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(catalog_cache.get_or_set('test', compute, {'a': 1}, ('product',)), 'value')
+        key = catalog_cache.make_key('test', {'a': 1}, ('product',))
+        catalog_cache.shared.delete(key)
+        self.assertEqual(catalog_cache.get_or_set('test', compute, {'a': 1}, ('product',)), 'value')
+        self.assertEqual(len(calls), 1)
+        catalog_cache.get_or_set('test', compute, {'a': 2}, ('product',))
+        self.assertEqual(len(calls), 2)
+
+    def test_featured_api_is_cached_until_a_product_changes(self):
+        url = reverse('api_featured_products')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pear.featured = False
+            self.pear.save()
+        self.assertEqual([p['name'] for p in self.client.get(url).json()], ['Apple'])
+
+    def test_product_detail_invalidation_is_per_product(self):
+        url = reverse('product_detail_view', args=[self.apple.id])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pear.name = 'Big pear'
+            self.pear.save()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.name = 'Green apple'
+            self.apple.save()
+        self.assertContains(self.client.get(url), 'Green apple')
+
+    def test_missing_product_is_404(self):
+        self.assertEqual(self.client.get(reverse('product_detail_view', args=[999])).status_code, 404)
+
+    def test_bulk_update_invalidates(self):
+        url = reverse('api_featured_products')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(id=self.apple.id).update(featured=False)
+        self.assertEqual([p['name'] for p in self.client.get(url).json()], ['Pear'])
+
+    def test_category_rename_invalidates_category_api(self):
+        url = reverse('api_categories_list')
+        self.assertEqual(self.client.get(url).json(), [{'id': self.fruit.id, 'name': 'Fruit'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fruit.name = 'Fresh fruit'
+            self.fruit.save()
+        self.assertEqual(self.client.get(url).json(), [{'id': self.fruit.id, 'name': 'Fresh fruit'}])
+
+
+class HomeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [Category.objects.create(name=f'Category {i}', description='test', popularity=10 - i)
+                          for i in range(4)]
+
+    def setUp(self):
+        clear_catalog_cache()
+
+    def create_products(self, count):
+        Product.objects.bulk_create([
+            Product(name=f'Item {i}', description='test', price=Decimal('1.00'), featured=i % 3 == 0,
+                    category=self.categories[i % len(self.categories)])
+            for i in range(count)
+        ])
+
+    def test_sections_are_bounded(self):
+        self.create_products(60)
+        feed = build_home_feed()
+        titles = [section['title'] for section in feed['sections']]
+        self.assertEqual(titles, ['Featured Products', 'New Arrivals',
+                                  'Top in Category 0', 'Top in Category 1', 'Top in Category 2'])
+        self.assertEqual([len(section['products']) for section in feed['sections']], [8, 8, 4, 4, 4])
+        for section in feed['sections'][2:]:
+            self.assertTrue(all(p.category_id == section['category'].id for p in section['products']))
+        self.assertTrue(all(p.featured for p in feed['sections'][0]['products']))
+
+    def test_query_count_does_not_depend_on_catalog_size(self):
+        self.create_products(10)
+        with CaptureQueriesContext(connection) as small:
+            build_home_feed()
+        self.create_products(200)
+        with CaptureQueriesContext(connection) as large:
+            build_home_feed()
+        self.assertEqual(len(small), len(large))
+
+    def test_home_view_renders_sections_from_cache(self):
+        self.create_products(20)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'New Arrivals')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+
+
+def make_image_file(name='photo.jpg', size=(1000, 600)):
+    output = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(output, format='JPEG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def make_product(self):
+        return Product.objects.create(name='Red', description='test', price=Decimal('1.00'),
+                                      image=make_image_file())
+
+    def test_renditions_use_content_hash_names_and_skip_upscaling(self):
+        product = self.make_product()
+        manifest = get_renditions(product.image)
+        self.assertEqual([width for width, _ in manifest['jpg']], [200, 400, 800])
+        self.assertIn('webp', manifest)
+        for width, url in manifest['webp']:
+            self.assertRegex(url, rf'/media/product_images/photo\.[0-9a-f]{{12}}\.{width}w\.webp$')
+
+        small = Product.objects.create(name='Small', description='test', price=Decimal('1.00'),
+                                       image=make_image_file('small.jpg', (300, 300)))
+        self.assertEqual([width for width, _ in get_renditions(small.image)['jpg']], [200, 300])
+
+    def test_manifest_is_cached(self):
+        product = self.make_product()
+        get_renditions(product.image)
+        with patch('products.images.generate_renditions') as generate:
+            get_renditions(product.image)
+        generate.assert_not_called()
+
+    def test_manifest_is_read_from_storage_when_cache_is_cold(self):
+        # Другой процесс со своим кэшем видит копии, созданные воркером
+        product = self.make_product()
+        run_pending()
+        caches[catalog_cache.alias].clear()
+        with patch('products.images.generate_renditions') as generate:
+            manifest = get_renditions(product.image, generate=False)
+        generate.assert_not_called()
+        self.assertEqual([width for width, _ in manifest['jpg']], [200, 400, 800])
+
+    def test_upload_queues_renditions_job(self):
+        product = self.make_product()
+        job = Job.objects.get(task='products.tasks.process_image_renditions')
+        self.assertEqual(job.kwargs, {'model': 'products.product', 'pk': product.pk, 'field': 'image'})
+        self.assertIsNone(get_renditions(product.image, generate=False))
+
+        call_command('run_jobs', processes=0, once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIn('webp', get_renditions(product.image, generate=False))
+
+    def test_template_tag_renders_picture_with_srcset(self):
+        product = self.make_product()
+        render = lambda: Template(
+            '{% load product_images %}{% responsive_image product.image alt=product.name %}'
+        ).render(Context({'product': product}))
+        # Пока воркер не отработал, показывается оригинал; показ задач не ставит
+        Job.objects.all().delete()
+        self.assertNotIn('<picture>', render())
+        self.assertFalse(Job.objects.exists())
+        build_renditions(product.image)
+        html = render()
+        self.assertIn('<picture>', html)
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('400w', html)
+        self.assertIn('alt="Red"', html)
+
+    def test_unreadable_image_falls_back_to_original(self):
+        product = Product.objects.create(name='Broken', description='test', price=Decimal('1.00'),
+                                         image=SimpleUploadedFile('broken.jpg', b'not an image'))
+        with self.assertLogs('products.images', 'WARNING'):
+            run_pending()
+        html = Template('{% load product_images %}{% responsive_image product.image %}').render(
+            Context({'product': product}))
+        self.assertIn(product.image.url, html)
+        self.assertNotIn('<picture>', html)
+
+
+@jobs_task
+def add_numbers(a, b):
+    return a + b
+
+
+@jobs_task
+def always_fails():
+    raise RuntimeError('boom')
+
+
+class BackgroundJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='buyer', password='secret')
+
+    def test_worker_runs_job_and_stores_result(self):
+        job = enqueue(add_numbers, a=2, b=3)
+        self.assertEqual(job.status, Job.PENDING)
+        out = StringIO()
+        call_command('run_jobs', processes=0, once=True, stdout=out)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.attempts), (Job.DONE, 5, 1))
+        self.assertIn(f'Job {job.id}: done', out.getvalue())
+
+    def test_only_marked_functions_can_be_enqueued(self):
+        with self.assertRaises(ValueError):
+            enqueue(make_image_file)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        job = enqueue(add_numbers, a=1, b=1)
+        self.assertEqual(claim_jobs(10), [job.id])
+        self.assertEqual(claim_jobs(10), [])
+
+    def test_stale_running_job_is_reclaimed(self):
+        job = enqueue(add_numbers, a=1, b=1)
+        claim_jobs(1)
+        Job.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(seconds=JOB_STALE_AFTER + 1))
+        self.assertEqual(claim_jobs(1), [job.id])
+
+    def test_stale_job_without_attempts_left_is_failed(self):
+        # Задача, которая каждый раз роняет воркер, не забирается бесконечно
+        job = enqueue(add_numbers, a=1, b=1)
+        Job.objects.filter(id=job.id).update(
+            status=Job.RUNNING, attempts=JOB_MAX_ATTEMPTS,
+            started_at=timezone.now() - timedelta(seconds=JOB_STALE_AFTER + 1))
+        self.assertEqual(claim_jobs(1), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failing_job_is_retried_then_marked_failed(self):
+        job = enqueue(always_fails)
+        with self.assertLogs('products.jobs', 'ERROR'):
+            self.assertEqual(run_pending(), JOB_MAX_ATTEMPTS)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, JOB_MAX_ATTEMPTS))
+        self.assertIn('RuntimeError: boom', job.error)
+
+    def test_profile_avatar_is_processed_in_background(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('profile'),
+            {'username': 'buyer', 'email': 'buyer@example.com', 'first_name': '', 'last_name': '',
+             'avatar': make_image_file('me.png', (640, 480))},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertIsNone(data['avatar_url'])
+
+        status_url = data['job_status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], Job.PENDING)
+        call_command('run_jobs', processes=0, once=True, stdout=StringIO())
+        job = self.client.get(status_url).json()
+        self.assertEqual(job['status'], Job.DONE)
+
+        avatar = Profile.objects.get(user=self.user).avatar
+        self.assertEqual(job['result']['avatar_url'], avatar.url)
+        with avatar.open('rb') as f:
+            image = Image.open(f)
+            self.assertEqual((image.format, image.size), ('JPEG', (200, 200)))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'avatars', 'uploads')), [])
+
+    def test_job_status_is_private(self):
+        job = enqueue(add_numbers, user=self.user, a=1, b=2)
+        other = User.objects.create_user(username='other', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.id])).status_code, 404)
+
+
+class ProductExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('partner')
+        cls.category = Category.objects.create(name='Fruit', description='test')
+        cls.products = [
+            Product.objects.create(name=f'Item {i}', description='test', price=Decimal('1.50'),
+                                   stock=i, category=cls.category)
+            for i in range(5)
+        ]
+        # Первые три товара давно не менялись
+        Product.objects.filter(id__in=[p.id for p in cls.products[:3]]).update(
+            updated_at=timezone.make_aware(timezone.datetime(2020, 1, 1)))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        response = self.client.get(reverse('product_export_api'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_one_row_per_line(self):
+        response, body = self.get()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.products])
+        self.assertEqual(rows[0]['price'], '1.50')
+        self.assertEqual(rows[0]['category_name'], 'Fruit')
+        self.assertEqual(rows[0]['image_url'], '')
+
+    def test_json_array_is_valid_json(self):
+        response, body = self.get(type='json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(json.loads(body)), 5)
+        # Несколько кусков ответа тоже склеиваются в корректный массив
+        chunks = list(stream_json_array(export_rows(), batch_size=2))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(json.loads(''.join(chunks)), json.loads(body))
+
+        Product.objects.all().delete()
+        self.assertEqual(json.loads(self.get(type='json')[1]), [])
+
+    def test_updated_since_filters_rows(self):
+        body = self.get(updated_since='2021-01-01')[1]
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()],
+                         [p.id for p in self.products[3:]])
+        self.assertEqual(len(self.get(updated_since='2019-12-31T23:00:00Z')[1].splitlines()), 5)
+
+    def test_invalid_parameters_are_rejected(self):
+        url = reverse('product_export_api')
+        self.assertEqual(self.client.get(url, {'type': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'updated_since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'updated_since': '2021-02-30'}).status_code, 400)
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruit = Category.objects.create(name='Fruit', description='test')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def import_csv(self, text, **kwargs):
+        return import_products(read_rows(StringIO(text), 'csv'), **kwargs)
+
+    def test_csv_upsert_by_sku(self):
+        Product.objects.create(sku='A-1', name='Old apple', description='keep me', price=Decimal('9.00'),
+                               stock=3, category=self.fruit)
+        report = self.import_csv(
+            'sku,name,price,category\n'
+            'A-1,Apple,1.20,Fruit\n'
+            'B-2,Banana,0.50,Fruit\n'
+        )
+        self.assertEqual((report.rows, report.imported, report.error_count), (2, 2, 0))
+
+        apple = Product.objects.get(sku='A-1')
+        # Колонок description и stock нет во входных данных — они не перезаписываются
+        self.assertEqual((apple.name, apple.price, apple.description, apple.stock),
+                         ('Apple', Decimal('1.20'), 'keep me', 3))
+        self.assertEqual(Product.objects.get(sku='B-2').category, self.fruit)
+        self.fruit.refresh_from_db()
+        self.assertEqual(self.fruit.product_count, 2)
+
+    def test_mixed_batch_does_not_overwrite_missing_columns(self):
+        Product.objects.create(sku='A1', name='Old apple', description='red', price=Decimal('1.00'),
+                               stock=9, category=self.fruit)
+        report = self.import_csv(
+            'sku,name,price,description,stock,category\n'
+            'A1,Apple,2.00,,,\n'
+            'B1,Banana,0.50,yellow,4,Fruit\n'
+        )
+        self.assertEqual((report.imported, report.error_count), (2, 0))
+        apple = Product.objects.get(sku='A1')
+        # Пустые ячейки A1 не перезаписываются, хотя строка B1 эти колонки заполнила
+        self.assertEqual((apple.name, apple.price, apple.description, apple.stock, apple.category),
+                         ('Apple', Decimal('2.00'), 'red', 9, self.fruit))
+        banana = Product.objects.get(sku='B1')
+        self.assertEqual((banana.description, banana.stock, banana.category), ('yellow', 4, self.fruit))
+        self.fruit.refresh_from_db()
+        self.assertEqual(self.fruit.product_count, 2)
+
+    def test_moving_product_updates_both_category_counts(self):
+        vegetables = Category.objects.create(name='Vegetables', description='test')
+        Product.objects.create(sku='V-1', name='Tomato', description='', price=Decimal('1.00'), category=vegetables)
+        self.import_csv('sku,name,price,category\nV-1,Tomato,1.00,Fruit\n')
+        vegetables.refresh_from_db()
+        self.fruit.refresh_from_db()
+        self.assertEqual((vegetables.product_count, self.fruit.product_count), (0, 1))
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        report = self.import_csv(
+            'sku,name,price,category\n'
+            'A-1,Apple,abc,Fruit\n'
+            'B-2,Banana,0.50,Vegetables\n'
+            'C-3,Cherry,2.00,\n'
+        )
+        self.assertEqual((report.rows, report.imported, report.error_count), (3, 1, 2))
+        self.assertEqual([row for row, _ in report.errors], [1, 2])
+        self.assertIn('price', report.errors[0][1])
+        self.assertIn('category', report.errors[1][1])
+        self.assertIsNone(Product.objects.get(sku='C-3').category)
+
+    def test_batches_use_constant_queries_and_create_categories(self):
+        rows = [{'sku': f'S-{i}', 'name': f'Item {i}', 'price': '1.00', 'category': f'New {i % 3}'}
+                for i in range(50)]
+        with CaptureQueriesContext(connection) as ctx:
+            report = import_products(rows, batch_size=25, create_categories=True)
+        self.assertEqual(report.imported, 50)
+        # Карта категорий + создание категорий + по пачке: upsert и пересчет счетчиков
+        self.assertLess(len(ctx), 20)
+        self.assertEqual(Category.objects.get(name='New 0').product_count, 17)
+
+    def test_duplicate_sku_in_batch_keeps_last_row(self):
+        rows = [{'sku': 'A-1', 'name': 'First', 'price': '1.00'}, {'sku': 'A-1', 'name': 'Second', 'price': '2.00'}]
+        import_products(rows)
+        self.assertEqual(Product.objects.get(sku='A-1').name, 'Second')
+
+    def test_ndjson_and_json_readers(self):
+        ndjson = '{"sku": "A-1", "name": "Apple", "price": "1.00"}\n\n{"sku": "B-2", "name": "Banana", "price": 2}\n'
+        self.assertEqual([row['sku'] for row in read_rows(StringIO(ndjson), 'ndjson')], ['A-1', 'B-2'])
+        self.assertEqual(len(list(read_rows(StringIO('[{"sku": "A-1"}]'), 'json'))), 1)
+        with self.assertRaises(ImportFormatError):
+            list(read_rows(StringIO('{"sku": "A-1"}'), 'json'))
+        with self.assertRaises(ImportFormatError):
+            list(read_rows(StringIO('not json\n'), 'ndjson'))
+
+    def test_api_endpoint_requires_admin_and_returns_report(self):
+        upload = SimpleUploadedFile('feed.ndjson', b'{"sku": "A-1", "name": "Apple", "price": "1.00", "category": "Fruit"}\n')
+        url = reverse('product_import_api')
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 403)
+
+        upload.seek(0)
+        self.client.force_login(self.admin)
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 1)
+        self.assertIn('rows_per_second', response.json())
+
+    def test_broken_line_stops_import_after_written_rows(self):
+        lines = [f'{{"sku": "S-{i}", "name": "Item {i}", "price": "1.00"}}' for i in range(3)]
+        text = '\n'.join([*lines, 'not json', '{"sku": "S-9", "name": "Late", "price": "1.00"}'])
+        # Первая пачка записана раньше, чем встретилась ошибка; строка перед ошибкой — тоже
+        report = import_products(read_rows(StringIO(text), 'ndjson'), batch_size=2)
+        self.assertEqual((report.rows, report.imported, report.aborted[0]), (3, 3, 4))
+        self.assertIn('Line 4', report.aborted[1])
+        self.assertFalse(Product.objects.filter(sku='S-9').exists())
+
+        upload = SimpleUploadedFile('feed.ndjson', text.replace('S-', 'T-').encode())
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('product_import_api'), {'file': upload})
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertIn('Line 4', data['error'])
+        self.assertEqual((data['rows'], data['imported'], data['aborted']['row']), (3, 3, 4))
+
+    def test_management_command_reports_throughput(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('sku,name,price,stock,featured\nA-1,Apple,1.00,5,true\n')
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_products', f.name, stdout=out)
+        self.assertRegex(out.getvalue(), r'Imported 1 of 1 rows in .*rows/s\), 0 errors')
+        self.assertTrue(Product.objects.get(sku='A-1').featured)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN для каждого запроса горячих страниц на заполненной базе: ни один
+    из них не должен читать таблицу products_* целиком (Seq Scan в PostgreSQL,
+    SCAN без индекса в SQLite). Запросы снимаются с настоящих представлений,
+    поэтому тест ловит и новый запрос, и удаленный индекс.
+    """
+    products_count = 5000
+    # Страницы, которым нужны все строки таблицы (полный список категорий в фильтре)
+    full_list_tables = {'products_category'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        users = [cls.user] + [User.objects.create_user(f'user{i}') for i in range(50)]
+        cls.categories = Category.objects.bulk_create([
+            Category(name=f'Category {i}', description='test', popularity=i % 17) for i in range(200)
+        ])
+        Product.objects.bulk_create([
+            Product(name=f'Item {i % 997}', description='test', price=Decimal(i % 50) + Decimal('0.99'),
+                    stock=i % 30, featured=i % 40 == 0, category=cls.categories[i % len(cls.categories)])
+            for i in range(cls.products_count)
+        ])
+        cls.product = Product.objects.order_by('id')[100]
+        products = list(Product.objects.order_by('id')[:20])
+        Order.objects.bulk_create([Order(user=users[i % len(users)], total_price=Decimal('10.00'))
+                                   for i in range(2000)])
+        CartItem.objects.bulk_create([CartItem(user=user, product=product, quantity=2)
+                                      for user in users for product in products[:5]])
+        # Статистика для планировщика, как на живой базе
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.client.force_login(self.user)
+        backend = InvertedIndexBackend()
+        # Индекс в памяти строится один раз на процесс чтением всей таблицы — это не запрос страницы
+        backend.search('item')
+        search_backend = patch('products.search._backend', backend)
+        search_backend.start()
+        self.addCleanup(search_backend.stop)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        pattern = r'Seq Scan on (\w+)' if connection.vendor == 'postgresql' else r'^SCAN (\w+)$'
+        tables = {match.group(1) for line in plan for match in [re.search(pattern, line.strip())] if match}
+        return {table for table in tables if table.startswith('products_')} - self.full_list_tables
+
+    def assert_no_full_scans(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        selects = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = self.explain(sql)
+            self.assertFalse(self.full_scans(plan), f"{url}: full table scan in\n{sql}\n" + '\n'.join(plan))
+        return response
+
+    def test_home(self):
+        self.assert_no_full_scans(reverse('home'))
+
+    def test_product_list_pages(self):
+        response = self.assert_no_full_scans(reverse('products_list'))
+        self.assert_no_full_scans(reverse('products_list'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assert_no_full_scans(reverse('products_list'), {'category': self.categories[3].id})
+
+    def test_every_catalog_sort_and_filter_combination(self):
+        filters = [{}, {'category': self.categories[3].id}, {'search': 'item'},
+                   {'category': self.categories[3].id, 'search': 'item'}]
+        for key in PRODUCT_SORTS:
+            for params in filters:
+                with self.subTest(sort=key, **params):
+                    clear_catalog_cache()
+                    response = self.assert_no_full_scans(reverse('products_list'), {'sort': key, **params})
+                    next_cursor = response.context['page_obj'].next_cursor
+                    if next_cursor:
+                        self.assert_no_full_scans(reverse('products_list'),
+                                                  {'sort': key, 'cursor': next_cursor, **params})
+
+    def test_product_and_category_pages(self):
+        self.assert_no_full_scans(reverse('product_detail_view', args=[self.product.id]))
+        self.assert_no_full_scans(reverse('category_detail_view', args=[self.categories[5].id]))
+
+    def test_api(self):
+        response = self.assert_no_full_scans(reverse('product_list_api'))
+        self.assert_no_full_scans(response.json()['next'])
+        self.assert_no_full_scans(reverse('api_featured_products'))
+        self.assert_no_full_scans(reverse('api_popular_products'))
+        self.assert_no_full_scans(reverse('product_export_api'), {'updated_since': timezone.now().isoformat()})
+
+    def test_cart_and_order_history(self):
+        self.assert_no_full_scans(reverse('cart_view'))
+        # Профиль показывает историю заказов: filter(user).order_by('-created_at')
+        self.assert_no_full_scans(reverse('profile'))
+        response = self.assert_no_full_scans(reverse('order_history'))
+        self.assert_no_full_scans(reverse('order_history'), {'cursor': response.context['page_obj'].next_cursor})
+
+
+class CatalogSortTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Fruit', description='test')
+        for i, (name, price) in enumerate([('Cherry', '3.00'), ('Apple', '1.00'), ('Banana', '1.00'),
+                                           ('Date', '5.00'), ('Elderberry', '2.00')]):
+            Product.objects.create(name=name, description='fruit', price=Decimal(price), featured=i == 3,
+                                   category=cls.category,
+                                   created_at=timezone.now() - timedelta(days=10 - i))
+
+    def setUp(self):
+        clear_catalog_cache()
+        # Свой индекс поиска: глобальный мог быть построен на данных другого теста
+        search_backend = patch('products.search._backend', InvertedIndexBackend())
+        search_backend.start()
+        self.addCleanup(search_backend.stop)
+
+    def names(self, sort, **params):
+        names, cursor = [], None
+        # Несколько страниц по 2 товара: курсор должен работать с каждой сортировкой
+        with patch('products.views.KeysetPaginator', lambda qs, per_page, ordering: KeysetPaginator(qs, 2, ordering)):
+            while True:
+                response = self.client.get(reverse('products_list'),
+                                           {'sort': sort, **params, **({'cursor': cursor} if cursor else {})})
+                names += [product.name for product in response.context['page_obj']]
+                cursor = response.context['page_obj'].next_cursor
+                if not response.context['page_obj'].has_next():
+                    return response, names
+
+    def test_registered_sorts(self):
+        self.assertEqual(self.names('price')[1], ['Apple', 'Banana', 'Elderberry', 'Cherry', 'Date'])
+        self.assertEqual(self.names('-price')[1], ['Date', 'Cherry', 'Elderberry', 'Banana', 'Apple'])
+        self.assertEqual(self.names('-name')[1], ['Elderberry', 'Date', 'Cherry', 'Banana', 'Apple'])
+        self.assertEqual(self.names('newest')[1], ['Elderberry', 'Date', 'Banana', 'Apple', 'Cherry'])
+        self.assertEqual(self.names('popularity')[1], ['Date', 'Elderberry', 'Banana', 'Apple', 'Cherry'])
+
+    def test_unknown_sort_falls_back_to_name(self):
+        for sort in ('category__name', 'description', '-id; DROP TABLE'):
+            response, names = self.names(sort)
+            self.assertEqual(response.context['sort_by'], 'name')
+            self.assertEqual(names, ['Apple', 'Banana', 'Cherry', 'Date', 'Elderberry'])
+
+    def test_sort_combines_with_category_and_search(self):
+        other = Category.objects.create(name='Other', description='test')
+        Product.objects.create(name='Apricot', description='fruit', price=Decimal('0.10'), category=other)
+        self.assertEqual(self.names('price', category=self.category.id)[1][0], 'Apple')
+        self.assertEqual(self.names('price', search='ap')[1], ['Apricot', 'Apple'])
+        # Каталог ищет подстроку в названии, не в описании
+        self.assertEqual(self.names('price', search='fruit')[1], [])
+
+
+class PopularityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.fruit = Category.objects.create(name='Fruit', description='test')
+        cls.tools = Category.objects.create(name='Tools', description='test')
+        cls.apple = Product.objects.create(name='Apple', description='fruit', price=Decimal('1.00'), category=cls.fruit)
+        cls.pear = Product.objects.create(name='Pear', description='fruit', price=Decimal('2.00'), category=cls.fruit)
+        cls.hammer = Product.objects.create(name='Hammer', description='tool', price=Decimal('9.00'),
+                                            category=cls.tools)
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.now = timezone.now()
+
+    def order(self, age, *items):
+        order = Order.objects.create(user=self.user, total_price=Decimal('0'))
+        Order.objects.filter(id=order.id).update(created_at=self.now - age)
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        return order
+
+    def scores(self, model):
+        return dict(model.objects.values_list('name', 'popularity'))
+
+    def test_scores_decay_with_order_age(self):
+        half_life = timedelta(seconds=POPULARITY_HALF_LIFE)
+        self.order(timedelta(hours=1), (self.apple, 2), (self.hammer, 1))
+        self.order(half_life, (self.pear, 4))
+        stats = update_popularity(self.now)
+
+        self.assertEqual(stats['order_items'], 3)
+        products = self.scores(Product)
+        self.assertAlmostEqual(products['Apple'], 2 * decay_factor(3600))
+        self.assertAlmostEqual(products['Pear'], 2.0)
+        self.assertAlmostEqual(self.scores(Category)['Fruit'], products['Apple'] + products['Pear'])
+        self.assertAlmostEqual(self.scores(Category)['Tools'], products['Hammer'])
+        self.assertEqual(PopularityState.objects.get().last_order_item_id, OrderItem.objects.latest('id').id)
+
+    def test_runs_are_incremental(self):
+        self.order(timedelta(hours=1), (self.apple, 1))
+        update_popularity(self.now)
+        before = self.scores(Product)['Apple']
+
+        # Через период полураспада: старый счет уменьшился вдвое, новый заказ добавлен один раз
+        later = self.now + timedelta(seconds=POPULARITY_HALF_LIFE)
+        self.now = later
+        self.order(timedelta(hours=1), (self.apple, 1))
+        # Затухание и добавление — по UPDATE на таблицу, без чтения счетов
+        with self.assertNumQueries(11):
+            stats = update_popularity(later)
+        self.assertEqual(stats['order_items'], 1)
+        self.assertAlmostEqual(self.scores(Product)['Apple'], before / 2 + decay_factor(3600))
+
+        # Без новых заказов учитывается только затухание
+        update_popularity(later)
+        self.assertAlmostEqual(self.scores(Product)['Apple'], before / 2 + decay_factor(3600))
+
+    def test_recent_orders_wait_for_commit_lag(self):
+        self.order(timedelta(hours=1), (self.apple, 1))
+        recent = self.order(timedelta(0), (self.pear, 1))
+        self.order(timedelta(hours=1), (self.hammer, 1))
+        stats = update_popularity(self.now)
+
+        # Отметка останавливается перед свежим заказом, следующая позиция ждет вместе с ним
+        self.assertEqual(stats['order_items'], 1)
+        self.assertLess(PopularityState.objects.get().last_order_item_id, recent.items.get().id)
+        self.assertEqual(self.scores(Product)['Hammer'], 0)
+        stats = update_popularity(self.now + timedelta(hours=1))
+        self.assertEqual(stats['order_items'], 2)
+        self.assertGreater(self.scores(Product)['Hammer'], 0)
+
+    def test_tiny_scores_are_reset(self):
+        self.order(timedelta(hours=1), (self.apple, 1))
+        update_popularity(self.now)
+        update_popularity(self.now + timedelta(seconds=POPULARITY_HALF_LIFE * 10))
+        self.assertEqual(self.scores(Product)['Apple'], 0)
+        self.assertEqual(self.scores(Category)['Fruit'], 0)
+
+    def test_rebuild_recomputes_from_all_orders(self):
+        self.order(timedelta(hours=1), (self.apple, 3), (self.hammer, 1))
+        update_popularity(self.now)
+        expected = self.scores(Product)
+        Product.objects.update(popularity=100)
+        reset_popularity()
+        self.assertEqual(set(self.scores(Product).values()), {0})
+        update_popularity(self.now)
+        for name, score in self.scores(Product).items():
+            self.assertAlmostEqual(score, expected[name])
+
+    def test_command(self):
+        self.order(timedelta(hours=1), (self.apple, 1))
+        out = StringIO()
+        call_command('update_popularity', '--rebuild', stdout=out)
+        self.assertIn('1 order items', out.getvalue())
+        state = PopularityState.objects.get()
+        self.assertEqual(str(state), f'Popularity up to order item {state.last_order_item_id}')
+        job = Job.objects.create(task='products.tasks.refresh_popularity')
+        self.assertEqual(str(job), f'Job {job.id} products.tasks.refresh_popularity (pending)')
+
+    def test_popular_endpoints_read_precomputed_scores(self):
+        self.order(timedelta(hours=1), (self.apple, 1), (self.hammer, 5))
+        with self.captureOnCommitCallbacks(execute=True):
+            update_popularity(self.now)
+
+        with self.assertNumQueries(1):
+            products = self.client.get(reverse('api_popular_products')).json()
+        self.assertEqual([product['name'] for product in products], ['Hammer', 'Apple'])
+        self.assertAlmostEqual(products[0]['popularity'], 5 * decay_factor(3600))
+        categories = self.client.get(reverse('api_popular_categories')).json()
+        self.assertEqual([category['name'] for category in categories], ['Tools', 'Fruit'])
+
+        # Категории и каталог упорядочены по тем же счетам
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Tools', 'Fruit'])
+        response = self.client.get(reverse('products_list'), {'sort': 'popularity'})
+        self.assertEqual([product.name for product in response.context['page_obj']], ['Hammer', 'Apple', 'Pear'])
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='password')
+        cls.other = User.objects.create_user(username='other', password='password')
+        cls.products = [Product.objects.create(name=f'Item {i}', description='test', price=Decimal('2.50'))
+                        for i in range(3)]
+        cls.orders = [cls.order(cls.user) for _ in range(ORDER_HISTORY_PAGE_SIZE * 2 + 5)]
+        cls.order(cls.other)
+
+    @classmethod
+    def order(cls, user):
+        order = Order.objects.create(user=user, total_price=Decimal('5.00'))
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, price=product.price)
+                                       for product in cls.products[:2]])
+        return order
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.client.force_login(self.user)
+
+    def test_summary_is_one_aggregate_and_cached(self):
+        with self.assertNumQueries(1):
+            summary = order_summary(self.user)
+        self.assertEqual(summary['count'], len(self.orders))
+        self.assertEqual(summary['total_spent'], Decimal('5.00') * len(self.orders))
+        self.assertEqual(summary['last_order_id'], self.orders[-1].id)
+        with self.assertNumQueries(0):
+            order_summary(self.user)
+
+    def test_summary_is_invalidated_by_new_orders(self):
+        order_summary(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.order(self.user)
+        self.assertEqual(order_summary(self.user)['last_order_id'], order.id)
+        self.assertEqual(order_summary(self.other)['count'], 1)
+
+    def test_summary_without_orders(self):
+        summary = order_summary(User.objects.create_user(username='new'))
+        self.assertEqual((summary['count'], summary['total_spent']), (0, Decimal('0.00')))
+
+    def test_summary_from_page_holding_every_order(self):
+        page = order_page(self.other)
+        list(page)
+        with self.assertNumQueries(0):
+            summary = order_summary(self.other, page)
+        clear_catalog_cache()
+        self.assertEqual(summary, order_summary(self.other))
+        # Неполная страница — сводка из агрегата
+        page = order_page(self.user, per_page=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(order_summary(self.user, page)['count'], len(self.orders))
+
+    def test_history_pages_cover_every_order(self):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(reverse('order_history'), {'cursor': cursor} if cursor else {})
+            page = response.context['page_obj']
+            self.assertLessEqual(len(page), ORDER_HISTORY_PAGE_SIZE)
+            ids += [order.id for order in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(ids, [order.id for order in reversed(self.orders)])
+
+    def test_page_cost_does_not_grow_with_order_count(self):
+        # Сессия, пользователь, корзина, сводка, страница заказов, позиции с товарами
+        # и запись пересчитанных итогов корзины в сессию (UPDATE в точке сохранения)
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('order_history'))
+        self.assertContains(response, 'Item 1')
+        for _ in range(ORDER_HISTORY_PAGE_SIZE):
+            self.order(self.user)
+        clear_catalog_cache()
+        with self.assertNumQueries(9):
+            self.client.get(reverse('order_history'))
+
+    def test_invalid_cursor_shows_first_page(self):
+        response = self.client.get(reverse('order_history'), {'cursor': 'garbage'})
+        self.assertEqual(response.context['page_obj'][0].id, self.orders[-1].id)
+
+    def test_profile_shows_recent_orders_and_summary(self):
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(len(response.context['orders']), PROFILE_RECENT_ORDERS)
+        self.assertContains(response, f'{len(self.orders)} orders')
+        self.assertContains(response, '$5.00')
+        self.assertContains(response, reverse('order_history'))
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.food = Category.objects.create(name='Food', description='test')
+        cls.fruit = Category.objects.create(name='Fruit', description='test', parent=cls.food)
+        cls.veg = Category.objects.create(name='Vegetables', description='test', parent=cls.food)
+        cls.tools = Category.objects.create(name='Tools', description='test')
+        for name, price, stock, featured, category in [
+            ('Apple', '5.00', 10, True, cls.fruit),
+            ('Banana', '20.00', 0, False, cls.fruit),
+            ('Carrot', '8.00', 3, False, cls.veg),
+            ('Bread', '60.00', 1, False, cls.food),
+            ('Hammer', '150.00', 2, True, cls.tools),
+        ]:
+            Product.objects.create(name=name, description='test', price=Decimal(price), stock=stock,
+                                   featured=featured, category=category)
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.client.force_login(self.user)
+
+    def facets(self, **params):
+        return catalog_facets(parse_filters({key: str(value) for key, value in params.items()}))
+
+    def test_counts_in_one_query(self):
+        catalog_facets(parse_filters({}))
+        clear_catalog_cache()
+        with self.assertNumQueries(2):  # дерево категорий и агрегат
+            facets = self.facets()
+        self.assertEqual(facets['total'], 5)
+        self.assertEqual({item['label']: item['count'] for item in facets['category']}, {'Food': 4, 'Tools': 1})
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [2, 1, 1, 1])
+        self.assertEqual(facets['in_stock']['count'], 4)
+        self.assertEqual(facets['featured']['count'], 2)
+        # Повторный запрос — из кэша
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets(), facets)
+
+    def test_own_facet_is_not_applied_to_its_counts(self):
+        facets = self.facets(price='under-10', in_stock=1)
+        self.assertEqual(facets['total'], 2)
+        # Цены считаются без выбранного диапазона, но с наличием
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [2, 0, 1, 1])
+        self.assertTrue(facets['price'][0]['selected'])
+        # Наличие — без своего фильтра, но с ценой
+        self.assertEqual(facets['in_stock']['count'], 2)
+
+    def test_category_includes_subtree(self):
+        facets = self.facets(category=self.food.id)
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['category'], [
+            {'value': self.fruit.id, 'label': 'Fruit', 'count': 2},
+            {'value': self.veg.id, 'label': 'Vegetables', 'count': 1},
+        ])
+        self.assertEqual(facets['selected_category'], {'value': self.food.id, 'label': 'Food', 'parent': None})
+        names = [product.name for product in apply_filters(Product.objects.all(), parse_filters(
+            {'category': str(self.food.id), 'in_stock': '1'}))]
+        self.assertCountEqual(names, ['Apple', 'Carrot', 'Bread'])
+
+    def test_invalid_values_are_ignored(self):
+        filters = parse_filters({'category': 'abc', 'price': '0-1000', 'in_stock': 'maybe'})
+        self.assertEqual(filters, {'category': None, 'price': None, 'in_stock': False, 'featured': False})
+
+    def test_cache_invalidated_on_product_change(self):
+        self.assertEqual(self.facets()['featured']['count'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            banana = Product.objects.get(name='Banana')
+            banana.featured = True
+            banana.save()
+        self.assertEqual(self.facets()['featured']['count'], 3)
+
+    def test_api(self):
+        response = self.client.get(reverse('product_facets_api'), {'category_id': self.fruit.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(response.data['in_stock']['count'], 1)
+
+        response = self.client.get(reverse('product_list_api'), {'category_id': self.food.id, 'price': '10-50'})
+        self.assertEqual([product['name'] for product in response.data['results']], ['Banana'])
+
+    def test_catalog_page(self):
+        response = self.client.get(reverse('products_list'), {'category': self.food.id, 'featured': '1'})
+        self.assertEqual([product.name for product in response.context['page_obj']], ['Apple'])
+        self.assertEqual(response.context['facets']['total'], 1)
+        self.assertEqual(response.context['selected_category'], self.food.id)
+        self.assertContains(response, 'href="?category=%d&amp;featured=1"' % self.fruit.id)
+        # Повторный выбор значения снимает фильтр
+        self.assertContains(response, 'href="?category=%d"' % self.food.id)
+
+    def test_search_counts_match_catalog_list(self):
+        response = self.client.get(reverse('products_list'), {'search': 'an', 'category': self.food.id})
+        self.assertEqual([product.name for product in response.context['page_obj']], ['Banana'])
+        self.assertEqual(response.context['facets']['total'], 1)
+        # Описание ('test') не ищется ни списком, ни фасетами
+        self.assertEqual(catalog_facets(parse_filters({}), 'test')['total'], 0)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        clear_catalog_cache()
+        self.electronics = Category.objects.create(name='Electronics', description='test')
+        self.phones = Category.objects.create(name='Phones', description='test', parent=self.electronics)
+        self.android = Category.objects.create(name='Android', description='test', parent=self.phones)
+        self.books = Category.objects.create(name='Books', description='test')
+        for name, category in [('TV', self.electronics), ('iPhone', self.phones), ('Pixel', self.android),
+                               ('Novel', self.books)]:
+            Product.objects.create(name=name, description='test', price=Decimal('1.00'), category=category)
+
+    def test_paths(self):
+        self.assertEqual(self.android.path, f'{self.electronics.id}/{self.phones.id}/{self.android.id}/')
+        self.assertEqual(self.android.depth, 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.android.get_ancestors()), [self.electronics, self.phones])
+        with self.assertNumQueries(1):
+            self.assertCountEqual(Product.objects.in_category(self.electronics).values_list('name', flat=True),
+                                  ['TV', 'iPhone', 'Pixel'])
+        self.assertEqual(list(self.phones.get_descendants()), [self.android])
+
+    def test_move_rewrites_subtree(self):
+        self.phones.parent = self.books
+        with self.assertNumQueries(5):  # путь родителя, UPDATE строки и UPDATE поддерева (+ savepoint)
+            self.phones.save()
+        self.android.refresh_from_db()
+        self.assertEqual(self.android.path, f'{self.books.id}/{self.phones.id}/{self.android.id}/')
+        self.assertCountEqual(Product.objects.in_category(self.books).values_list('name', flat=True),
+                              ['Novel', 'iPhone', 'Pixel'])
+        self.assertEqual(Product.objects.in_category(self.electronics).count(), 1)
+
+        self.phones.parent = None
+        self.phones.save()
+        self.android.refresh_from_db()
+        self.assertEqual(self.android.path, f'{self.phones.id}/{self.android.id}/')
+
+    def test_cannot_move_into_own_subtree(self):
+        self.electronics.parent = self.android
+        with self.assertRaises(ValidationError):
+            self.electronics.full_clean()
+        with self.assertRaises(ValueError):
+            self.electronics.save()
+
+    def test_bulk_create_and_rebuild(self):
+        Category.objects.bulk_create([Category(name='Tablets', description='test', parent=self.electronics)])
+        tablets = Category.objects.get(name='Tablets')
+        self.assertEqual(tablets.path, f'{self.electronics.id}/{tablets.id}/')
+        Category.objects.filter(pk=self.phones.pk).update(parent=self.books)
+        self.assertEqual(Category.rebuild_paths(), 2)
+        self.android.refresh_from_db()
+        self.assertTrue(self.android.path.startswith(f'{self.books.id}/'))
+
+    def test_delete_removes_subtree(self):
+        self.phones.delete()
+        self.assertEqual(list(Category.objects.filter(path__startswith=self.electronics.path)), [self.electronics])
+
+    def test_category_page_shows_subtree_and_breadcrumbs(self):
+        response = self.client.get(reverse('category_detail_view', args=[self.phones.id]))
+        self.assertEqual([product.name for product in response.context['products']], ['Pixel', 'iPhone'])
+        self.assertEqual(response.context['ancestors'], [self.electronics])
+        self.assertEqual(response.context['subcategories'], [self.android])
+        self.assertContains(response, self.electronics.get_absolute_url())
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.categories = [Category.objects.create(name=f'Category {i}', description='test') for i in range(5)]
+        cls.products = [
+            Product.objects.create(name=f'Item {i}', description='test', price=Decimal('2.00'), stock=5,
+                                   featured=i % 3 == 0, category=cls.categories[i % 5])
+            for i in range(30)
+        ]
+        for product in cls.products[:10]:
+            CartItem.objects.create(user=cls.user, product=product, quantity=1)
+        # Больше заказов, чем помещается в профиль: сводка требует своего запроса
+        for _ in range(PROFILE_RECENT_ORDERS + 1):
+            order = Order.objects.create(user=cls.user, total_price=Decimal('4.00'))
+            for product in cls.products[:5]:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+    def setUp(self):
+        clear_catalog_cache()
+        metrics_store.clear()
+        self.client.force_login(self.user)
+        search_backend = patch('products.search._backend', InvertedIndexBackend())
+        search_backend.start()
+        self.addCleanup(search_backend.stop)
+
+    def budget_urls(self):
+        product = self.products[0]
+        # Дочерняя категория: у страницы есть хлебные крошки
+        category = Category.objects.create(name='Child', description='test', parent=self.categories[0])
+        return {
+            'home': reverse('home'),
+            'products_list': reverse('products_list'),
+            'product_detail_view': reverse('product_detail_view', args=[product.id]),
+            'category_filter_view': reverse('category_filter_view'),
+            'category_detail_view': reverse('category_detail_view', args=[category.id]),
+            'cart_view': reverse('cart_view'),
+            'profile': reverse('profile'),
+            'order_history': reverse('order_history'),
+            'search': reverse('search') + '?q=item',
+            'product_list_api': reverse('product_list_api') + f'?category_id={category.id}',
+            'product_facets_api': reverse('product_facets_api'),
+            'product_detail_api': reverse('product_detail_api', args=[product.id]),
+            'api_categories_list': reverse('api_categories_list'),
+            'api_featured_products': reverse('api_featured_products'),
+            'api_popular_products': reverse('api_popular_products'),
+            'api_popular_categories': reverse('api_popular_categories'),
+            'product_detail_view_async': reverse('product_detail_view_async', args=[product.id]),
+            'search_async': reverse('search_async') + '?q=item',
+            'product_list_api_async': reverse('product_list_api_async') + f'?category_id={category.id}',
+            'api_categories_list_async': reverse('api_categories_list_async'),
+            'api_featured_products_async': reverse('api_featured_products_async'),
+        }
+
+    def change_cart(self):
+        # Корзину изменили в другой сессии: итоги в сессии клиента устарели
+        with self.captureOnCommitCallbacks(execute=True):
+            item = CartItem.objects.filter(user=self.user).first()
+            item.quantity += 1
+            item.save()
+
+    def test_views_stay_within_query_budgets(self):
+        urls = self.budget_urls()
+        # Новый бюджет в QUERY_BUDGETS должен проверяться здесь
+        self.assertEqual(set(urls), set(QUERY_BUDGETS))
+        for name, url in urls.items():
+            # Худший случай: холодный кэш и первый показ после изменения корзины;
+            # превышение — QueryBudgetExceeded из middleware
+            clear_catalog_cache()
+            self.change_cart()
+            self.assertEqual(self.client.get(url).status_code, 200, name)
+
+    def test_warm_views_skip_cart_and_catalog_queries(self):
+        urls = self.budget_urls()
+        self.client.get(urls['home'])
+        for name in ('products_list', 'product_detail_view', 'category_detail_view'):
+            self.client.get(urls[name])
+            # Повторный показ: итоги корзины из сессии, данные из кэша — остаются сессия и пользователь
+            with self.assertNumQueries(2):
+                self.assertEqual(self.client.get(urls[name]).status_code, 200, name)
+
+    def test_budget_exceeded(self):
+        with patch.dict(QUERY_BUDGETS, {'products_list': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('products_list'))
+            with self.settings(QUERY_BUDGET_STRICT=False), self.assertLogs('products.metrics', 'WARNING') as logs:
+                self.assertEqual(self.client.get(reverse('products_list')).status_code, 200)
+        self.assertIn('products_list: ', logs.output[0])
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs('products.metrics', 'INFO') as logs:
+            response = self.client.get(reverse('products_list'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^sql;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'products_list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    def test_stats_endpoint(self):
+        for _ in range(3):
+            self.client.get(reverse('products_list'))
+        self.assertEqual(self.client.get(reverse('request_metrics_api')).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('request_metrics_api'), {'reset': '1'})
+        stats = response.json()['products_list']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['query_budget'], QUERY_BUDGETS['products_list'])
+        self.assertEqual(set(stats['total_ms']), {'p50', 'p90', 'p99', 'max'})
+        self.assertLessEqual(stats['total_ms']['p50'], stats['total_ms']['max'])
+        self.assertNotIn('products_list', metrics_store.summary())
+
+    def test_percentiles(self):
+        self.assertEqual(percentiles(list(range(1, 101))), {'p50': 50, 'p90': 90, 'p99': 99, 'max': 100})
+        self.assertEqual(percentiles([]), {'p50': None, 'p90': None, 'p99': None, 'max': None})
+
+
+class BenchmarkTests(TestCase):
+    def test_generated_data_is_deterministic(self):
+        def snapshot():
+            with transaction.atomic():
+                data = generate_data(seed=7, images=False)
+                result = (
+                    list(Product.objects.filter(pk__in=data.product_ids).order_by('sku')
+                         .values_list('sku', 'name', 'price', 'stock', 'category__name')),
+                    list(Category.objects.exclude(parent=None).values_list('name', 'parent__name').order_by('name')),
+                    sorted(CartItem.objects.filter(user__in=data.users)
+                           .values_list('user__username', 'product__sku', 'quantity')),
+                )
+                transaction.set_rollback(True)
+            return result
+
+        first = snapshot()
+        self.assertEqual(len(first[0]), BASE_SCALE['products'])
+        self.assertEqual(first, snapshot())
+
+    def test_command_saves_json(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        out = StringIO()
+        call_command('bench_shop', iterations=2, no_images=True, output=path, stdout=out, stderr=StringIO())
+        with open(path) as f:
+            results = json.load(f)
+        self.assertEqual(set(results['scenarios']), set(SCENARIOS))
+        checkout = results['scenarios']['checkout']
+        self.assertEqual(checkout['requests'], 6)
+        self.assertEqual(set(checkout['latency_ms']), {'p50', 'p95', 'p99', 'max'})
+        self.assertGreater(checkout['queries']['mean'], 0)
+        # Данные прогона откатываются
+        self.assertFalse(Product.objects.filter(sku__startswith='BENCH-').exists())
+
+        out = StringIO()
+        call_command('bench_shop', iterations=2, no_images=True, scenarios='update_cart', compare=path,
+                     stdout=out, stderr=StringIO())
+        self.assertIn('update_cart: p50 ms', out.getvalue())
+
+    def test_http_load_counts_requests_and_errors(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_GET(self):
+                body = b'ok'
+                self.send_response(200 if self.path == '/ok' else 404)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        port = server.server_address[1]
+
+        result = http_load('127.0.0.1', port, '/ok', requests=20, concurrency=4)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual((result['requests'], result['concurrency']), (20, 4))
+        self.assertGreater(result['throughput_rps'], 0)
+        self.assertEqual(set(result['latency_ms']), {'p50', 'p95', 'p99', 'max'})
+        self.assertEqual(http_load('127.0.0.1', port, '/missing', requests=5, concurrency=2)['errors'], 5)
+
+
+class ConditionalRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.fruit = Category.objects.create(name='Fruit', description='test')
+        cls.apple = Product.objects.create(name='Apple', description='test', price=Decimal('2.00'),
+                                           stock=5, category=cls.fruit)
+
+    def setUp(self):
+        clear_catalog_cache()
+        self.client.force_login(self.user)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_product_api_returns_304_until_product_changes(self):
+        url = reverse('product_detail_api', args=[self.apple.id])
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        not_modified = self.revalidate(url, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.apple.price = Decimal('3.00')
+            self.apple.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+        # Изменение по устаревшей версии отклоняется
+        stale = self.client.put(url, {'name': 'Apple', 'description': 'test', 'price': '4.00'},
+                                content_type='application/json', HTTP_IF_MATCH=response['ETag'])
+        self.assertEqual(stale.status_code, 412)
+
+    def test_unchanged_list_is_not_queried_or_serialized(self):
+        url = reverse('product_list_api') + f'?category_id={self.fruit.id}'
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx, \
+                patch.object(ProductSerializer, 'to_representation') as to_representation:
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+        to_representation.assert_not_called()
+        self.assertFalse([q for q in ctx.captured_queries if 'products_product' in q['sql']])
+
+        # Другая страница или фильтр — другой ETag
+        other = self.client.get(reverse('product_list_api') + '?in_stock=1')
+        self.assertNotEqual(other['ETag'], response['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Pear', description='test', price=Decimal('1.00'), category=self.fruit)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_html_pages_depend_on_visitor(self):
+        for url in (reverse('product_detail_view', args=[self.apple.id]),
+                    reverse('category_detail_view', args=[self.fruit.id])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+                # Счетчик корзины в шапке изменился — страница тоже
+                self.client.post(reverse('cart_batch'), {'operations': [{'op': 'add', 'product_id': self.apple.id}]},
+                                 content_type='application/json')
+                self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_category_page_and_api_follow_categories(self):
+        page_url = reverse('category_detail_view', args=[self.fruit.id])
+        api_url = reverse('api_categories_list')
+        page, api = self.client.get(page_url), self.client.get(api_url)
+        self.assertEqual(self.revalidate(api_url, api).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Berries', description='test', parent=self.fruit)
+        self.assertEqual(self.revalidate(page_url, page).status_code, 200)
+        self.assertEqual(self.revalidate(api_url, api).status_code, 200)
+        self.assertEqual(self.client.get(reverse('product_detail_view', args=[0])).status_code, 404)
+
+
+class FastJsonTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruit = Category.objects.create(name='Fruit', description='test')
+        cls.apple = Product.objects.create(name='Äpfel', sku='A-1', description='test', price=Decimal('2.50'),
+                                           category=cls.fruit, image='product_images/apple.jpg', featured=True)
+        cls.pear = Product.objects.create(name='Pear', description='test', price=Decimal('1.05'), category=cls.fruit)
+
+    def test_product_row_matches_serializer(self):
+        request = RequestFactory().get('/api/products/')
+        queryset = Product.objects.order_by('id')
+        expected = JSONRenderer().render(ProductSerializer(
+            ProductSerializer.setup_eager_loading(queryset), many=True, context={'request': request}).data)
+        fast = dumps(PRODUCT_ROW.render(PRODUCT_ROW.rows(queryset), request))
+        self.assertEqual(json.loads(fast), json.loads(expected))
+        self.assertEqual(json.loads(fast)[0]['image_url'], 'http://testserver/media/product_images/apple.jpg')
+
+    def test_null_category_and_decimal_policy(self):
+        Product.objects.create(name='Loose', description='test', price=Decimal('3.00'))
+        row = PRODUCT_ROW.render(PRODUCT_ROW.rows(Product.objects.filter(category=None)))[0]
+        self.assertEqual((row['category'], row['category_name'], row['image'], row['image_url']),
+                         (None, None, None, ''))
+        self.assertEqual(json.loads(dumps(row))['price'], '3.00')
+        self.assertEqual(json.loads(dumps({'total': Decimal('8.25')})), {'total': '8.25'})
+
+    def test_schema_is_compiled_to_literal(self):
+        schema = RowSchema('test', [Field('id', 'id'), Field('price', 'price', 'decimal'), Field('copy', 'id')])
+        self.assertEqual(schema.columns, ['id', 'price'])
+        self.assertIn("'id': row[0]", schema.source)
+        self.assertEqual(schema.render([(1, Decimal('2.00'))]), [{'id': 1, 'price': '2.00', 'copy': 1}])
+        with self.assertRaises(ValueError):
+            Field('x', 'x', 'money')
+
+    def test_stdlib_fallback_matches_orjson(self):
+        data = {'name': 'Äpfel', 'price': Decimal('2.50'), 'when': timezone.now(), 'items': [1, None, True]}
+        with patch('products.fastjson.orjson', None):
+            fallback = dumps(data)
+        self.assertEqual(json.loads(fallback), json.loads(dumps(data)))
+        self.assertIn('Äpfel'.encode(), fallback)
+
+    def test_featured_and_category_apis(self):
+        featured = self.client.get(reverse('api_featured_products')).json()
+        self.assertEqual(featured, [{'id': self.apple.id, 'name': 'Äpfel', 'description': 'test', 'price': '2.50',
+                                     'image': '/media/product_images/apple.jpg'}])
+        self.assertEqual(self.client.get(reverse('api_categories_list')).json(),
+                         [{'id': self.fruit.id, 'name': 'Fruit'}])
+
+    def test_microbenchmark_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'json.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('bench_json', rows=50, repeat=1, output=path, stdout=StringIO())
+        with open(path) as f:
+            result = json.load(f)
+        self.assertEqual(result['rows'], 50)
+        self.assertTrue(result['identical'])
+        self.assertFalse(Product.objects.filter(sku__startswith='BENCH-').exists())
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer')
+        cls.category = Category.objects.create(name='Fruit', description='test')
+        cls.products = [
+            Product.objects.create(name=f'Apple {i}', description='fresh fruit', price=Decimal('1.50'), stock=i,
+                                   featured=i % 2 == 0, category=cls.category)
+            for i in range(25)
+        ]
+
+    def setUp(self):
+        clear_catalog_cache()
+        search_backend = patch('products.search._backend', InvertedIndexBackend())
+        search_backend.start()
+        self.addCleanup(search_backend.stop)
+
+    async def get_both(self, sync_name, async_name, *args, data=None):
+        sync_response = await self.async_client.get(reverse(sync_name, args=args), data)
+        async_response = await self.async_client.get(reverse(async_name, args=args), data)
+        return sync_response, async_response
+
+    async def test_json_views_match_sync_versions(self):
+        for sync_name, async_name in [('api_featured_products', 'api_featured_products_async'),
+                                      ('api_categories_list', 'api_categories_list_async')]:
+            sync_response, async_response = await self.get_both(sync_name, async_name)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+    async def test_product_list_api_matches_sync_version(self):
+        self.assertEqual((await self.async_client.get(reverse('product_list_api_async'))).status_code, 403)
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        params = {'page_size': 10, 'category_id': self.category.id, 'in_stock': '1'}
+        sync_response, async_response = await self.get_both('product_list_api', 'product_list_api_async', data=params)
+        self.assertEqual(async_response.status_code, 200)
+        sync_data, async_data = sync_response.json(), async_response.json()
+        self.assertEqual(async_data['results'], sync_data['results'])
+        self.assertEqual(len(async_data['results']), 10)
+
+        cursor = parse_qs(urlparse(async_data['next']).query)['cursor'][0]
+        sync_response, async_response = await self.get_both('product_list_api', 'product_list_api_async',
+                                                            data={**params, 'cursor': cursor})
+        self.assertEqual(async_response.json()['results'], sync_response.json()['results'])
+        self.assertIsNotNone(async_response.json()['previous'])
+
+        response = await self.async_client.get(reverse('product_list_api_async'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_html_views(self):
+        product = self.products[3]
+        response = await self.async_client.get(reverse('product_detail_view_async', args=[product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'], product)
+        self.assertContains(response, product.name)
+        self.assertEqual((await self.async_client.get(reverse('product_detail_view_async', args=[0]))).status_code,
+                         404)
+
+        sync_response, async_response = await self.get_both('search', 'search_async', data={'q': 'apple'})
+        self.assertEqual([p.id for p in async_response.context['products']],
+                         [p.id for p in sync_response.context['products']])
+        self.assertEqual(len(async_response.context['products']), 12)
+
+    async def test_metrics_count_async_queries(self):
+        response = await self.async_client.get(reverse('api_categories_list_async'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        # Повтор из кэша каталога — без запросов
+        response = await self.async_client.get(reverse('api_categories_list_async'))
+        self.assertIn('desc="0 queries"', response['Server-Timing'])
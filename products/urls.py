@@ -1,7 +1,7 @@
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Главная страница
@@ -13,6 +13,7 @@ urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('profile/', views.profile, name='profile'),
     path('upload-avatar/', views.upload_avatar, name='upload_avatar'),
+    path('jobs/<int:job_id>/', views.job_status_view, name='job_status'),
 
     # Продукты
     path('add-product/', views.add_product_view, name='add_product'),
@@ -34,8 +35,9 @@ urlpatterns = [
     path('add-to-cart/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/update/<int:item_id>/', views.update_cart, name='update_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('checkout/', views.checkout, name='checkout'),
-    path('order-confirmation/', views.order_confirmation, name='order_confirmation'),
+    path('order-confirmation/<int:order_id>/', views.order_confirmation, name='order_confirmation'),
     path('order-history/', views.order_history, name='order_history'),
 
     # Поиск
@@ -44,9 +46,22 @@ urlpatterns = [
     # path('test-session/', views.test_session, name='test_session'),
     # API маршруты
     path('api/products/', views.product_list_or_create, name='product_list_api'),
+    path('api/products/facets/', views.product_facets_api, name='product_facets_api'),
+    path('api/products/import/', views.product_import, name='product_import_api'),
+    path('api/products/export/', views.product_export, name='product_export_api'),
     path('api/products/<int:id>/', views.product_detail, name='product_detail_api'),  
     path('api/categories/', views.api_categories_list, name='api_categories_list'),
     path('api/products/featured/', views.api_featured_products, name='api_featured_products'),
+    path('api/products/popular/', views.api_popular_products, name='api_popular_products'),
+    path('api/categories/popular/', views.api_popular_categories, name='api_popular_categories'),
+    path('api/metrics/', views.request_metrics, name='request_metrics_api'),
+
+    # Async-варианты представлений чтения (products.async_views) рядом с синхронными
+    path('async/products/<int:id>/', async_views.product_detail_view, name='product_detail_view_async'),
+    path('async/search/', async_views.search_view, name='search_async'),
+    path('async/api/products/', async_views.product_list_api, name='product_list_api_async'),
+    path('async/api/products/featured/', async_views.api_featured_products, name='api_featured_products_async'),
+    path('async/api/categories/', async_views.api_categories_list, name='api_categories_list_async'),
 ]
 
 # Добавляем это условие только если вы уверены, что оно не дублируется в корневом urls.py
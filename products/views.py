@@ -1,12 +1,17 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from products.serializers import ProductSerializer, CategorySerializer
+from products.serializers import (
+    CATEGORY_ROW, FEATURED_PRODUCT_ROW, POPULAR_CATEGORY_ROW, POPULAR_PRODUCT_ROW, PRODUCT_ROW,
+    CategorySerializer, ProductSerializer,
+)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.db.models import Count
 from django.middleware.csrf import get_token
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods, require_POST
 from django.core.exceptions import ValidationError, PermissionDenied
 from .forms import CategoryForm, ProductForm, UserProfileForm
@@ -23,10 +28,12 @@ from django.db.models import Prefetch, Q
 from django.contrib import messages
 from django.contrib.auth.models import User
 import json
-from .cart import Cart
+from .cart import Cart, CartOperationError, validate_operations
 from django.db import transaction
 from django.db.utils import IntegrityError
-from .settings import FEATURED_PRODUCTS_COUNT, POPULAR_CATEGORIES_COUNT
+from .settings import (
+    FEATURED_PRODUCTS_COUNT, POPULAR_CATEGORIES_COUNT, POPULAR_PRODUCTS_COUNT, PROFILE_RECENT_ORDERS,
+)
 from django.http import HttpResponseForbidden
 from PIL import Image
 from io import BytesIO
@@ -40,28 +47,35 @@ import sys
 from PIL import Image
 from io import BytesIO
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.core.serializers.json import DjangoJSONEncoder
 from django.http import JsonResponse
 from .models import Product
-
-def decimal_to_float(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {k: decimal_to_float(v) for k, v in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [decimal_to_float(item) for item in obj]
-    return obj
-
-class DecimalEncoder(DjangoJSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super().default(obj)
-
-# Константы
-FEATURED_PRODUCTS_COUNT = 6
-POPULAR_CATEGORIES_COUNT = 5
+from .pagination import InvalidCursor, KeysetPagination, KeysetPaginator
+from .checkout import CheckoutError, calculate_totals, place_order
+from .search import search_products
+from .sorting import PRODUCT_SORTS, resolve_sort, sort_choices
+from .facets import apply_filters, catalog_facets, parse_filters
+from .cache import catalog_cache
+from .fastjson import FastJSONRenderer, FastJsonResponse
+from .conditional import (
+    cached_product, category_list_validators, category_page_validators, conditional, product_list_validators,
+    product_page_validators, product_validators,
+)
+from .feed import build_home_feed
+from .orders import order_page, order_summary
+from .jobs import enqueue, job_status
+from .tasks import process_avatar
+from .models import Job
+from django.core.files.storage import default_storage
+from django.urls import reverse
+import uuid
+from .export import CONTENT_TYPES, STREAMS, export_rows
+from .metrics import store as metrics_store
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime
+from .importer import ImportFormatError, detect_format, import_products, read_rows
+import io
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +85,10 @@ class ProductListCreateView(generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]  # Разрешаем доступ всем для тестирования
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return ProductSerializer.setup_eager_loading(super().get_queryset())
 
     def create(self, request, *args, **kwargs):
         logger.info(f"Received data: {request.data}")
@@ -96,18 +114,19 @@ def csrf_token(request):
     return Response({'csrfToken': token})
 
 @api_view(['GET', 'POST'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@conditional(product_list_validators)
 def product_list_or_create(request):
     try:
         if request.method == 'GET':
-            # Фильтрация по категории
-            category_id = request.GET.get('category_id')
-            if category_id:
-                products = Product.objects.filter(category_id=category_id)
-            else:
-                products = Product.objects.all()
-    
-            serializer = ProductSerializer(products, many=True)
-            return Response(serializer.data)
+            # Фасетные фильтры: category_id (с подкатегориями), price, in_stock, featured
+            products = apply_filters(Product.objects.all(), parse_filters(request.GET, category_param='category_id'))
+
+            # Курсорная пагинация: ?cursor=...&page_size=...; строки — кортежи values_list,
+            # ответ собирает скомпилированная схема PRODUCT_ROW, а не ProductSerializer
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(PRODUCT_ROW.rows(products), request)
+            return paginator.get_paginated_response(PRODUCT_ROW.render(page, request))
 
         elif request.method == 'POST':
             # Добавление продукта с CSRF защитой
@@ -117,11 +136,101 @@ def product_list_or_create(request):
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    except NotFound as e:
+        return Response({"error": str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+def product_facets_api(request):
+    """
+    Счетчики фасетов для тех же фильтров, что и у api/products/
+    (category_id, price, in_stock, featured) и необязательного ?search=.
+    """
+    filters = parse_filters(request.GET, category_param='category_id')
+    return Response(catalog_facets(filters, request.GET.get('search')))
+
+
+@api_view(['GET'])
+def product_export(request):
+    """
+    Потоковая выгрузка всего каталога для партнеров:
+    - ?type=ndjson (по умолчанию) — одна JSON-строка на товар;
+    - ?type=json — JSON-массив, отдаваемый по частям;
+    - ?updated_since=2024-01-31 или ISO-дата со временем — только измененные товары.
+    Память не зависит от размера каталога, см. products.export.
+    """
+    export_type = request.GET.get('type', 'ndjson')
+    if export_type not in STREAMS:
+        return Response({"error": f"Unknown export type: {export_type}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    updated_since = request.GET.get('updated_since')
+    if updated_since:
+        try:
+            value = parse_datetime(updated_since) or parse_date(updated_since)
+        except ValueError:
+            value = None
+        if value is None:
+            return Response({"error": "updated_since must be an ISO 8601 date or datetime"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(value, datetime):
+            value = datetime.combine(value, datetime.min.time())
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        updated_since = value
+
+    rows = export_rows(updated_since, build_url=request.build_absolute_uri)
+    response = StreamingHttpResponse(STREAMS[export_type](rows), content_type=CONTENT_TYPES[export_type])
+    response['Content-Disposition'] = f'attachment; filename="products.{export_type}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def product_import(request):
+    """
+    Массовый импорт/обновление товаров по sku из загруженного файла:
+    - file — CSV (заголовок: sku,name,description,price,stock,featured,category),
+      JSON-массив или NDJSON;
+    - type — csv/json/ndjson, по умолчанию определяется по расширению файла;
+    - create_categories=1 — создавать недостающие категории.
+    Возвращает отчет: число строк, ошибки по строкам и скорость в строках в секунду.
+    Если файл оказался испорчен посередине, ответ 400 содержит и ошибку, и отчет
+    о строках, записанных до нее (aborted — номер строки и текст ошибки).
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"error": "No file was uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fmt = request.data.get('type') or detect_format(upload.name)
+    except ImportFormatError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    report = import_products(read_rows(stream, fmt),
+                             create_categories=request.data.get('create_categories') in ('1', 'true', True))
+    if report.aborted:
+        return Response({"error": report.aborted[1], **report.as_dict()}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report.as_dict())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_metrics(request):
+    """
+    Статистика products.metrics по имени URL за последние запросы этого процесса:
+    перцентили общего времени, числа и времени SQL-запросов, рендеринга шаблонов
+    и бюджет запросов представления. ?reset=1 очищает статистику после ответа.
+    """
+    summary = metrics_store.summary()
+    if request.GET.get('reset') == '1':
+        metrics_store.clear()
+    return Response(summary)
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@conditional(product_validators)
 def product_detail(request, id):
     """
     API для работы с продуктом:
@@ -129,13 +238,15 @@ def product_detail(request, id):
     - PUT: обновление продукта по ID.
     - DELETE: удаление продукта по ID.
     """
-    product = get_object_or_404(Product, id=id)
-
     if request.method == 'GET':
-        serializer = ProductSerializer(product)
-        return Response(serializer.data)
+        rows = PRODUCT_ROW.render(PRODUCT_ROW.rows(Product.objects.filter(id=id)), request)
+        if not rows:
+            raise Http404("No Product matches the given query.")
+        return Response(rows[0])
+
+    product = get_object_or_404(Product, id=id)
 
-    elif request.method == 'PUT':
+    if request.method == 'PUT':
         # Логика для обновления продукта
         serializer = ProductSerializer(product, data=request.data)
         if serializer.is_valid():
@@ -152,11 +263,13 @@ def product_detail(request, id):
 
 # API для списка категорий
 @api_view(['GET'])
+@conditional(category_list_validators)
 def category_list_api(request):
     """
     API для получения списка категорий с подсчетом количества продуктов в каждой категории.
+    Количество берется из денормализованного поля Category.product_count, без JOIN и GROUP BY.
     """
-    categories = Category.objects.annotate(product_count=Count('products'))  # 'products' — это related_name у ForeignKey в модели Product
+    categories = CategorySerializer.setup_eager_loading(Category.objects.all())
     
     if not categories.exists():
         return Response({"message": "No categories available."}, status=status.HTTP_404_NOT_FOUND)
@@ -204,45 +317,59 @@ def filter_products(category_id=None):
     return Product.objects.all()
 
 def product_list_view(request):
-    products = Product.objects.all()
-    categories = Category.objects.all()
+    # Фасеты: категория (вместе с подкатегориями), цена, наличие, рекомендуемые
+    filters = parse_filters(request.GET)
+    search_query = request.GET.get('search')
+    # Только сортировки из products.sorting: у каждой есть индекс, неизвестный ключ — сортировка по имени
+    sort_by, ordering = resolve_sort(request.GET.get('sort'))
+    cursor = request.GET.get('cursor')
 
-    # Фильтрация по категории
-    category_id = request.GET.get('category')
-    if category_id:
-        products = products.filter(category_id=category_id)
+    def load_page():
+        products = Product.objects.all()
 
-    # Поиск
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(name__icontains=search_query)
+        # Поиск по названию, как и раньше: условие остается в SQL, поэтому фильтры и сортировка
+        # видят все совпадения (ранжированный поиск — search_view)
+        if search_query:
+            products = products.filter(name__icontains=search_query)
+
+        products = apply_filters(products, filters)
 
-    # Сортировка
-    sort_by = request.GET.get('sort', 'name')  # По умолчанию сортируем по имени
-    products = products.order_by(sort_by)
+        # Пагинация по курсору: 9 продуктов на странице, без COUNT(*) и OFFSET
+        paginator = KeysetPaginator(products, 9, ordering=ordering)
+        try:
+            return paginator.get_page(cursor)
+        except InvalidCursor:
+            return paginator.get_page()
 
-    # Пагинация
-    paginator = Paginator(products, 9)  # 9 продуктов на странице
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    params = {**filters, 'search': search_query, 'sort': sort_by, 'cursor': cursor}
+    page_obj = catalog_cache.get_or_set('product_list', load_page, params, dependencies=('product', 'category'))
+    categories = catalog_cache.get_or_set('categories', lambda: list(Category.objects.all()),
+                                          dependencies=('category',))
 
     context = {
         'products': page_obj,
         'categories': categories,
-        'selected_category': category_id,
+        'selected_category': filters['category'],
+        'filters': filters,
+        'facets': catalog_facets(filters, search_query),
         'search_query': search_query,
         'sort_by': sort_by,
+        'sort_choices': sort_choices(),
         'is_paginated': page_obj.has_other_pages(),
         'page_obj': page_obj,
     }
 
     return render(request, 'products/products_list.html', context)
 
+@conditional(product_page_validators)
 def product_detail_view(request, id):
     """
     HTML страница для детального отображения одного продукта.
     """
-    product = get_object_or_404(Product, id=id)
+    # Запись кэша уже прочитана валидаторами (product_page_validators)
+    product = cached_product(id)
+    if product is None:
+        raise Http404("No Product matches the given query.")
     return render(request, 'products/product_page.html', {'product': product})
 
 def category_filter_view(request):
@@ -255,7 +382,7 @@ def category_filter_view(request):
 
     if selected_category_id:
         selected_category = get_object_or_404(Category, id=selected_category_id)
-        products = Product.objects.filter(category=selected_category)
+        products = Product.objects.in_category(selected_category)
     else:
         selected_category = None
         products = Product.objects.all()
@@ -304,14 +431,29 @@ def add_product_view(request):
         form = ProductForm()
     return render(request, 'products/add_product.html', {'form': form})
 
+@conditional(category_page_validators)
 def category_detail_view(request, category_id):
     """
     HTML страница для детального отображения одной категории.
     """
-    category = get_object_or_404(Category, id=category_id)
-    products = Product.objects.filter(category=category)
+    def load():
+        category = Category.objects.filter(id=category_id).first()
+        if category is None:
+            return None
+        # Товары всего поддерева и хлебные крошки — по Category.path, без рекурсии по parent
+        return (category, list(category.get_ancestors()), list(category.children.all()),
+                list(Product.objects.in_category(category)))
+
+    # Зависит и от предков (крошки), и от подкатегорий — поэтому от всех категорий
+    data = catalog_cache.get_or_set('category_detail', load, {'id': category_id},
+                                    dependencies=('category', 'product'))
+    if data is None:
+        raise Http404("No Category matches the given query.")
+    category, ancestors, subcategories, products = data
     return render(request, 'products/category_detail.html', {
         'category': category,
+        'ancestors': ancestors,
+        'subcategories': subcategories,
         'products': products
     })
     
@@ -323,39 +465,59 @@ def delete_product(request, id):
     product.delete()
     return redirect('product_list_view')
 
+@conditional(category_list_validators)
 def api_categories_list(request):
     try:
-        categories = Category.objects.all()
-        data = [{'id': category.id, 'name': category.name} for category in categories]
+        data = catalog_cache.get_or_set(
+            'api_categories',
+            lambda: CATEGORY_ROW.render(CATEGORY_ROW.rows(Category.objects.all())),
+            dependencies=('category',),
+        )
         logger.info(f"Returning {len(data)} categories")
-        return JsonResponse(data, safe=False)
+        return FastJsonResponse(data)
     except Exception as e:
         logger.error(f"Error in api_categories_list: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
 def api_featured_products(request):
+    def load():
+        rows = FEATURED_PRODUCT_ROW.rows(Product.objects.filter(featured=True))[:FEATURED_PRODUCTS_COUNT]
+        return FEATURED_PRODUCT_ROW.render(rows)
+
     try:
-        products = Product.objects.filter(featured=True)[:FEATURED_PRODUCTS_COUNT]
-        data = [{
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': str(product.price),
-            'image': product.image.url if product.image else None
-        } for product in products]
-        return JsonResponse(data, safe=False)
+        data = catalog_cache.get_or_set('api_featured_products', load, dependencies=('product',))
+        return FastJsonResponse(data)
     except Exception as e:
         logger.error(f"Error in api_featured_products: {str(e)}")
         return JsonResponse({'error': 'Internal Server Error'}, status=500)
+
+# Популярное читает готовые счета (products.popularity), а не агрегирует заказы
+@require_http_methods(["GET"])
+def api_popular_products(request):
+    def load():
+        products = Product.objects.filter(popularity__gt=0).order_by(*PRODUCT_SORTS['popularity']['ordering'])
+        return POPULAR_PRODUCT_ROW.render(POPULAR_PRODUCT_ROW.rows(products)[:POPULAR_PRODUCTS_COUNT])
+
+    data = catalog_cache.get_or_set('api_popular_products', load, dependencies=('product',))
+    return FastJsonResponse(data)
+
+@require_http_methods(["GET"])
+def api_popular_categories(request):
+    def load():
+        # Порядок — Category.Meta.ordering (-popularity, name)
+        categories = Category.objects.filter(popularity__gt=0)
+        return POPULAR_CATEGORY_ROW.render(POPULAR_CATEGORY_ROW.rows(categories)[:POPULAR_CATEGORIES_COUNT])
+
+    data = catalog_cache.get_or_set('api_popular_categories', load, dependencies=('category',))
+    return FastJsonResponse(data)
     
 def home(request):
-    categories = Category.objects.all()[:6]  # Получаем первые 6 категорий
-    products = Product.objects.all()  # Получаем все продукты
-    
+    # Ограниченная лента из секций вместо всего каталога; кэшируется целиком
+    feed = catalog_cache.get_or_set('home_feed', build_home_feed, dependencies=('product', 'category'))
     context = {
-        'categories': categories,
-        'products': products,
+        'categories': feed['categories'],
+        'sections': feed['sections'],
     }
     
     return render(request, 'products/home.html', context)
@@ -398,7 +560,7 @@ def add_to_cart(request, product_id):
         cart = Cart(request)
         quantity = json.loads(request.body).get('quantity', 1)
         cart.add(product, quantity)
-        return JsonResponse({'success': True, 'cart_count': len(cart)})
+        return FastJsonResponse({'success': True, **cart.summary().as_json()})
     except Product.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Product not found'}, status=404)
     except Exception as e:
@@ -410,41 +572,41 @@ def remove_from_cart(request, item_id):
     cart = Cart(request)
     product = get_object_or_404(Product, id=item_id)
     cart.remove(product)
-    
-    cart_items = []
-    for item in cart:
-        product_data = item['product']
-        cart_items.append({
-            'id': product_data['id'],
-            'name': product_data['name'],
-            'price': float(product_data['price']),
-            'quantity': item['quantity'],
-            'total_price': item['total_price'],
-            'image_url': product_data.get('image', ''),
-        })
-    
-    subtotal = cart.get_total_price()
-    tax = subtotal * 0.10  # Предполагаем 10% налог
-    total = subtotal + tax
+    return FastJsonResponse({'success': True, **cart.snapshot()})
 
-    return JsonResponse({
-        'success': True,
-        'cart_items': cart_items,
-        'subtotal': float(subtotal),
-        'tax': float(tax),
-        'total': float(total),
-    })
+@require_POST
+def cart_batch(request):
+    """
+    Пакет операций с корзиной одним запросом:
+    {"operations": [{"op": "add"|"set"|"remove", "product_id": 1, "quantity": 2}, ...]}.
+    Товары проверяются одним запросом, пакет применяется целиком или не
+    применяется вовсе; в ответе — итоговое состояние корзины.
+    """
+    try:
+        operations, products = validate_operations(json.loads(request.body))
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except CartOperationError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'errors': e.errors}, status=400)
+
+    cart = Cart(request)
+    try:
+        cart.apply(operations, products)
+    except IntegrityError:
+        # Параллельный запрос добавил тот же товар — пакет откачен целиком
+        return JsonResponse({'success': False, 'error': 'Cart was changed concurrently, retry'}, status=409)
+
+    return FastJsonResponse({'success': True, **cart.snapshot()})
 
 def calculate_cart_totals(cart_items):
-    subtotal = sum(item.total_price() for item in cart_items)
-    tax = subtotal * Decimal('0.1')  # 10% tax
-    total = subtotal + tax
-    return subtotal, tax, total
+    subtotal = sum((item.total_price() for item in cart_items), Decimal('0'))
+    return calculate_totals(subtotal)
 
 def cart_view(request):
     cart = Cart(request)
+    rows = list(cart)
     cart_items = []
-    for item in cart:
+    for item in rows:
         product_data = item['product']  # Это словарь
         cart_item = {
             'id': product_data['id'],
@@ -460,15 +622,13 @@ def cart_view(request):
     if not cart_items:
         return render(request, 'products/cart.html', {'cart_empty': True})
     
-    subtotal = cart.get_total_price()
-    tax = subtotal * 0.10  # Предполагаем 10% налог
-    total = subtotal + tax
-
+    # Итоги по тем же строкам и ценам, что и позиции на странице
+    summary = cart.summary_for(rows)
     context = {
         'cart_items': cart_items,
-        'subtotal': subtotal,
-        'tax': tax,
-        'total': total,
+        'subtotal': summary.subtotal,
+        'tax': summary.tax,
+        'total': summary.total,
     }
     
     logger.info(f"Cart view context: {context}")
@@ -478,27 +638,19 @@ def cart_view(request):
 @login_required
 def checkout(request):
     if request.method == 'POST':
-        cart_items = CartItem.objects.filter(user=request.user)
-        subtotal, tax, total = calculate_cart_totals(cart_items)
-        
         try:
-            with transaction.atomic():
-                order = Order.objects.create(user=request.user, total_price=total)
-                for item in cart_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        quantity=item.quantity,
-                        price=item.product.price
-                    )
-                cart_items.delete()  # Очищаем корзину
+            order = place_order(request.user)
+            # Корзину очистил place_order в обход Cart
+            Cart(request).invalidate_summary()
             return redirect('order_confirmation', order_id=order.id)
+        except CheckoutError as e:
+            messages.error(request, str(e))
         except IntegrityError:
             messages.error(request, "An error occurred while processing your order. Please try again.")
         except Exception as e:
             messages.error(request, f"An unexpected error occurred: {str(e)}")
-    
-    cart_items = CartItem.objects.filter(user=request.user)
+
+    cart_items = CartItem.objects.filter(user=request.user).select_related('product')
     subtotal, tax, total = calculate_cart_totals(cart_items)
     return render(request, 'products/checkout.html', {'cart_items': cart_items, 'total': total})
 
@@ -508,8 +660,13 @@ def order_confirmation(request, order_id):
 
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'products/order_history.html', {'orders': orders})
+    # Курсорная пагинация и сводка из кэша: страница не зависит от числа заказов
+    page_obj = order_page(request.user, request.GET.get('cursor'))
+    return render(request, 'products/order_history.html', {
+        'orders': page_obj,
+        'page_obj': page_obj,
+        'order_summary': order_summary(request.user, page_obj),
+    })
 
 @login_required
 def edit_product_view(request, id):
@@ -539,33 +696,7 @@ def update_cart(request, item_id):
             return JsonResponse({'success': False, 'error': 'Quantity must be at least 1'}, status=400)
         
         cart.update(item_id, quantity)
-        
-        cart_items = []
-        for item in cart:
-            product_data = item['product']
-            print(f"Debug: product_data = {product_data}")  # Добавьте эту строку
-            cart_items.append({
-                'id': product_data['id'],
-                'name': product_data['name'],
-                'price': float(product_data['price']),
-                'quantity': item['quantity'],
-                'total_price': float(item['total_price']),
-            })
-        
-        subtotal = float(cart.get_total_price())
-        tax = float(subtotal * 0.10)
-        total = float(subtotal + tax)
-
-        print(f"Debug: cart_items = {cart_items}")  # Добавьте эту строку
-        print(f"Debug: subtotal = {subtotal}, tax = {tax}, total = {total}")  # Добавьте эту строку
-
-        return JsonResponse({
-            'success': True,
-            'cart_items': cart_items,
-            'subtotal': subtotal,
-            'tax': tax,
-            'total': total,
-        })
+        return FastJsonResponse({'success': True, **cart.snapshot()})
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
     except ValueError as e:
@@ -580,21 +711,20 @@ def products_list(request):
     return render(request, 'products/products_list.html', {'products': products})
 
 def search_view(request):
+       """
+       Поиск товаров через products.search: ранжированный список id из
+       полнотекстового индекса, затем товары текущей страницы одним запросом.
+       """
        query = request.GET.get('q')
-       if query:
-           products = Product.objects.filter(
-               Q(name__icontains=query) | 
-               Q(description__icontains=query) |
-               Q(category__name__icontains=query)
-           ).distinct()
-       else:
-           products = Product.objects.none()
-       
-       paginator = Paginator(products, 12)  # 12 продуктов на страницу
-       page_number = request.GET.get('page')
-       page_obj = paginator.get_page(page_number)
-       
+       product_ids = search_products(query) if query else []
+
+       paginator = Paginator(product_ids, 12)  # 12 продуктов на страницу
+       page_obj = paginator.get_page(request.GET.get('page'))
+       products_by_id = Product.objects.in_bulk(page_obj.object_list)
+       products = [products_by_id[pk] for pk in page_obj.object_list if pk in products_by_id]
+
        context = {
+           'products': products,
            'page_obj': page_obj,
            'query': query
        }
@@ -618,34 +748,18 @@ def profile(request):
         form = UserProfileForm(request.POST, request.FILES, instance=request.user)
         if form.is_valid():
             form.save()
+            job = None
             if 'avatar' in request.FILES:
-                try:
-                    image = Image.open(request.FILES['avatar'])
-                    # Обрезаем изображение до квадрата
-                    size = min(image.size)
-                    crop = ((image.size[0] - size) // 2,
-                            (image.size[1] - size) // 2,
-                            (image.size[0] + size) // 2,
-                            (image.size[1] + size) // 2)
-                    image = image.crop(crop)
-                    # Изменяем размер до 200x200
-                    image = image.resize((200, 200), Image.LANCZOS)
-                    # Сохраняем изображение
-                    output = BytesIO()
-                    image.save(output, format='JPEG', quality=85)
-                    output.seek(0)
-                    profile.avatar = InMemoryUploadedFile(output, 'ImageField', 
-                                                          f"{request.user.username}_avatar.jpg",
-                                                          'image/jpeg', sys.getsizeof(output), None)
-                    profile.save()
-                except Exception as e:
-                    print(f"Error processing avatar: {e}")
-            
+                # Обрезка и уменьшение выполняются воркером (manage.py run_jobs), см. products.tasks
+                upload_name = default_storage.save(f"avatars/uploads/{uuid.uuid4().hex}", request.FILES['avatar'])
+                job = enqueue(process_avatar, user=request.user, profile_id=profile.id, upload_name=upload_name)
+
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
                     'success': True,
                     'avatar_url': profile.avatar.url if profile.avatar else None,
                     'username': request.user.username,
+                    'job_status_url': reverse('job_status', args=[job.id]) if job else None,
                     # Добавьте другие поля, которые вы хотите обновить на странице
                 })
             else:
@@ -657,11 +771,13 @@ def profile(request):
     else:
         form = UserProfileForm(instance=request.user)
     
-    orders = request.user.order_set.all().order_by('-created_at')
-    
+    # Только последние заказы (полный список — order_history) и сводка из кэша
+    orders = order_page(request.user, per_page=PROFILE_RECENT_ORDERS)
+
     context = {
         'form': form,
         'orders': orders,
+        'order_summary': order_summary(request.user, orders),
         'profile': profile,
     }
     return render(request, 'products/profile.html', context)
@@ -670,15 +786,22 @@ def profile(request):
 @require_POST
 def upload_avatar(request):
     if 'avatar' in request.FILES:
-        avatar = request.FILES['avatar']
-        request.user.profile.avatar = avatar
-        request.user.profile.save()
+        profile, created = Profile.objects.get_or_create(user=request.user)
+        upload_name = default_storage.save(f"avatars/uploads/{uuid.uuid4().hex}", request.FILES['avatar'])
+        job = enqueue(process_avatar, user=request.user, profile_id=profile.id, upload_name=upload_name)
         return JsonResponse({
             'success': True,
-            'avatar_url': request.user.profile.avatar.url
+            'avatar_url': profile.avatar.url if profile.avatar else None,
+            'job_status_url': reverse('job_status', args=[job.id]),
         })
     return JsonResponse({'success': False, 'error': 'No file was uploaded.'})
 
+@login_required
+def job_status_view(request, job_id):
+    """Статус фоновой задачи для опроса со страницы. Чужие задачи не видны."""
+    job = get_object_or_404(Job, id=job_id, user=request.user)
+    return JsonResponse(job_status(job))
+
 # def test_session(request):
 #        cart = request.session.get('cart', {})
 #        return HttpResponse(f"Cart contents: {cart}")
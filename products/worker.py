@@ -0,0 +1,23 @@
+"""
+Точки входа для дочерних процессов воркера (manage.py run_jobs).
+
+Модуль не импортирует модели на верхнем уровне: при методе запуска
+spawn/forkserver дочерний процесс импортирует его до django.setup().
+"""
+
+
+def init_process():
+    import django
+    from django.db import connections
+
+    django.setup()
+    # Соединения, унаследованные при fork, принадлежат родителю: не закрываем
+    # их (это закрыло бы общий сокет), а просто забываем
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+
+
+def execute(job_id):
+    from .jobs import run_job
+
+    return job_id, run_job(job_id)